@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+import io
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+from parser import read_graph
+from cnf_generator import CNFGenerator
+from dimacs_io import write_dimacs_store, read_dimacs, open_compressed, available_codecs
+
+
+# ---------------------------------------------------------
+# Misura scrittura / lettura per ogni codec
+# ---------------------------------------------------------
+def bench_codec(gen, codec, out_dir):
+    path = os.path.join(out_dir, "bench.cnf" + ("" if codec == "none" else f".{codec}"))
+
+    stats = write_dimacs_store(path, gen.num_vars, gen.clauses, codec=codec)
+
+    # lettura grezza (solo decompressione) e parsing completo con pysat
+    t0 = time.time()
+    raw = 0
+    with open_compressed(path, "rb") as f:
+        while True:
+            buf = f.read(1 << 20)
+            if not buf:
+                break
+            raw += len(buf)
+    t_read = time.time() - t0
+
+    t0 = time.time()
+    cnf = read_dimacs(path)
+    t_parse = time.time() - t0
+    assert len(cnf.clauses) == len(gen.clauses)
+
+    os.remove(path)
+    mb = stats["bytes"] / 1e6
+    return {
+        "codec": codec,
+        "size_mb": stats["bytes_on_disk"] / 1e6,
+        "ratio": stats["bytes"] / max(stats["bytes_on_disk"], 1),
+        "write_mb_s": mb / stats["seconds"],
+        "read_mb_s": mb / t_read if t_read > 0 else float("inf"),
+        "parse_s": t_parse,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput scrittura/lettura CNF per codec di compressione.")
+    parser.add_argument("logical_graph", help="grafo logico (.txt)")
+    parser.add_argument("physical_graph", help="grafo fisico (.txt)")
+    parser.add_argument("--encoding", default="pairwise", choices=["pairwise", "support"])
+    args = parser.parse_args()
+
+    G_log = read_graph(args.logical_graph)
+    G_phys = read_graph(args.physical_graph)
+    with redirect_stdout(io.StringIO()):
+        gen = CNFGenerator(G_log=G_log, G_phys=G_phys, skip_reduction=True, encoding=args.encoding)
+        gen.generate()
+    print(f"CNF: {gen.num_vars} variabili, {len(gen.clauses)} clausole")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'codec':6} {'MB disco':>9} {'ratio':>7} {'write MB/s':>11} {'read MB/s':>10} {'parse s':>8}")
+        for codec in ["none"] + available_codecs():
+            r = bench_codec(gen, codec, tmp)
+            print(f"{r['codec']:6} {r['size_mb']:9.1f} {r['ratio']:7.1f} {r['write_mb_s']:11.1f} "
+                  f"{r['read_mb_s']:10.1f} {r['parse_s']:8.2f}")
@@ -1,10 +1,34 @@
 #!/bin/bash
+# Uso: ./proofgen.sh [codec]   codec: none | gz | xz | zst (default none)
+# Il CNF può essere compresso (exp_27_reduced.cnf.<codec>), la proof viene scritta
+# direttamente compressa passando da una named pipe.
+
+CODEC=${1:-none}
+OUT_DIR=~/Documents/SAT-Embedding-Tesi/outputs/27/reduced
+CNF=$OUT_DIR/exp_27_reduced.cnf
+
+case "$CODEC" in
+  none) COMPRESS="cat";        DECOMPRESS="cat";        EXT="" ;;
+  gz)   COMPRESS="gzip -c";    DECOMPRESS="gzip -dc";   EXT=".gz" ;;
+  xz)   COMPRESS="xz -1 -c";   DECOMPRESS="xz -dc";     EXT=".xz" ;;
+  zst)  COMPRESS="zstd -q -c"; DECOMPRESS="zstd -q -dc"; EXT=".zst" ;;
+  *) echo "Codec non supportato: $CODEC"; exit 1 ;;
+esac
+
+[ -f "$CNF$EXT" ] && CNF=$CNF$EXT
 
 cd ~/Documents/glucose/simp || exit
 
-./glucose_static -certified -certified-output=proof.txt \
-  ~/Documents/SAT-Embedding-Tesi/outputs/27/reduced/exp_27_reduced.cnf \
+PIPE=$(mktemp -u proof.XXXXXX)
+mkfifo "$PIPE"
+$COMPRESS < "$PIPE" > "$OUT_DIR/proof_27_reduced.txt$EXT" &
+COMPRESS_PID=$!
+
+./glucose_static -certified -certified-output="$PIPE" \
+  <($DECOMPRESS "$CNF") \
   result.txt
 
-mv proof.txt  ~/Documents/SAT-Embedding-Tesi/outputs/27/reduced/proof_27_reduced.txt
-mv result.txt ~/Documents/SAT-Embedding-Tesi/outputs/27/reduced/result_27_reduced.txt
\ No newline at end of file
+wait $COMPRESS_PID
+rm -f "$PIPE"
+
+mv result.txt $OUT_DIR/result_27_reduced.txt
@@ -9,6 +9,7 @@ from contextlib import redirect_stdout
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 from parser import read_graph, read_graph_json
 from cnf_generator import CNFGenerator
+from dimacs_io import open_compressed, CODEC_EXTENSIONS
 
 
 # ------------------------------------------------------------
@@ -21,10 +22,12 @@ def get_proof_path(exp_dir, exp_id, mode):
     proof_name = f"proof_{exp_id}_{mode}.txt"
     proof_path = os.path.join(exp_dir, str(exp_id), mode, proof_name)
 
-    if not os.path.exists(proof_path):
-        raise FileNotFoundError(f"Proof non trovata: {proof_path}")
+    # La proof può essere salvata compressa (proof_<id>_<mode>.txt.gz / .xz / .zst)
+    for candidate in [proof_path] + [proof_path + ext for ext in CODEC_EXTENSIONS]:
+        if os.path.exists(candidate):
+            return candidate
 
-    return proof_path
+    raise FileNotFoundError(f"Proof non trovata: {proof_path}")
 
 
 # ------------------------------------------------------------
@@ -33,7 +36,7 @@ def get_proof_path(exp_dir, exp_id, mode):
 def extract_unit_literals(proof_path):
     unit_literals = []
 
-    with open(proof_path, "r") as f:
+    with open_compressed(proof_path, "rt") as f:
         for line in f:
             line = line.strip()
             if not line or line.startswith("d"):
@@ -72,10 +75,11 @@ def decode_unit_literals(unit_literals, inv_var_map):
 # ------------------------------------------------------------
 # 3. Stato di embedding per nodo logico
 # ------------------------------------------------------------
-def build_logical_state(decoded, logical_nodes, physical_nodes):
+def build_logical_state(decoded, logical_nodes, domains):
+    # domains: {nodo logico: nodi fisici ammissibili} (mappa sparsa del CNFGenerator)
     logical_state = {
         i: {
-            "allowed": set(physical_nodes),
+            "allowed": set(domains[i]),
             "forbidden": set(),
             "forced": set()
         }
@@ -190,7 +194,12 @@ if __name__ == "__main__":
             cnf_gen = CNFGenerator(
                 G_log=G_log,
                 G_phys=G_phys,
-                skip_reduction=True
+                skip_reduction=True,
+                encoding=cfg.get("encoding", "pairwise"),
+                card_encoding=cfg.get("card_encoding"),
+                domain_filter=cfg.get("domain_filter", True),
+                ac_propagation=cfg.get("ac_propagation", True),
+                ring_restriction=cfg.get("ring_restriction", True)
             )
         else:
             reduced_phys_path = cfg.get("reduce_physical_graph")
@@ -213,7 +222,12 @@ if __name__ == "__main__":
                 G_log=G_log,
                 G_phys=G_phys,
                 skip_reduction=False,
-                physical_center=physical_center
+                physical_center=physical_center,
+                encoding=cfg.get("encoding", "pairwise"),
+                card_encoding=cfg.get("card_encoding"),
+                domain_filter=cfg.get("domain_filter", True),
+                ac_propagation=cfg.get("ac_propagation", True),
+                ring_restriction=cfg.get("ring_restriction", True)
             )
 
         proof_path = get_proof_path(exp_dir, exp_id, mode)
@@ -230,7 +244,7 @@ if __name__ == "__main__":
         logical_state = build_logical_state(
             decoded,
             cnf_gen.logical_nodes,
-            cnf_gen.physical_nodes
+            cnf_gen.domains
         )
 
         print("\n=== Stato logico per nodo ===")
@@ -0,0 +1,159 @@
+from itertools import combinations
+import math
+
+import numpy as np
+from pysat.card import CardEnc, EncType
+
+# Codifiche at-most-one disponibili per famiglia di vincoli
+# (exactly_one per nodo logico, mutual_exclusion per nodo fisico)
+PYSAT_AMO = {
+    "seqcounter": EncType.seqcounter,
+    "ladder": EncType.ladder,
+    "bitwise": EncType.bitwise,
+    "totalizer": EncType.totalizer,
+    "sortnetwrk": EncType.sortnetwrk,
+    "cardnetwrk": EncType.cardnetwrk,
+}
+NATIVE_AMO = ("pairwise", "commander", "product", "bimander")
+CARD_ENCODINGS = NATIVE_AMO + tuple(PYSAT_AMO)
+
+CARD_FAMILIES = ("exactly_one", "mutual_exclusion")
+
+# Sotto questa soglia le codifiche ricorsive ripiegano sul pairwise
+_SMALL = 4
+
+
+def resolve_card_encoding(card_encoding):
+    """
+    Normalizza la scelta per famiglia: accetta None, una stringa (stessa codifica per
+    tutte le famiglie) o un dizionario {famiglia: codifica}. Default: pairwise.
+    """
+    if card_encoding is None:
+        card_encoding = {}
+    elif isinstance(card_encoding, str):
+        card_encoding = {fam: card_encoding for fam in CARD_FAMILIES}
+
+    resolved = {}
+    for fam in CARD_FAMILIES:
+        enc = card_encoding.get(fam, "pairwise")
+        if enc not in CARD_ENCODINGS:
+            raise ValueError(f"Codifica cardinalità non supportata per {fam}: {enc} "
+                             f"(ammesse: {', '.join(CARD_ENCODINGS)})")
+        resolved[fam] = enc
+    unknown = set(card_encoding) - set(CARD_FAMILIES)
+    if unknown:
+        raise ValueError(f"Famiglie di vincoli sconosciute: {sorted(unknown)}")
+    return resolved
+
+
+# -------------------------
+# At-most-one
+# -------------------------
+def at_most_one(lits, encoding, top_id):
+    """
+    Clausole che impongono al più un letterale vero in lits.
+    Le variabili ausiliarie sono allocate sopra top_id.
+    Ritorna (clausole, nuovo top_id).
+    """
+    lits = list(lits)
+    if len(lits) <= 1:
+        return [], top_id
+
+    if encoding in PYSAT_AMO:
+        enc = CardEnc.atmost(lits=lits, bound=1, top_id=top_id, encoding=PYSAT_AMO[encoding])
+        return enc.clauses, max(top_id, enc.nv)
+
+    state = {"top": top_id}
+
+    def new_var():
+        state["top"] += 1
+        return state["top"]
+
+    clauses = []
+    if encoding == "pairwise":
+        _pairwise(lits, clauses)
+    elif encoding == "commander":
+        _commander(lits, clauses, new_var)
+    elif encoding == "product":
+        _product(lits, clauses, new_var)
+    elif encoding == "bimander":
+        _bimander(lits, clauses, new_var)
+    else:
+        raise ValueError(f"Codifica cardinalità non supportata: {encoding}")
+    return clauses, state["top"]
+
+
+def iter_pairwise_blocks(lits, chunk=1 << 16):
+    """
+    AMO pairwise come blocchi int32 (k x 2) di clausole [-a, -b], nello stesso ordine di
+    combinations(lits, 2); le righe sono raggruppate fino a circa chunk clausole per blocco.
+    """
+    neg = -np.asarray(lits, dtype=np.int32)
+    n = len(neg)
+    k = 0
+    while k < n - 1:
+        rows, size = [], 0
+        while k < n - 1 and (not rows or size + n - 1 - k <= chunk):
+            block = np.empty((n - 1 - k, 2), dtype=np.int32)
+            block[:, 0] = neg[k]
+            block[:, 1] = neg[k + 1:]
+            rows.append(block)
+            size += len(block)
+            k += 1
+        yield np.concatenate(rows) if len(rows) > 1 else rows[0]
+
+
+def _pairwise(lits, clauses):
+    for a, b in combinations(lits, 2):
+        clauses.append([-a, -b])
+
+
+def _commander(lits, clauses, new_var, group_size=3):
+    # Klieber & Kwon: gruppi da 3, un commander per gruppo, ricorsione sui commander
+    if len(lits) <= _SMALL:
+        _pairwise(lits, clauses)
+        return
+    commanders = []
+    for k in range(0, len(lits), group_size):
+        group = lits[k:k + group_size]
+        c = new_var()
+        _pairwise(group, clauses)
+        for x in group:
+            clauses.append([-x, c])          # x -> c
+        clauses.append([-c] + group)        # c -> OR(group)
+        commanders.append(c)
+    _commander(commanders, clauses, new_var, group_size)
+
+
+def _product(lits, clauses, new_var):
+    # Chen: griglia p x q, ogni letterale implica la sua riga e la sua colonna
+    if len(lits) <= _SMALL:
+        _pairwise(lits, clauses)
+        return
+    p = math.ceil(math.sqrt(len(lits)))
+    q = math.ceil(len(lits) / p)
+    rows = [new_var() for _ in range(p)]
+    cols = [new_var() for _ in range(q)]
+    for k, x in enumerate(lits):
+        r, c = divmod(k, q)
+        clauses.append([-x, rows[r]])
+        clauses.append([-x, cols[c]])
+    _product(rows, clauses, new_var)
+    _product(cols, clauses, new_var)
+
+
+def _bimander(lits, clauses, new_var):
+    # Nguyen & Mai: ~sqrt(n) gruppi con AMO pairwise interno, indice del gruppo in binario
+    if len(lits) <= _SMALL:
+        _pairwise(lits, clauses)
+        return
+    n_groups = math.ceil(math.sqrt(len(lits)))
+    size = math.ceil(len(lits) / n_groups)
+    groups = [lits[k:k + size] for k in range(0, len(lits), size)]
+    n_bits = max(1, math.ceil(math.log2(len(groups))))
+    bits = [new_var() for _ in range(n_bits)]
+    for h, group in enumerate(groups):
+        _pairwise(group, clauses)
+        for x in group:
+            for j, b in enumerate(bits):
+                clauses.append([-x, b if (h >> j) & 1 else -b])
@@ -0,0 +1,525 @@
+import os
+import threading
+import time
+
+from cnf_generator import CNFGenerator
+from core_groups import resolve_core_grouping
+from dimacs_io import with_codec
+from solver_interface import (job_payload as pysat_payload, pysat_job, resolve_portfolio,
+                              load_solver, solver_result, interrupter)
+from solver_interface_cripto import job_payload as external_payload, external_job
+from solver_pool import get_pool
+
+
+def resolve_parallel(parallel, num_centers, max_workers):
+    """parallel_centers di config.yaml: N oppure "auto" (tanti centri quanti worker)."""
+    if parallel in (None, 1, False):
+        return 1
+    if parallel == "auto":
+        return max(min(num_centers, max_workers), 1)
+    if not isinstance(parallel, int) or parallel < 1:
+        raise ValueError(f"parallel_centers non valido: {parallel} (intero >= 1 oppure auto)")
+    return min(parallel, num_centers, max_workers)
+
+
+def _solution(var_map, model):
+    rev = {vid: (i, a) for (i, a), vid in var_map.items()}
+    return {
+        i: a for lit in model if lit > 0
+        for entry in [rev.get(lit)] if entry
+        for i, a in [entry]
+    }
+
+
+def _center_job(payload, ctl):
+    """
+    Eseguito nel worker del pool: genera e risolve l'istanza ridotta di un centro.
+    Il solver gira nello stesso worker (pysat) o come processo figlio supervisionato
+    (esterno), con la stessa cancellazione del job.
+    """
+    dimacs_path = with_codec(os.path.join(payload["exp_dir"], f"exp_{payload['exp_id']}_reduced.cnf"),
+                             payload["options"]["cnf_compression"])
+
+    # timeout_seconds resta il limite del singolo centro, dentro il budget globale della gara
+    timer = None
+    if payload["timeout"]:
+        timer = threading.Timer(payload["timeout"], ctl.cancel)
+        timer.daemon = True
+        timer.start()
+    try:
+        return _generate_and_solve(payload, ctl, dimacs_path)
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+def _generate(center, gen_kwargs, opts, exp_dir, exp_id, dimacs_path, workers=1):
+    """Genera l'istanza ridotta del centro; ritorna (generatore, risultato parziale)."""
+    t0 = time.time()
+    gen = CNFGenerator(
+        **gen_kwargs,
+        stream_path=dimacs_path if opts["stream_cnf"] else None,
+        exp_dir=exp_dir,
+        exp_id=exp_id,
+        skip_reduction=False,
+        physical_center=center
+    )
+    out = {
+        "center": center,
+        "status": "REJECTED",
+        "reduced_file": os.path.join(exp_dir, f"reduced_physical_{exp_id}.json"),
+        "reject_reasons": list(gen.reject_reasons),
+        "num_vars": 0,
+        "num_clauses": 0,
+        "encoding_stats": None,
+    }
+    if not gen.embeddable:
+        return gen, out
+
+    out["num_vars"], out["num_clauses"] = gen.generate()
+    out["status"] = "UNKNOWN"   # generato, non ancora risolto
+    out["encoding_stats"] = {"domain_stats": gen.domain_stats}
+    if opts["write_cnf"] or opts["stream_cnf"]:
+        out["encoding_stats"]["dimacs_write"] = gen.write_dimacs(dimacs_path, workers=workers)
+    out["time_cnf"] = time.time() - t0
+    return gen, out
+
+
+def _generate_and_solve(payload, ctl, dimacs_path):
+    opts = payload["options"]
+    # Un worker del pool non può avviare altri processi: DIMACS formattato da un solo processo
+    gen, out = _generate(payload["center"], payload["gen_kwargs"], opts, payload["exp_dir"],
+                         payload["exp_id"], dimacs_path)
+    if not gen.embeddable:
+        return out
+    written = opts["write_cnf"] or opts["stream_cnf"]
+    if ctl.cancelled:
+        return {"status": None}
+
+    t_sat = time.time()
+    in_memory = opts["solve_in_memory"] and gen.clauses is not None
+    if in_memory:
+        member = opts["members"][0] if opts["members"] else None
+        res = pysat_job(pysat_payload(None, gen, opts["core_grouping"], member), ctl)
+        out["solver"] = member["solver"] if member else None
+    else:
+        proof_path = dimacs_path + ".drat" if opts["solver_proof"] else None
+        res = external_job(external_payload(dimacs_path if written else None, gen, opts["solver_spec"],
+                                            opts["num_threads"], opts["solver_limits"], proof_path), ctl)
+        out["resources"] = res.get("resources")
+    out["time_sat"] = time.time() - t_sat
+
+    if res.get("status") is None:
+        out["status"] = "ERROR"
+        out["error"] = "Timeout expired" if ctl.cancelled else res.get("error")
+    elif res["status"]:
+        out["status"] = "SAT"
+        out["solution"] = _solution(gen.var_map, res["model"])
+    else:
+        out["status"] = "UNSAT"
+        out["unsat_core"] = res.get("core")
+    return out
+
+
+def solve_centers(centers, gen_kwargs, exp_dir, exp_id, options, parallel, timeout=None, budget=None):
+    """
+    Prova i centri fisici in parallelo sul pool dei solver: ogni centro è generato e
+    risolto in un worker con una sottocartella propria (center_<c>), al più parallel
+    centri alla volta. Al primo SAT gli altri vengono cancellati. timeout limita il
+    singolo centro, budget il tempo wall complessivo dell'intera gara.
+
+    Il solver esterno riceve cpu // parallel thread, così i centri in gara non si
+    contendono la CPU. options: opzioni dell'esperimento (vedi experiment_runner).
+
+    Ritorna (vincitore o None, risultati di tutti i centri conclusi, secondi).
+    """
+    pool = get_pool()
+    options = dict(options)
+    options["core_grouping"] = resolve_core_grouping(options.get("unsat_core"))
+    options["members"] = resolve_portfolio(options.get("portfolio"))
+    options["num_threads"] = max((os.cpu_count() or 1) // parallel, 1)
+
+    payloads = []
+    for center in centers:
+        center_dir = os.path.join(exp_dir, f"center_{center}")
+        os.makedirs(center_dir, exist_ok=True)
+        payloads.append({"center": center, "gen_kwargs": gen_kwargs, "exp_dir": center_dir,
+                         "exp_id": exp_id, "options": options, "timeout": timeout})
+
+    results = []
+
+    def collect(k, out):
+        result = out["result"] or {}
+        if result.get("status") is None:
+            print(f"[WARN] Centro {centers[k]}: {out['error'] or 'nessun risultato'}")
+            return
+        result["wall_time"] = out["time"]
+        results.append(result)
+        print(f"[INFO] Centro {centers[k]}: {result['status']} in {out['time']:.2f}s")
+
+    print(f"[INFO] Gara tra {len(centers)} centri, {parallel} in parallelo, "
+          f"{options['num_threads']} thread per solver esterno")
+    out = pool.race(_center_job, payloads, timeout=budget, parallel=parallel, on_result=collect,
+                    accept=lambda o: o["status"] == "ok" and (o["result"] or {}).get("status") == "SAT")
+    if out["index"] is None and out["status"] == "timeout":
+        print(f"[WARN] Budget dell'esperimento esaurito ({budget}s)")
+    winner = out["result"] if out["index"] is not None else None
+    return winner, results, out["time"]
+
+
+# -------------------------
+# Round robin a budget crescente
+# -------------------------
+ROUND_ROBIN_SCHEDULES = ("luby", "geometric")
+ROUND_ROBIN_BUDGETS = ("conflicts", "propagations")
+ROUND_ROBIN_DEFAULTS = {"schedule": "luby", "unit": 1000, "factor": 2.0, "budget": "conflicts"}
+
+
+def resolve_round_robin(options):
+    """
+    round_robin_centers di config.yaml: false / true (valori di default) oppure
+    {schedule: luby | geometric, unit: N, factor: F, budget: conflicts | propagations}.
+    """
+    if not options:
+        return None
+    rr = dict(ROUND_ROBIN_DEFAULTS)
+    if isinstance(options, dict):
+        unknown = set(options) - set(ROUND_ROBIN_DEFAULTS)
+        if unknown:
+            raise ValueError(f"round_robin_centers: chiavi sconosciute {sorted(unknown)} "
+                             f"(ammesse: {', '.join(ROUND_ROBIN_DEFAULTS)})")
+        rr.update(options)
+    if rr["schedule"] not in ROUND_ROBIN_SCHEDULES:
+        raise ValueError(f"Schedule non supportata: {rr['schedule']} (ammesse: {', '.join(ROUND_ROBIN_SCHEDULES)})")
+    if rr["budget"] not in ROUND_ROBIN_BUDGETS:
+        raise ValueError(f"Budget non supportato: {rr['budget']} (ammessi: {', '.join(ROUND_ROBIN_BUDGETS)})")
+    return rr
+
+
+def luby(i):
+    """i-esimo termine (da 1) della sequenza di Luby: 1 1 2 1 1 2 4 1 1 2 ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+def slice_budget(rr, round_no):
+    """Budget (conflitti o propagazioni) di ogni centro al giro round_no (da 1)."""
+    if rr["schedule"] == "luby":
+        return rr["unit"] * luby(round_no)
+    return int(rr["unit"] * rr["factor"] ** (round_no - 1))
+
+
+def _effort(entry):
+    stats = entry["solver"].accum_stats() or {}
+    entry["effort"].update(
+        conflicts=stats.get("conflicts", 0),
+        propagations=stats.get("propagations", 0),
+        decisions=stats.get("decisions", 0),
+        time=entry["solver"].time_accum(),
+    )
+    return entry["effort"]
+
+
+def _round_robin_job(payload, ctl):
+    """
+    Eseguito in un worker del pool: un solver pysat incrementale per centro, tutti vivi
+    insieme; a ogni giro ciascun centro ancora aperto avanza con solve_limited sotto il
+    budget del giro (clausole apprese e stato restano tra un giro e l'altro).
+    """
+    rr = payload["round_robin"]
+    entries = []
+    cores = []
+
+    def partial(status):
+        return {"status": status, "effort": [_effort(e) for e in entries], "cores": cores}
+
+    try:
+        for center, job in zip(payload["centers"], payload["jobs"]):
+            loaded = load_solver(job, ctl)
+            if loaded is None:
+                return partial(None)
+            solver, groups, assumptions = loaded
+            entries.append({"solver": solver, "groups": groups, "assumptions": assumptions,
+                            "num_vars": job["num_vars"],
+                            "effort": {"center": center, "status": "UNKNOWN", "slices": 0}})
+
+        active = list(range(len(entries)))
+        round_no = 0
+        while active:
+            round_no += 1
+            budget = slice_budget(rr, round_no)
+            for k in list(active):
+                if ctl.cancelled:
+                    return partial(None)
+                entry = entries[k]
+                solver = entry["solver"]
+                if rr["budget"] == "conflicts":
+                    solver.conf_budget(budget)
+                else:
+                    solver.prop_budget(budget)
+                ctl.on_cancel(interrupter(solver))
+                try:
+                    sat = solver.solve_limited(assumptions=entry["assumptions"], expect_interrupt=True)
+                finally:
+                    ctl.on_cancel(None)
+                entry["effort"]["slices"] += 1
+                if sat is None:
+                    continue    # budget esaurito (o interruzione): il centro resta in gara
+
+                active.remove(k)
+                res = solver_result(solver, sat, entry["groups"], entry["num_vars"])
+                entry["effort"]["status"] = "SAT" if sat else "UNSAT"
+                if sat:
+                    print(f"[INFO] Round robin: SAT al giro {round_no} (centro {entry['effort']['center']})")
+                    out = partial(True)
+                    out.update(index=k, model=res["model"])
+                    return out
+                if res["core"]:
+                    cores.append((k, res["core"]))
+        return partial(False)
+    finally:
+        for entry in entries:
+            entry["solver"].delete()
+
+
+def solve_centers_round_robin(centers, gen_kwargs, exp_dir, exp_id, options, round_robin, budget=None):
+    """
+    Alternativa a solve_centers per macchine con pochi core: i centri sono generati in
+    sequenza (sottocartelle center_<c>), poi risolti tutti nello stesso worker a
+    interleaving, con budget crescente per giro (Luby o geometrico, in conflitti o
+    propagazioni). Un centro facile risponde presto anche se è l'ultimo in ordine;
+    budget è il tempo wall complessivo, non per centro. Solo solver pysat.
+
+    Ritorna (vincitore o None, risultati dei centri, secondi) come solve_centers;
+    ogni risultato generato ha "effort": giri, conflitti, propagazioni e tempo spesi.
+    """
+    core_grouping = resolve_core_grouping(options.get("unsat_core"))
+    members = resolve_portfolio(options.get("portfolio"))
+    member = members[0] if members else None
+    if member is not None and member["solver"] == "lingeling":
+        raise ValueError("round_robin_centers richiede un solver pysat con budget (Lingeling non li supporta)")
+
+    results, gens, jobs = [], [], []
+    for center in centers:
+        center_dir = os.path.join(exp_dir, f"center_{center}")
+        os.makedirs(center_dir, exist_ok=True)
+        dimacs_path = with_codec(os.path.join(center_dir, f"exp_{exp_id}_reduced.cnf"), options["cnf_compression"])
+        gen, out = _generate(center, gen_kwargs, options, center_dir, exp_id, dimacs_path,
+                             workers=options.get("dimacs_workers", 1))
+        results.append(out)
+        if not gen.embeddable:
+            continue
+        written = options["write_cnf"] or options["stream_cnf"]
+        jobs.append(pysat_payload(dimacs_path if written else None, gen, core_grouping, member))
+        gens.append((gen.var_map, out))
+
+    if not jobs:
+        return None, results, 0.0
+
+    print(f"[INFO] Round robin tra {len(jobs)} centri ({round_robin['schedule']}, "
+          f"unità {round_robin['unit']} {round_robin['budget']})")
+    payload = {"round_robin": round_robin, "centers": [out["center"] for _, out in gens], "jobs": jobs}
+    res = get_pool().run(_round_robin_job, payload, timeout=budget)
+    result = res["result"] or {}
+    if res["status"] == "timeout":
+        print(f"[WARN] Budget dell'esperimento esaurito ({budget}s)")
+    elif res["status"] != "ok":
+        print(f"[WARN] Round robin: {res['error']}")
+
+    for effort, (_, out) in zip(result.get("effort") or [], gens):
+        out["effort"] = effort
+        out["status"] = effort["status"]
+        out["time_sat"] = effort["time"]
+    for k, core in result.get("cores") or []:
+        gens[k][1]["unsat_core"] = core
+
+    winner = None
+    if result.get("status") and res["model"] is not None:
+        var_map, winner = gens[result["index"]]
+        winner["solution"] = _solution(var_map, res["model"].tolist())
+    return winner, results, res["time"]
+
+
+# -------------------------
+# Formula unica sull'unione delle palle
+# -------------------------
+SHARED_MODES = ("sequential", "disjunction")
+
+
+def resolve_shared(option):
+    """shared_centers di config.yaml: false / true (sequential) / sequential / disjunction."""
+    if not option:
+        return None
+    if option is True:
+        return "sequential"
+    if option not in SHARED_MODES:
+        raise ValueError(f"shared_centers non valido: {option} (ammessi: false, true, {', '.join(SHARED_MODES)})")
+    return option
+
+
+def _shared_job(payload, ctl):
+    """
+    Eseguito nel worker del pool: un solo solver incrementale per tutti i centri.
+    sequential:  un centro alla volta con assumption s_c; se UNSAT si aggiunge ¬s_c e le
+                 clausole apprese restano per i centri successivi.
+    disjunction: una sola chiamata, il solver sceglie il centro (clausola s_c1 ∨ ... ∨ s_ck).
+    """
+    job = payload["job"]
+    loaded = load_solver(job, ctl)
+    if loaded is None:
+        return {"status": None}
+    solver, groups, assumptions = loaded
+    selectors = payload["selectors"]
+    effort, cores = [], []
+
+    def solve(extra):
+        ctl.on_cancel(interrupter(solver))
+        try:
+            try:
+                return solver.solve_limited(assumptions=assumptions + extra, expect_interrupt=True)
+            except NotImplementedError:
+                # Solver senza interrupt (es. Lingeling): alla cancellazione il pool uccide il worker
+                return solver.solve(assumptions=assumptions + extra)
+        finally:
+            ctl.on_cancel(None)
+
+    def partial(status):
+        return {"status": status, "effort": effort, "cores": cores}
+
+    try:
+        if payload["mode"] == "disjunction":
+            sat = solve([])
+            if sat is None:
+                return partial(None)
+            res = solver_result(solver, sat, groups, job["num_vars"])
+            out = partial(sat)
+            if sat:
+                positive = set(l for l in res["model"] if l > 0)
+                out.update(index=next(k for k, s in enumerate(selectors) if s in positive), model=res["model"])
+            return out
+
+        for k, s in enumerate(selectors):
+            before = {"stats": solver.accum_stats() or {}, "time": solver.time_accum()}
+            sat = solve([s])
+            stats = solver.accum_stats() or {}
+            effort.append({
+                "center": payload["centers"][k],
+                "status": {True: "SAT", False: "UNSAT", None: "UNKNOWN"}[sat],
+                "conflicts": stats.get("conflicts", 0) - before["stats"].get("conflicts", 0),
+                "propagations": stats.get("propagations", 0) - before["stats"].get("propagations", 0),
+                "decisions": stats.get("decisions", 0) - before["stats"].get("decisions", 0),
+                "time": solver.time_accum() - before["time"],
+            })
+            if sat is None:
+                return partial(None)
+            res = solver_result(solver, sat, groups, job["num_vars"])
+            if sat:
+                out = partial(True)
+                out.update(index=k, model=res["model"])
+                return out
+            if res["core"]:
+                cores.append((k, res["core"]))
+            # Il centro è escluso per sempre: anche la disgiunzione finale ne beneficia
+            solver.add_clause([-s])
+        return partial(False)
+    finally:
+        solver.delete()
+
+
+def solve_centers_shared(centers, gen_kwargs, exp_dir, exp_id, options, mode, budget=None):
+    """
+    Alternativa a solve_centers: un solo CNFGenerator sull'unione delle palle dei centri
+    (physical_centers), con un selettore per centro, e un solo solver pysat incrementale
+    che prova i centri via assumption (sequential) o li lascia scegliere al solver
+    (disjunction). Le parti comuni delle codifiche sono generate una volta sola e le
+    clausole apprese valgono per tutti i centri; UNSAT su tutti i selettori dimostra
+    la non embeddabilità. budget è il tempo wall complessivo.
+
+    Ritorna (vincitore o None, risultati dei centri, secondi) come solve_centers;
+    in modalità sequential ogni centro provato ha "effort" (conflitti, propagazioni, tempo).
+    """
+    core_grouping = resolve_core_grouping(options.get("unsat_core"))
+    if core_grouping is not None and mode == "disjunction":
+        print("[WARN] shared_centers disjunction: UNSAT core per centro non disponibile, ignorato")
+        core_grouping = None
+    members = resolve_portfolio(options.get("portfolio"))
+    member = members[0] if members else None
+    if member is not None and member["solver"].startswith("kissat") and mode == "sequential":
+        raise ValueError("Kissat (pysat) ignora le assumption: incompatibile con shared_centers sequential")
+
+    t0 = time.time()
+    dimacs_path = with_codec(os.path.join(exp_dir, f"exp_{exp_id}_reduced.cnf"), options["cnf_compression"])
+    gen = CNFGenerator(
+        **gen_kwargs,
+        stream_path=dimacs_path if options["stream_cnf"] else None,
+        exp_dir=exp_dir,
+        exp_id=exp_id,
+        skip_reduction=False,
+        physical_centers=centers
+    )
+    shared = {
+        "reduced_file": os.path.join(exp_dir, f"reduced_physical_{exp_id}.json"),
+        "num_vars": 0,
+        "num_clauses": 0,
+        "encoding_stats": None,
+    }
+    if gen.embeddable:
+        shared["num_vars"], shared["num_clauses"] = gen.generate()
+        shared["encoding_stats"] = {"domain_stats": gen.domain_stats}
+        if options["write_cnf"] or options["stream_cnf"]:
+            shared["encoding_stats"]["dimacs_write"] = gen.write_dimacs(dimacs_path,
+                                                                        workers=options.get("dimacs_workers", 1))
+    time_cnf = time.time() - t0
+
+    results = []
+    for center in centers:
+        out = dict(shared, center=center, time_cnf=time_cnf)
+        if center in gen.center_selectors:
+            out.update(status="UNKNOWN", reject_reasons=[])
+        else:
+            reason = gen.center_reject_reasons.get(center)
+            out.update(status="REJECTED", reject_reasons=[reason] if reason else list(gen.reject_reasons))
+        results.append(out)
+    active = [out for out in results if out["status"] == "UNKNOWN"]
+    if not active:
+        return None, results, 0.0
+
+    print(f"[INFO] Formula condivisa tra {len(active)} centri ({mode}): "
+          f"{shared['num_vars']} vars, {shared['num_clauses']} clauses")
+    written = options["write_cnf"] or options["stream_cnf"]
+    payload = {
+        "mode": mode,
+        "centers": [out["center"] for out in active],
+        "selectors": [gen.center_selectors[out["center"]] for out in active],
+        "job": pysat_payload(dimacs_path if written else None, gen, core_grouping, member),
+    }
+    res = get_pool().run(_shared_job, payload, timeout=budget)
+    result = res["result"] or {}
+    if res["status"] == "timeout":
+        print(f"[WARN] Budget dell'esperimento esaurito ({budget}s)")
+    elif res["status"] != "ok":
+        print(f"[WARN] Formula condivisa: {res['error']}")
+
+    for effort, out in zip(result.get("effort") or [], active):
+        out["effort"] = effort
+        out["status"] = effort["status"]
+        out["time_sat"] = effort["time"]
+    for k, core in result.get("cores") or []:
+        active[k]["unsat_core"] = core
+    if result.get("status") is False and mode == "disjunction":
+        for out in active:
+            out["status"] = "UNSAT"
+
+    winner = None
+    if result.get("status") and res["model"] is not None:
+        winner = active[result["index"]]
+        winner["status"] = "SAT"
+        winner["solution"] = _solution(gen.var_map, res["model"].tolist())
+    return winner, results, res["time"]
@@ -0,0 +1,88 @@
+import numpy as np
+import networkx as nx
+
+# Codifiche disponibili per la edge consistency
+EDGE_ENCODINGS = ("pairwise", "support")
+
+
+# -------------------------
+# Matrici di supporto
+# -------------------------
+def build_var_matrix(logical_nodes, physical_nodes, var_map):
+    """
+    Matrice (n x m) int32 con l'id della variabile x(i,a), 0 se la coppia non ha variabile.
+    """
+    log_idx = {i: k for k, i in enumerate(logical_nodes)}
+    phys_idx = {a: k for k, a in enumerate(physical_nodes)}
+    M = np.zeros((len(logical_nodes), len(physical_nodes)), dtype=np.int32)
+    for (i, a), vid in var_map.items():
+        M[log_idx[i], phys_idx[a]] = vid
+    return M
+
+
+def physical_non_adjacency(G_phys, physical_nodes):
+    """
+    Matrice booleana (m x m): True se (a,b) NON è un arco fisico oppure a == b.
+    """
+    if not physical_nodes:
+        return np.zeros((0, 0), dtype=bool)
+    adj = nx.to_numpy_array(G_phys, nodelist=physical_nodes, dtype=bool, weight=None)
+    non_adj = ~adj
+    np.fill_diagonal(non_adj, True)
+    return non_adj
+
+
+# -------------------------
+# Edge consistency vettorizzata
+# -------------------------
+def iter_edge_consistency_blocks(G_log, G_phys, logical_nodes, physical_nodes,
+                                 var_matrix, skip_diagonal=False):
+    """
+    Per ogni arco logico (i,j) restituisce un blocco int32 (k x 2) con le clausole
+    [-x(i,a), -x(j,b)] per ogni coppia fisica (a,b) non adiacente, nello stesso
+    ordine del triplo ciclo originale (a esterno, b interno).
+
+    skip_diagonal: omette le coppie a == b (già coperte da mutual_exclusion).
+    Le coppie senza variabile (escluse dal filtro di dominio) sono già soddisfatte e
+    vengono scartate.
+    """
+    non_adj = physical_non_adjacency(G_phys, physical_nodes)
+    if skip_diagonal:
+        np.fill_diagonal(non_adj, False)
+    A, B = np.nonzero(non_adj)
+
+    log_idx = {i: k for k, i in enumerate(logical_nodes)}
+    for i, j in G_log.edges():
+        vi = var_matrix[log_idx[i]]
+        vj = var_matrix[log_idx[j]]
+        block = np.empty((len(A), 2), dtype=np.int32)
+        np.negative(vi[A], out=block[:, 0])
+        np.negative(vj[B], out=block[:, 1])
+        yield block[(block != 0).all(axis=1)]
+
+
+# -------------------------
+# Edge consistency compatta (support encoding)
+# -------------------------
+def iter_edge_support_clauses(G_log, G_phys, logical_nodes, physical_nodes, var_matrix):
+    """
+    Per ogni arco logico (i,j), in entrambe le direzioni, e per ogni nodo fisico a
+    restituisce la clausola  -x(i,a) v OR_{b in N(a)} x(j,b).
+    Insieme all'at-most-one su j equivale al divieto di tutte le coppie non adiacenti,
+    ma con O(|E_log|·m) clausole di lunghezza deg(a)+1.
+    """
+    phys_idx = {a: k for k, a in enumerate(physical_nodes)}
+    neigh_idx = [
+        np.fromiter((phys_idx[b] for b in G_phys.neighbors(a) if b != a), dtype=np.intp)
+        for a in physical_nodes
+    ]
+    log_idx = {i: k for k, i in enumerate(logical_nodes)}
+    for u, v in G_log.edges():
+        for i, j in ((u, v), (v, u)):
+            vi = var_matrix[log_idx[i]]
+            vj = var_matrix[log_idx[j]]
+            for ka in range(len(physical_nodes)):
+                if not vi[ka]:
+                    continue
+                support = vj[neigh_idx[ka]]
+                yield [-int(vi[ka])] + support[support != 0].tolist()
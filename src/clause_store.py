@@ -0,0 +1,134 @@
+from array import array
+
+import numpy as np
+
+
+class ClauseTypes:
+    """Vista in sola lettura dei tipi di clausola (stringhe) di uno ClauseStore."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store.type_ids)
+
+    def __getitem__(self, idx):
+        names = self._store.type_names
+        if isinstance(idx, slice):
+            return [names[t] for t in self._store.type_ids[idx]]
+        return names[self._store.type_ids[idx]]
+
+    def __iter__(self):
+        names = self._store.type_names
+        return (names[t] for t in self._store.type_ids)
+
+
+class ClauseStore:
+    """
+    Clausole memorizzate in forma piatta:
+      lits     array('i')  letterali di tutte le clausole concatenati
+      offsets  array('q')  inizio della clausola k in offsets[k], fine in offsets[k+1]
+      type_ids array('B')  id del tipo di clausola (nome in type_names)
+    Si comporta come una lista di clausole (len, iterazione, indicizzazione).
+    """
+
+    def __init__(self):
+        self.lits = array('i')
+        self.offsets = array('q', [0])
+        self.type_ids = array('B')
+        self.type_names = []
+        self._type_index = {}
+        self.types = ClauseTypes(self)
+
+    # -------------------------
+    def _type_id(self, ctype):
+        tid = self._type_index.get(ctype)
+        if tid is None:
+            if len(self.type_names) >= 256:
+                raise ValueError("Troppi tipi di clausola (max 256)")
+            tid = len(self.type_names)
+            self.type_names.append(ctype)
+            self._type_index[ctype] = tid
+        return tid
+
+    def add(self, lits, ctype="generic"):
+        self.lits.extend(lits)
+        self.offsets.append(len(self.lits))
+        self.type_ids.append(self._type_id(ctype))
+
+    def add_block(self, block, ctype="generic"):
+        """Aggiunge un blocco numpy (k x L) di clausole della stessa lunghezza."""
+        block = np.ascontiguousarray(block, dtype=np.int32)
+        k, width = block.shape
+        if not k:
+            return
+        start = len(self.lits)
+        self.lits.frombytes(block.tobytes())
+        ends = start + width * np.arange(1, k + 1, dtype=np.int64)
+        self.offsets.frombytes(ends.tobytes())
+        self.type_ids.frombytes(bytes([self._type_id(ctype)]) * k)
+
+    # -------------------------
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        return self.lits[self.offsets[idx]:self.offsets[idx + 1]].tolist()
+
+    def __iter__(self):
+        return self.iter_clauses()
+
+    def iter_clauses(self, chunk=65536):
+        """Clausole come liste, convertite a blocchi di chunk clausole (per pysat / scrittura)."""
+        lits, offsets = self.lits, self.offsets
+        n = len(offsets) - 1
+        for k0 in range(0, n, chunk):
+            k1 = min(k0 + chunk, n)
+            lo = offsets[k0]
+            flat = lits[lo:offsets[k1]].tolist()
+            for k in range(k0, k1):
+                yield flat[offsets[k] - lo:offsets[k + 1] - lo]
+
+    def type_of(self, idx):
+        return self.type_names[self.type_ids[idx]]
+
+    @property
+    def num_literals(self):
+        return len(self.lits)
+
+    # -------------------------
+    def views(self):
+        """
+        Viste numpy senza copia (lits int32, offsets int64, type_ids uint8).
+        Finché le viste sono vive lo store non può crescere (buffer esportato).
+        """
+        return (np.frombuffer(self.lits, dtype=np.int32),
+                np.frombuffer(self.offsets, dtype=np.int64),
+                np.frombuffer(self.type_ids, dtype=np.uint8))
+
+    def deduplicate(self):
+        """
+        Passata opzionale di dedup basata su hash delle clausole ordinate
+        (le collisioni vengono verificate confrontando i letterali).
+        Mantiene la prima occorrenza e ritorna il numero di clausole rimosse.
+        """
+        seen = {}
+        keep = ClauseStore()
+        keep.type_names = list(self.type_names)
+        keep._type_index = dict(self._type_index)
+        removed = 0
+        for k, clause in enumerate(self):
+            key = sorted(clause)
+            h = hash(tuple(key))
+            bucket = seen.setdefault(h, [])
+            if any(key == sorted(keep[j]) for j in bucket):
+                removed += 1
+                continue
+            bucket.append(len(keep))
+            keep.lits.extend(clause)
+            keep.offsets.append(len(keep.lits))
+            keep.type_ids.append(self.type_ids[k])
+        self.lits, self.offsets, self.type_ids = keep.lits, keep.offsets, keep.type_ids
+        return removed
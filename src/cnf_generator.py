@@ -1,19 +1,40 @@
-from itertools import combinations
-import networkx as nx
 import json
 import os
+import time
+
+from clause_blocks import (EDGE_ENCODINGS, build_var_matrix, iter_edge_consistency_blocks,
+                           iter_edge_support_clauses)
+from clause_store import ClauseStore
+from graph_cache import invariants
+from dimacs_io import write_dimacs_store, write_clause_types, clause_types_path, DimacsStreamWriter
+from card_encodings import at_most_one, iter_pairwise_blocks, resolve_card_encoding
+from domain_filter import (compute_domains, build_sparse_var_map, physical_domains, propagate_domains,
+                           restrict_to_rings, count_domain_vars)
 
 
 class CNFGenerator:
 
     def __init__(self, G_log, G_phys, G_log_json=None, G_phys_json=None,
                  exp_dir=None, exp_id=0, skip_reduction=False,
-                 physical_center=None, stream_path=None):
+                 physical_center=None, stream_path=None, physical_centers=None,
+                 encoding="pairwise", card_encoding=None, domain_filter=True,
+                 ac_propagation=True, ring_restriction=True):
         """
         G_log: grafo logico (NetworkX)
         G_phys: grafo fisico (NetworkX)
         physical_center: nodo centrale fisico da usare per riduzione
-        stream_path: se fornito, scrive clausole DIMACS direttamente su file
+        physical_centers: in alternativa, lista di centri fisici in un'unica formula sull'unione
+                          delle palle: un selettore s_c per centro attiva il suo centro e i suoi
+                          domini (anelli, AC-3), più la clausola (s_c1 ∨ ... ∨ s_ck)
+        stream_path: se fornito, scrive le clausole DIMACS direttamente su file man mano che
+                     vengono generate (.gz/.xz/.zst compresso), senza tenerle in memoria
+        encoding: codifica della edge consistency, "pairwise" (divieto coppie non adiacenti)
+                  oppure "support" (x(i,a) -> OR dei vicini fisici di a)
+        card_encoding: codifica at-most-one, stringa o dizionario per famiglia
+                       {"exactly_one": ..., "mutual_exclusion": ...} (default pairwise)
+        domain_filter: se True alloca solo le coppie (i,a) compatibili per grado e vicinato
+        ac_propagation: se True propaga i domini (AC-3) e scarta l'istanza se uno si svuota
+        ring_restriction: (solo ridotta) x(i,a) solo se dist_phys(centro,a) <= dist_log(centro_log,i)
         """
         self.G_log = G_log
         self.G_phys_original = G_phys
@@ -23,20 +44,39 @@ class CNFGenerator:
         self.exp_id = exp_id
         self.skip_reduction = skip_reduction
         self.forced_physical_center = physical_center
+        self.physical_centers = list(physical_centers) if physical_centers is not None else None
         self.stream_path = stream_path
+        if encoding not in EDGE_ENCODINGS:
+            raise ValueError(f"Encoding non supportato: {encoding} (ammessi: {', '.join(EDGE_ENCODINGS)})")
+        self.encoding = encoding
+        self.card_encoding = resolve_card_encoding(card_encoding)
+        self.domain_filter = domain_filter
+        self.ac_propagation = ac_propagation
+        self.ring_restriction = ring_restriction
 
         self.embeddable = True
         self.reject_reasons = []
+        self.write_stats = None
 
         # -------------------------
         # Riduzione o full graph
         # -------------------------
+        self.dist_phys_center = None
+        self.dist_log_center = None
+        self.center_balls = None
+        self.center_domains = {}
+        self.center_reject_reasons = {}
         if self.skip_reduction:
             print("[INFO] Variante FULL: nessuna riduzione del grafo fisico.")
             self.G_phys = self.G_phys_original.copy()
             self.center_node = None
             self.logical_center = None
             self.phys_radius = None
+        elif self.physical_centers is not None:
+            print("[INFO] Variante REDUCED condivisa: unione delle palle dei centri fisici.")
+            self.G_phys, self.logical_center, self.phys_radius = \
+                self._extract_union_subgraph(self.G_phys_original, self.G_log, self.physical_centers)
+            self.center_node = None
         else:
             if self.forced_physical_center is None:
                 raise RuntimeError("Per la variante ridotta serve un centro fisico specificato")
@@ -70,28 +110,86 @@ class CNFGenerator:
         self.physical_nodes = list(sorted(self.G_phys.nodes()))
         self.n = len(self.logical_nodes)
         self.m = len(self.physical_nodes)
-        self.var_map = {}
-        vid = 1
-        for i in self.logical_nodes:
-            for a in self.physical_nodes:
-                self.var_map[(i, a)] = vid
-                vid += 1
-        self.num_vars = vid - 1
+        if self.center_balls is not None:
+            self.domain_stats = {"dense_vars": self.n * self.m}
+            self._shared_domains()
+        else:
+            self.domains = compute_domains(self.G_log, self.G_phys, self.logical_nodes,
+                                           self.physical_nodes, use_filter=self.domain_filter)
+            self.domain_stats = {
+                "dense_vars": self.n * self.m,
+                "after_degree_filter": count_domain_vars(self.domains),
+            }
+            if self.ring_restriction and self.dist_phys_center is not None:
+                self.domains = restrict_to_rings(self.domains, self.dist_log_center, self.dist_phys_center)
+                self.domain_stats["after_ring_restriction"] = count_domain_vars(self.domains)
+            if self.embeddable and self.ac_propagation:
+                self._propagate_domains()
+                self.domain_stats["after_ac_propagation"] = count_domain_vars(self.domains)
+        self.var_map, self.inv_var_map, self.num_vars = build_sparse_var_map(self.logical_nodes, self.domains)
+        self.phys_domains = physical_domains(self.logical_nodes, self.physical_nodes, self.var_map)
+        self.var_matrix = build_var_matrix(self.logical_nodes, self.physical_nodes, self.var_map)
+        self.mutual_exclusion_encoded = False
+        self.domain_stats["mapping_vars"] = self.num_vars
+        self.domain_stats["pruned_vars"] = self.n * self.m - self.num_vars
+        self._check_domains()
+
+        # Selettori dei centri subito sopra le variabili di mappatura (ausiliarie AMO dopo)
+        self.center_selectors = {}
+        for c in self.center_domains:
+            self.num_vars += 1
+            self.center_selectors[c] = self.num_vars
 
         # -------------------------
-        # Apertura file streaming
+        # Destinazione clausole: file in streaming oppure ClauseStore in memoria
         # -------------------------
-        if self.stream_path:
-            os.makedirs(os.path.dirname(self.stream_path), exist_ok=True)
-            self.f_stream = open(self.stream_path, "w")
-            self.num_clauses_written = 0
-            # placeholder p cnf, sarà aggiornato a fine scrittura
-            self.f_stream.write(f"p cnf {self.num_vars} 0\n")
-        else:
-            self.f_stream = None
-            self.clause_set = set()    # solo se non in streaming
-            self.clauses = []
-            self.clause_type = []
+        # Dedup per costruzione: gli encoder non generano clausole ripetute,
+        # solo le unitarie (centro, forzate, unsat_analysis) possono coincidere
+        self.unit_lits = set()
+        self.stream = None
+        self.clauses = None
+        self.clause_type = None
+        if self.stream_path and self.embeddable:
+            self.stream = DimacsStreamWriter(self.stream_path)
+        elif not self.stream_path:
+            self.clauses = ClauseStore()
+            self.clause_type = self.clauses.types
+
+    # -------------------------
+    def _reject(self, reason):
+        self.embeddable = False
+        self.reject_reasons.append(reason)
+        print(f"[PRUNE] {reason}")
+
+    def _check_domains(self):
+        dense = self.n * self.m
+        print(f"[INFO] Filtro domini: {self.num_vars}/{dense} variabili ammissibili "
+              f"({dense - self.num_vars} eliminate)")
+        if not self.embeddable:
+            return
+        empty = [i for i in self.logical_nodes if not self.domains[i]]
+        if empty:
+            self._reject(f"Dominio vuoto per i nodi logici {empty[:10]}")
+            return
+        if self.logical_center is not None and self.center_node is not None \
+                and (self.logical_center, self.center_node) not in self.var_map:
+            self._reject(f"Centro fisico {self.center_node} non ammissibile per il centro logico {self.logical_center}")
+            return
+
+    def _propagate_domains(self):
+        # Centro (ed eventuali assegnamenti forzati) fissano il dominio prima della propagazione
+        pins = {}
+        if self.logical_center is not None and self.center_node is not None:
+            pins[self.logical_center] = self.center_node
+        for i, a in pins.items():
+            self.domains[i] = [a] if a in self.domains[i] else []
+
+        t0 = time.time()
+        self.domains, reason = propagate_domains(self.G_log, self.G_phys, self.logical_nodes,
+                                                 self.physical_nodes, self.domains)
+        print(f"[INFO] Propagazione AC-3 completata in {time.time() - t0:.3f}s")
+        if reason:
+            self._reject(reason)
 
     # -------------------------
     def _precheck_embedding(self, G_log, G_phys):
@@ -103,16 +201,17 @@ class CNFGenerator:
             print(f"[PRUNE] {self.reject_reasons[-1]}")
             return
 
-        max_log_deg = max(dict(G_log.degree()).values(), default=0)
-        max_phys_deg = max(dict(G_phys.degree()).values(), default=0)
+        log_inv, phys_inv = invariants(G_log), invariants(G_phys)
+        max_log_deg = max(log_inv.degrees.values(), default=0)
+        max_phys_deg = max(phys_inv.degrees.values(), default=0)
         if max_log_deg > max_phys_deg:
             self.embeddable = False
             self.reject_reasons.append(f"Δ(G_log)={max_log_deg} > Δ(G_phys)={max_phys_deg}")
             print(f"[PRUNE] {self.reject_reasons[-1]}")
             return
 
-        if nx.is_connected(G_log):
-            comp_sizes = [len(c) for c in nx.connected_components(G_phys)]
+        if log_inv.is_connected:
+            comp_sizes = [len(c) for c in phys_inv.components]
             max_comp = max(comp_sizes) if comp_sizes else 0
             if max_comp < n_log:
                 self.embeddable = False
@@ -124,28 +223,108 @@ class CNFGenerator:
 
     # -------------------------
     def _extract_physical_subgraph(self, G_phys, G_log, forced_center):
-        components = list(nx.connected_components(G_phys))
-        comp = max(components, key=len)
-        G_comp = G_phys.subgraph(comp).copy()
+        phys_inv = invariants(G_phys)
+        comp = phys_inv.largest_component
 
-        logical_center = nx.center(G_log)[0]
+        log_inv = invariants(G_log)
+        logical_center = log_inv.center[0]
         min_degree_required = G_log.degree(logical_center)
         print(f"[INFO] Centro logico: {logical_center} (grado {min_degree_required})")
 
-        if G_comp.degree(forced_center) < min_degree_required:
+        if forced_center not in comp:
+            raise RuntimeError(f"Centro fisico {forced_center} fuori dalla componente connessa principale")
+        if G_phys.degree(forced_center) < min_degree_required:
             raise RuntimeError(f"Centro fisico {forced_center} non soddisfa grado minimo richiesto {min_degree_required}")
 
         physical_center = forced_center
-        distances_phys = nx.single_source_shortest_path_length(G_comp, physical_center)
-        distances_log = nx.single_source_shortest_path_length(G_log, logical_center)
+        distances_log = log_inv.distances_from(logical_center)
         max_dist_log = max(distances_log.values())
+        # Palla come maschera sulla riga della matrice delle distanze (dentro la componente del centro)
+        distances_phys = phys_inv.distances_from(physical_center, cutoff=max_dist_log)
+        self.dist_phys_center = distances_phys
+        self.dist_log_center = distances_log
 
-        chosen_nodes = [n for n, d in distances_phys.items() if d <= max_dist_log]
-        G_sub = G_comp.subgraph(chosen_nodes).copy()
+        G_sub = G_phys.subgraph(distances_phys).copy()
         print(f"[INFO] Sottografo ridotto: {len(G_sub)} nodi selezionati intorno al centro fisico {physical_center}")
 
         return G_sub, physical_center, logical_center, max_dist_log
 
+    def _extract_union_subgraph(self, G_phys, G_log, centers):
+        """
+        Palla di raggio ecc(centro logico) intorno a ogni centro, come in
+        _extract_physical_subgraph; il grafo fisico è il sottografo indotto dall'unione.
+        Dentro la palla di un centro gli archi indotti dall'unione sono quelli della palla.
+        """
+        phys_inv = invariants(G_phys)
+        comp = phys_inv.largest_component
+
+        log_inv = invariants(G_log)
+        logical_center = log_inv.center[0]
+        min_degree_required = G_log.degree(logical_center)
+        self.dist_log_center = log_inv.distances_from(logical_center)
+        max_dist_log = max(self.dist_log_center.values())
+        print(f"[INFO] Centro logico: {logical_center} (grado {min_degree_required})")
+
+        self.center_balls = {}
+        union = set()
+        for c in centers:
+            if c not in comp:
+                self.center_reject_reasons[c] = f"Centro fisico {c} fuori dalla componente connessa principale"
+            elif G_phys.degree(c) < min_degree_required:
+                self.center_reject_reasons[c] = \
+                    f"Centro fisico {c} non soddisfa grado minimo richiesto {min_degree_required}"
+            else:
+                dist = phys_inv.distances_from(c, cutoff=max_dist_log)
+                self.center_balls[c] = dist
+                union.update(dist)
+        G_sub = G_phys.subgraph(union).copy()
+        print(f"[INFO] Sottografo ridotto: {len(G_sub)} nodi nell'unione delle palle di "
+              f"{len(self.center_balls)} centri fisici")
+        return G_sub, logical_center, max_dist_log
+
+    def _center_domain(self, center, dist_phys):
+        """
+        Domini del solo centro, identici a quelli della variante ridotta classica:
+        filtro dei gradi sulla palla, anelli, AC-3 con il centro logico fissato.
+        Ritorna (domini, motivo del rigetto oppure None).
+        """
+        ball = sorted(dist_phys)
+        G_ball = self.G_phys.subgraph(ball)
+        if len(ball) < self.n:
+            return None, f"|V_palla|={len(ball)} < |V_log|={self.n}"
+        domains = compute_domains(self.G_log, G_ball, self.logical_nodes, ball, use_filter=self.domain_filter)
+        if self.ring_restriction:
+            domains = restrict_to_rings(domains, self.dist_log_center, dist_phys)
+        lc = self.logical_center
+        domains[lc] = [center] if center in domains[lc] else []
+        if not self.ac_propagation:
+            empty = [i for i in self.logical_nodes if not domains[i]]
+            return domains, f"Dominio vuoto per i nodi logici {empty[:10]}" if empty else None
+        return propagate_domains(self.G_log, G_ball, self.logical_nodes, ball, domains)
+
+    def _shared_domains(self):
+        """Domini per centro (center_domains) e loro unione come domini della formula."""
+        t0 = time.time()
+        for c, dist_phys in self.center_balls.items() if self.embeddable else []:
+            domains, reason = self._center_domain(c, dist_phys)
+            if reason:
+                self.center_reject_reasons[c] = reason
+                print(f"[PRUNE] Centro {c}: {reason}")
+            else:
+                self.center_domains[c] = domains
+        print(f"[INFO] Domini di {len(self.center_balls)} centri in {time.time() - t0:.3f}s "
+              f"({len(self.center_domains)} ammissibili)")
+
+        union = {i: set() for i in self.logical_nodes}
+        for domains in self.center_domains.values():
+            for i in self.logical_nodes:
+                union[i].update(domains[i])
+        self.domains = {i: [a for a in self.physical_nodes if a in union[i]] for i in self.logical_nodes}
+        self.domain_stats["center_vars"] = {c: count_domain_vars(d) for c, d in self.center_domains.items()}
+        self.domain_stats["after_center_union"] = count_domain_vars(self.domains)
+        if self.embeddable and not self.center_domains:
+            self._reject("Nessun centro fisico ammissibile")
+
     # -------------------------
     def _save_reduced_phys_json(self):
         metadata = {}
@@ -153,6 +332,7 @@ class CNFGenerator:
             metadata = self.G_phys_json.get("metadata", {})
         metadata.update({
             "physical_center": self.center_node,
+            "physical_centers": self.physical_centers,
             "physical_center_degree": self.G_phys.degree(self.center_node) if self.center_node else None,
             "logical_center": self.logical_center,
             "logical_center_degree": self.G_log.degree(self.logical_center) if self.logical_center else None,
@@ -175,39 +355,81 @@ class CNFGenerator:
         return self.var_map[(i, a)]
 
     def add_clause(self, lits, ctype="generic"):
-        if self.f_stream:
-            self.f_stream.write(f"c type {ctype}\n")
-            self.f_stream.write(' '.join(str(l) for l in lits) + " 0\n")
-            self.num_clauses_written += 1
-        else:
-            key = tuple(sorted(lits))
-            if key in self.clause_set:
+        if len(lits) == 1:
+            if lits[0] in self.unit_lits:
                 return
-            self.clause_set.add(key)
-            self.clauses.append(list(lits))
-            self.clause_type.append(ctype)
+            self.unit_lits.add(lits[0])
+        if self.stream:
+            self.stream.add(lits, ctype)
+        else:
+            self.clauses.add(lits, ctype)
+
+    def add_clause_block(self, block, ctype="generic"):
+        """
+        Aggiunge un blocco int32 (k x L) di clausole già prive di duplicati.
+        """
+        if not len(block):
+            return
+        if self.stream:
+            self.stream.add_block(block, ctype)
+        else:
+            self.clauses.add_block(block, ctype)
 
     # -------------------------
+    def add_at_most_one(self, lits, encoding, ctype):
+        # Le variabili ausiliarie sono allocate sopra num_vars; le clausole ausiliarie
+        # ereditano il tipo della famiglia così la mappa clause_type resta valida.
+        if encoding == "pairwise":
+            # O(k^2) clausole binarie: a blocchi numpy, senza liste Python intermedie
+            for block in iter_pairwise_blocks(lits):
+                self.add_clause_block(block, ctype)
+            return
+        clauses, self.num_vars = at_most_one(lits, encoding, self.num_vars)
+        for c in clauses:
+            self.add_clause(c, ctype)
+
     def encode_exactly_one_per_logical(self):
         for i in self.logical_nodes:
-            lits = [self.x(i, a) for a in self.physical_nodes]
+            lits = [self.x(i, a) for a in self.domains[i]]
             if lits:
                 self.add_clause(lits, "at_least_one")
-            for a, b in combinations(self.physical_nodes, 2):
-                self.add_clause([-self.x(i, a), -self.x(i, b)], "at_most_one")
+            self.add_at_most_one(lits, self.card_encoding["exactly_one"], "at_most_one")
 
     def encode_mutual_exclusion_on_physical(self):
+        enc = self.card_encoding["mutual_exclusion"]
         for a in self.physical_nodes:
-            for i, j in combinations(self.logical_nodes, 2):
-                self.add_clause([-self.x(i, a), -self.x(j, a)], "mutual_exclusion")
+            lits = [self.x(i, a) for i in self.phys_domains[a]]
+            self.add_at_most_one(lits, enc, "mutual_exclusion")
+        # Solo il pairwise contiene letteralmente le clausole [-x(i,a), -x(j,a)]
+        self.mutual_exclusion_encoded = enc == "pairwise"
 
     def encode_edge_consistency(self):
-        phys_edges = set(tuple(sorted(e)) for e in self.G_phys.edges())
-        for i, j in self.G_log.edges():
-            for a in self.physical_nodes:
-                for b in self.physical_nodes:
-                    if a == b or (min(a, b), max(a, b)) not in phys_edges:
-                        self.add_clause([-self.x(i, a), -self.x(j, b)], "edge_consistency")
+        if self.encoding == "support":
+            self.encode_edge_support()
+            return
+        # Le coppie a == b coincidono con clausole di mutual_exclusion: non le generiamo proprio.
+        skip_diagonal = self.mutual_exclusion_encoded
+        for block in iter_edge_consistency_blocks(self.G_log, self.G_phys,
+                                                  self.logical_nodes, self.physical_nodes,
+                                                  self.var_matrix, skip_diagonal=skip_diagonal):
+            self.add_clause_block(block, "edge_consistency")
+
+    def encode_center_selectors(self):
+        # s_c -> x(i,·) nel dominio del centro c: con l'exactly-one sull'unione basta una
+        # clausola (¬s_c ∨ OR D_c(i)) per nodo logico, solo dove D_c(i) è più stretto
+        for c, s in self.center_selectors.items():
+            domains = self.center_domains[c]
+            for i in self.logical_nodes:
+                if len(domains[i]) < len(self.domains[i]):
+                    self.add_clause([-s] + [self.x(i, a) for a in domains[i]], "center_domain")
+        if self.center_selectors:
+            self.add_clause(list(self.center_selectors.values()), "center_choice")
+
+    def encode_edge_support(self):
+        for lits in iter_edge_support_clauses(self.G_log, self.G_phys,
+                                              self.logical_nodes, self.physical_nodes,
+                                              self.var_matrix):
+            self.add_clause(lits, "edge_support")
 
     # -------------------------
     def generate(self):
@@ -218,6 +440,7 @@ class CNFGenerator:
         self.encode_exactly_one_per_logical()
         self.encode_mutual_exclusion_on_physical()
         self.encode_edge_consistency()
+        self.encode_center_selectors()
 
         if self.logical_center is not None and self.center_node is not None:
             self.add_clause([self.x(self.logical_center, self.center_node)], "center_mapping")
@@ -232,33 +455,32 @@ class CNFGenerator:
                             tokens = line.split()
                             try:
                                 var_id = int(tokens[0])
-                                self.add_clause([var_id], "forced_unsat")
+                                if var_id in self.inv_var_map:
+                                    self.add_clause([var_id], "forced_unsat")
                             except Exception:
                                 pass
 
-        if self.f_stream:
-            # Aggiorna header p cnf
-            self.f_stream.seek(0)
-            self.f_stream.write(f"p cnf {self.num_vars} {self.num_clauses_written}\n")
-            self.f_stream.close()
-            return self.num_vars, self.num_clauses_written
-        else:
-            return self.num_vars, len(self.clauses)
+        if self.stream:
+            self.write_stats = self.stream.close(self.num_vars)
+            print(f"[INFO] DIMACS scritto in streaming: {self.num_vars} vars e "
+                  f"{self.stream.num_clauses} clauses in {self.stream_path}")
+            return self.num_vars, self.stream.num_clauses
+        return self.num_vars, len(self.clauses)
 
     # -------------------------
-    def write_dimacs(self, path):
+    def write_dimacs(self, path, workers=1, codec=None):
         if not self.embeddable:
             print("[INFO] Skip writing DIMACS: problem not embeddable")
-            return
-
-        if self.f_stream:
-            print(f"[INFO] DIMACS già scritto in streaming: {self.stream_path}")
-            return
-
-        with open(path, 'w') as f:
-            # Header CNF standard
-            f.write(f"p cnf {self.num_vars} {len(self.clauses)}\n")
-            # Scrivi solo clausole, senza commenti
-            for c in self.clauses:
-                f.write(' '.join(str(l) for l in c) + ' 0\n')
-        print(f"[INFO] Wrote clean DIMACS CNF with {self.num_vars} vars e {len(self.clauses)} clauses to {path}")
+            return None
+
+        if self.stream:
+            if os.path.abspath(path) != os.path.abspath(self.stream_path):
+                raise ValueError(f"DIMACS già scritto in streaming su {self.stream_path}, non su {path}")
+            return self.write_stats
+
+        # Scrivi solo clausole, senza commenti: i tipi vanno nel sidecar .types.npz
+        self.write_stats = write_dimacs_store(path, self.num_vars, self.clauses, workers=workers, codec=codec)
+        write_clause_types(clause_types_path(path), self.clauses)
+        print(f"[INFO] Wrote clean DIMACS CNF with {self.num_vars} vars e {len(self.clauses)} clauses to {path} "
+              f"({self.write_stats['mb_per_s'] or 0:.1f} MB/s)")
+        return self.write_stats
@@ -1,13 +1,28 @@
-from itertools import combinations
-import networkx as nx
 import json
 import os
+import time
+
+from clause_blocks import (EDGE_ENCODINGS, build_var_matrix, iter_edge_consistency_blocks,
+                           iter_edge_support_clauses)
+from clause_store import ClauseStore
+from graph_cache import invariants
+from dimacs_io import write_dimacs_store, write_clause_types, clause_types_path, DimacsStreamWriter
+from card_encodings import at_most_one, iter_pairwise_blocks, resolve_card_encoding
+from domain_filter import (compute_domains, build_sparse_var_map, physical_domains, propagate_domains,
+                           restrict_to_rings, count_domain_vars)
+
+# Come usare gli assegnamenti degli step precedenti (forced_assignments)
+WARM_STARTS = ("hard", "phases", "assumptions")
+
 
 class CNFGenerator:
 
     def __init__(self, G_log, G_phys, G_log_json=None, G_phys_json=None,
                  exp_dir=None, exp_id=0, skip_reduction=False, physical_center=None,
-                 forced_assignments=None):  # <-- nuova versione
+                 forced_assignments=None, encoding="pairwise",
+                 card_encoding=None, domain_filter=True,
+                 ac_propagation=True, ring_restriction=True,
+                 stream_path=None, warm_start="hard", backtracking=False):  # <-- nuova versione
         self.G_log = G_log
         self.G_phys_original = G_phys
         self.G_log_json = G_log_json
@@ -17,11 +32,31 @@ class CNFGenerator:
         self.skip_reduction = skip_reduction
         self.forced_physical_center = physical_center
         self.forced_assignments = forced_assignments or {}  # <-- dizionario {log_node: phys_node}
+        # hard: clausole unitarie e domini fissati; phases: solo polarità preferite del solver;
+        # assumptions: polarità + assumption, ritirate (solo quelle in conflitto) se UNSAT
+        if warm_start not in WARM_STARTS:
+            raise ValueError(f"warm_start non supportato: {warm_start} (ammessi: {', '.join(WARM_STARTS)})")
+        self.warm_start = warm_start
+        # backtracking: gli assegnamenti ritirati sono ridotti a un insieme minimale (solo assumptions)
+        if backtracking and warm_start != "assumptions":
+            raise ValueError("backtracking richiede warm_start assumptions")
+        self.backtracking = backtracking
+        self.stream_path = stream_path  # clausole scritte su file man mano, senza ClauseStore
+        if encoding not in EDGE_ENCODINGS:
+            raise ValueError(f"Encoding non supportato: {encoding} (ammessi: {', '.join(EDGE_ENCODINGS)})")
+        self.encoding = encoding  # "pairwise" | "support"
+        self.card_encoding = resolve_card_encoding(card_encoding)  # {famiglia: codifica AMO}
+        self.domain_filter = domain_filter  # filtro grado/vicinato prima di allocare le variabili
+        self.ac_propagation = ac_propagation  # propagazione AC-3 sui domini
+        self.ring_restriction = ring_restriction  # solo variante ridotta: dist_phys(c,a) <= dist_log(lc,i)
 
         self.embeddable = True
         self.reject_reasons = []
+        self.write_stats = None
 
         # Riduzione o full graph
+        self.dist_phys_center = None
+        self.dist_log_center = None
         if self.skip_reduction:
             print("[INFO] Variante FULL: nessuna riduzione del grafo fisico.")
             self.G_phys = self.G_phys_original.copy()
@@ -55,16 +90,78 @@ class CNFGenerator:
         self.physical_nodes = list(sorted(self.G_phys.nodes()))
         self.n = len(self.logical_nodes)
         self.m = len(self.physical_nodes)
-        self.var_map = {}
-        vid = 1
-        for i in self.logical_nodes:
-            for a in self.physical_nodes:
-                self.var_map[(i, a)] = vid
-                vid += 1
-        self.num_vars = vid - 1
-        self.inv_var_map = {v: k for k, v in self.var_map.items()}
-        self.clauses = []
-        self.clause_type = []
+        self.domains = compute_domains(self.G_log, self.G_phys, self.logical_nodes,
+                                       self.physical_nodes, use_filter=self.domain_filter)
+        self.domain_stats = {
+            "dense_vars": self.n * self.m,
+            "after_degree_filter": count_domain_vars(self.domains),
+        }
+        if self.ring_restriction and self.dist_phys_center is not None:
+            self.domains = restrict_to_rings(self.domains, self.dist_log_center, self.dist_phys_center)
+            self.domain_stats["after_ring_restriction"] = count_domain_vars(self.domains)
+        if self.embeddable and self.ac_propagation:
+            self._propagate_domains()
+            self.domain_stats["after_ac_propagation"] = count_domain_vars(self.domains)
+        self.var_map, self.inv_var_map, self.num_vars = build_sparse_var_map(self.logical_nodes, self.domains)
+        self.phys_domains = physical_domains(self.logical_nodes, self.physical_nodes, self.var_map)
+        self.var_matrix = build_var_matrix(self.logical_nodes, self.physical_nodes, self.var_map)
+        self.mutual_exclusion_encoded = False
+        self.domain_stats["mapping_vars"] = self.num_vars
+        self.domain_stats["pruned_vars"] = self.n * self.m - self.num_vars
+        self._check_domains()
+        self.unit_lits = set()
+        self.stream = None
+        self.clauses = None
+        self.clause_type = None
+        if self.stream_path and self.embeddable:
+            self.stream = DimacsStreamWriter(self.stream_path)
+        elif not self.stream_path:
+            self.clauses = ClauseStore()
+            self.clause_type = self.clauses.types
+    # -------------------------
+    def _reject(self, reason):
+        self.embeddable = False
+        self.reject_reasons.append(reason)
+        print(f"[PRUNE] {reason}")
+
+    def _check_domains(self):
+        dense = self.n * self.m
+        print(f"[INFO] Filtro domini: {self.num_vars}/{dense} variabili ammissibili "
+              f"({dense - self.num_vars} eliminate)")
+        if not self.embeddable:
+            return
+        empty = [i for i in self.logical_nodes if not self.domains[i]]
+        if empty:
+            self._reject(f"Dominio vuoto per i nodi logici {empty[:10]}")
+            return
+        if self.logical_center is not None and self.center_node is not None \
+                and (self.logical_center, self.center_node) not in self.var_map:
+            self._reject(f"Centro fisico {self.center_node} non ammissibile per il centro logico {self.logical_center}")
+            return
+
+        for i, a in self.forced_assignments.items() if self.warm_start == "hard" else []:
+            if i in self.domains and a in self.G_phys and (i, a) not in self.var_map:
+                self._reject(f"Assegnamento forzato {i}->{a} escluso dal filtro di dominio")
+                return
+
+    def _propagate_domains(self):
+        # Centro (ed eventuali assegnamenti forzati) fissano il dominio prima della propagazione
+        pins = {}
+        if self.logical_center is not None and self.center_node is not None:
+            pins[self.logical_center] = self.center_node
+        for i, a in self.forced_assignments.items() if self.warm_start == "hard" else []:
+            if i in self.domains and a in self.G_phys:
+                pins[i] = a
+        for i, a in pins.items():
+            self.domains[i] = [a] if a in self.domains[i] else []
+
+        t0 = time.time()
+        self.domains, reason = propagate_domains(self.G_log, self.G_phys, self.logical_nodes,
+                                                 self.physical_nodes, self.domains)
+        print(f"[INFO] Propagazione AC-3 completata in {time.time() - t0:.3f}s")
+        if reason:
+            self._reject(reason)
+
     # -------------------------
     def _precheck_embedding(self, G_log, G_phys):
         n_log = len(G_log)
@@ -75,16 +172,17 @@ class CNFGenerator:
             print(f"[PRUNE] {self.reject_reasons[-1]}")
             return
 
-        max_log_deg = max(dict(G_log.degree()).values(), default=0)
-        max_phys_deg = max(dict(G_phys.degree()).values(), default=0)
+        log_inv, phys_inv = invariants(G_log), invariants(G_phys)
+        max_log_deg = max(log_inv.degrees.values(), default=0)
+        max_phys_deg = max(phys_inv.degrees.values(), default=0)
         if max_log_deg > max_phys_deg:
             self.embeddable = False
             self.reject_reasons.append(f"Δ(G_log)={max_log_deg} > Δ(G_phys)={max_phys_deg}")
             print(f"[PRUNE] {self.reject_reasons[-1]}")
             return
 
-        if nx.is_connected(G_log):
-            comp_sizes = [len(c) for c in nx.connected_components(G_phys)]
+        if log_inv.is_connected:
+            comp_sizes = [len(c) for c in phys_inv.components]
             max_comp = max(comp_sizes) if comp_sizes else 0
             if max_comp < n_log:
                 self.embeddable = False
@@ -97,27 +195,31 @@ class CNFGenerator:
     # -------------------------
     def _extract_physical_subgraph(self, G_phys, G_log, forced_center):
         # Seleziona componente connessa più grande
-        components = list(nx.connected_components(G_phys))
-        comp = max(components, key=len)
-        G_comp = G_phys.subgraph(comp).copy()
+        phys_inv = invariants(G_phys)
+        comp = phys_inv.largest_component
 
-        logical_center = nx.center(G_log)[0]
+        log_inv = invariants(G_log)
+        logical_center = log_inv.center[0]
         min_degree_required = G_log.degree(logical_center)
         print(f"[INFO] Centro logico: {logical_center} (grado {min_degree_required})")
 
         # Controllo centro fisico compatibile
-        if G_comp.degree(forced_center) < min_degree_required:
+        if forced_center not in comp:
+            raise RuntimeError(f"Centro fisico {forced_center} fuori dalla componente connessa principale")
+        if G_phys.degree(forced_center) < min_degree_required:
             raise RuntimeError(f"Centro fisico {forced_center} non soddisfa grado minimo richiesto {min_degree_required}")
 
         physical_center = forced_center
 
         # Sottografo centrato sul centro fisico
-        distances_phys = nx.single_source_shortest_path_length(G_comp, physical_center)
-        distances_log = nx.single_source_shortest_path_length(G_log, logical_center)
+        distances_log = log_inv.distances_from(logical_center)
         max_dist_log = max(distances_log.values())
+        # Palla come maschera sulla riga della matrice delle distanze (dentro la componente del centro)
+        distances_phys = phys_inv.distances_from(physical_center, cutoff=max_dist_log)
+        self.dist_phys_center = distances_phys
+        self.dist_log_center = distances_log
 
-        chosen_nodes = [n for n, d in distances_phys.items() if d <= max_dist_log]
-        G_sub = G_comp.subgraph(chosen_nodes).copy()
+        G_sub = G_phys.subgraph(distances_phys).copy()
 
         print(f"[INFO] Sottografo ridotto: {len(G_sub)} nodi selezionati intorno al centro fisico {physical_center}")
 
@@ -155,35 +257,74 @@ class CNFGenerator:
     def x(self, i, a):
         return self.var_map[(i, a)]
 
+    def warm_start_lits(self):
+        """Letterali x(i,a) degli assegnamenti ereditati ancora ammissibili (warm start morbido)."""
+        return [self.var_map[(i, a)] for i, a in self.forced_assignments.items() if (i, a) in self.var_map]
+
     def add_clause(self, lits, ctype="generic"):
-        key = tuple(sorted(lits))
-        if not hasattr(self, 'clause_set'):
-            self.clause_set = set()
-        if key not in self.clause_set:
-            self.clauses.append(list(lits))
-            self.clause_type.append(ctype)
-            self.clause_set.add(key)
+        # Dedup per costruzione: gli encoder non generano clausole ripetute,
+        # solo le unitarie (centro, forzate, unsat_analysis) possono coincidere
+        if len(lits) == 1:
+            if lits[0] in self.unit_lits:
+                return
+            self.unit_lits.add(lits[0])
+        if self.stream:
+            self.stream.add(lits, ctype)
+        else:
+            self.clauses.add(lits, ctype)
+
+    def add_clause_block(self, block, ctype="generic"):
+        """
+        Aggiunge un blocco int32 (k x L) di clausole già prive di duplicati.
+        """
+        if self.stream:
+            self.stream.add_block(block, ctype)
+        else:
+            self.clauses.add_block(block, ctype)
+
+    def add_at_most_one(self, lits, encoding, ctype):
+        # Le variabili ausiliarie sono allocate sopra num_vars; le clausole ausiliarie
+        # ereditano il tipo della famiglia così la mappa clause_type resta valida.
+        if encoding == "pairwise":
+            # O(k^2) clausole binarie: a blocchi numpy, senza liste Python intermedie
+            for block in iter_pairwise_blocks(lits):
+                self.add_clause_block(block, ctype)
+            return
+        clauses, self.num_vars = at_most_one(lits, encoding, self.num_vars)
+        for c in clauses:
+            self.add_clause(c, ctype)
 
     def encode_exactly_one_per_logical(self):
         for i in self.logical_nodes:
-            lits = [self.x(i, a) for a in self.physical_nodes]
+            lits = [self.x(i, a) for a in self.domains[i]]
             if lits:
                 self.add_clause(lits, "at_least_one")
-            for a, b in combinations(self.physical_nodes, 2):
-                self.add_clause([-self.x(i, a), -self.x(i, b)], "at_most_one")
+            self.add_at_most_one(lits, self.card_encoding["exactly_one"], "at_most_one")
 
     def encode_mutual_exclusion_on_physical(self):
+        enc = self.card_encoding["mutual_exclusion"]
         for a in self.physical_nodes:
-            for i, j in combinations(self.logical_nodes, 2):
-                self.add_clause([-self.x(i, a), -self.x(j, a)], "mutual_exclusion")
+            lits = [self.x(i, a) for i in self.phys_domains[a]]
+            self.add_at_most_one(lits, enc, "mutual_exclusion")
+        # Solo il pairwise contiene letteralmente le clausole [-x(i,a), -x(j,a)]
+        self.mutual_exclusion_encoded = enc == "pairwise"
 
     def encode_edge_consistency(self):
-        phys_edges = set(tuple(sorted(e)) for e in self.G_phys.edges())
-        for i, j in self.G_log.edges():
-            for a in self.physical_nodes:
-                for b in self.physical_nodes:
-                    if a == b or (min(a, b), max(a, b)) not in phys_edges:
-                        self.add_clause([-self.x(i, a), -self.x(j, b)], "edge_consistency")
+        if self.encoding == "support":
+            self.encode_edge_support()
+            return
+        # Le coppie a == b sono già coperte da mutual_exclusion (la dedup le scarterebbe)
+        for block in iter_edge_consistency_blocks(self.G_log, self.G_phys,
+                                                  self.logical_nodes, self.physical_nodes,
+                                                  self.var_matrix,
+                                                  skip_diagonal=self.mutual_exclusion_encoded):
+            self.add_clause_block(block, "edge_consistency")
+
+    def encode_edge_support(self):
+        for lits in iter_edge_support_clauses(self.G_log, self.G_phys,
+                                              self.logical_nodes, self.physical_nodes,
+                                              self.var_matrix):
+            self.add_clause(lits, "edge_support")
 
     # -------------------------
     def generate(self):
@@ -198,8 +339,8 @@ class CNFGenerator:
         if self.logical_center is not None and self.center_node is not None:
             self.add_clause([self.x(self.logical_center, self.center_node)], "center_mapping")
 
-        # --- Forced assignments dai precedenti step ---
-        for i, a in self.forced_assignments.items():
+        # --- Forced assignments dai precedenti step (warm start morbido: vedi warm_start_lits) ---
+        for i, a in self.forced_assignments.items() if self.warm_start == "hard" else []:
             if (i, a) in self.var_map:
                 self.add_clause([self.x(i, a)], "forced_assignment")
 
@@ -214,20 +355,30 @@ class CNFGenerator:
                             tokens = line.split()
                             try:
                                 var_id = int(tokens[0])
-                                self.add_clause([var_id], "forced_unsat")
+                                if var_id in self.inv_var_map:
+                                    self.add_clause([var_id], "forced_unsat")
                             except Exception:
                                 pass
 
+        if self.stream:
+            self.write_stats = self.stream.close(self.num_vars)
+            print(f"[INFO] DIMACS scritto in streaming: {self.num_vars} vars e "
+                  f"{self.stream.num_clauses} clauses in {self.stream_path}")
+            return self.num_vars, self.stream.num_clauses
         return self.num_vars, len(self.clauses)
 
     # -------------------------
-    def write_dimacs(self, path):
+    def write_dimacs(self, path, workers=1, codec=None):
         if not self.embeddable:
             print("[INFO] Skip writing DIMACS: problem not embeddable")
-            return
-        with open(path, 'w') as f:
-            f.write(f"p cnf {self.num_vars} {len(self.clauses)}\n")
-            for idx, (c, ctype) in enumerate(zip(self.clauses, self.clause_type), start=1):
-                f.write(f"c id {idx} type {ctype}\n")
-                f.write(' '.join(str(l) for l in c) + ' 0\n')
-        print(f"[INFO] Wrote DIMACS CNF with {self.num_vars} vars e {len(self.clauses)} clauses to {path}")
+            return None
+        if self.stream:
+            if os.path.abspath(path) != os.path.abspath(self.stream_path):
+                raise ValueError(f"DIMACS già scritto in streaming su {self.stream_path}, non su {path}")
+            return self.write_stats
+        # Tipi di clausola nel sidecar compatto invece di un commento "c id N type T" per clausola
+        self.write_stats = write_dimacs_store(path, self.num_vars, self.clauses, workers=workers, codec=codec)
+        write_clause_types(clause_types_path(path), self.clauses)
+        print(f"[INFO] Wrote DIMACS CNF with {self.num_vars} vars e {len(self.clauses)} clauses to {path} "
+              f"({self.write_stats['mb_per_s'] or 0:.1f} MB/s)")
+        return self.write_stats
@@ -0,0 +1,94 @@
+# Granularità dei gruppi per l'estrazione dell'UNSAT core (un selettore per gruppo)
+CORE_GROUPINGS = ("clause_type", "logical_node", "logical_edge", "physical_node")
+
+EDGE_CLAUSE_TYPES = ("edge_consistency", "edge_support")
+
+
+def resolve_core_grouping(grouping):
+    """None / "none" disattiva il core; altrimenti deve essere una delle CORE_GROUPINGS."""
+    if grouping in (None, "none", False):
+        return None
+    if grouping not in CORE_GROUPINGS:
+        raise ValueError(f"Granularità core non supportata: {grouping} "
+                         f"(ammesse: none, {', '.join(CORE_GROUPINGS)})")
+    return grouping
+
+
+class CoreGroups:
+    """
+    Selettori di gruppo per l'UNSAT core: ogni clausola C diventa (¬s_1 ∨ ... ∨ ¬s_k ∨ C),
+    con s_1..s_k i selettori dei gruppi che la clausola tocca, e i selettori sono passati
+    come assumption. Il core si legge come insieme di gruppi.
+
+      clause_type    un gruppo per tipo di clausola
+      logical_node   un gruppo per nodo logico (tutti i nodi logici delle variabili x(i,a))
+      physical_node  un gruppo per nodo fisico (tutti i nodi fisici delle variabili x(i,a))
+      logical_edge   un gruppo per arco logico (solo clausole di edge consistency/support;
+                     le altre restano sempre attive)
+
+    Le clausole che non toccano nessun gruppo (es. solo variabili ausiliarie delle
+    codifiche AMO) restano sempre attive: il core resta valido, solo meno dettagliato.
+    """
+
+    def __init__(self, var_map, num_vars, grouping):
+        self.grouping = resolve_core_grouping(grouping)
+        self.top = num_vars
+        self.selectors = {}     # chiave gruppo -> letterale selettore
+        self.groups = {}        # letterale selettore -> chiave gruppo
+        # Lookup per id variabile (0 / ausiliarie -> None)
+        self._pair_of = [None] * (num_vars + 1)
+        for pair, vid in var_map.items():
+            self._pair_of[vid] = pair
+
+    def _selector(self, key):
+        sel = self.selectors.get(key)
+        if sel is None:
+            self.top += 1
+            sel = self.top
+            self.selectors[key] = sel
+            self.groups[sel] = key
+        return sel
+
+    def _keys(self, clause, ctype):
+        if self.grouping == "clause_type":
+            return [ctype]
+        pairs = [self._pair_of[abs(l)] for l in clause if abs(l) < len(self._pair_of)]
+        pairs = [p for p in pairs if p is not None]
+        if self.grouping == "logical_node":
+            return sorted({i for i, _ in pairs})
+        if self.grouping == "physical_node":
+            return sorted({a for _, a in pairs})
+        # logical_edge
+        nodes = sorted({i for i, _ in pairs})
+        if ctype in EDGE_CLAUSE_TYPES and len(nodes) == 2:
+            return [tuple(nodes)]
+        return []
+
+    def guard(self, clause, ctype):
+        """Clausola con i selettori dei suoi gruppi in testa."""
+        return [-self._selector(k) for k in self._keys(clause, ctype)] + list(clause)
+
+    def assumptions(self):
+        return list(self.selectors.values())
+
+    def explain(self, core):
+        """
+        Traduce il core (selettori) nei gruppi coinvolti, nel formato di unsat_clauses
+        di metrics.write_experiment_output.
+        """
+        entries = []
+        for lit in core or []:
+            key = self.groups.get(lit)
+            if key is None:
+                continue
+            entry = {"type": self.grouping, "clause": [], "logical_pair": [], "physical_pair": []}
+            if self.grouping == "clause_type":
+                entry["type"] = key
+            elif self.grouping == "logical_node":
+                entry["logical_pair"] = [key]
+            elif self.grouping == "physical_node":
+                entry["physical_pair"] = [key]
+            else:
+                entry["logical_pair"] = list(key)
+            entries.append(entry)
+        return entries
@@ -0,0 +1,346 @@
+import gzip
+import io
+import json
+import lzma
+import os
+import shutil
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pysat.formula import CNF
+
+try:
+    import zstandard
+except ImportError:  # zstd opzionale
+    zstandard = None
+
+# Clausole formattate per blocco: abbastanza grandi da ammortizzare join/write
+DEFAULT_CHUNK = 1 << 18
+
+
+# -------------------------
+# Compressione (gzip / xz / zstd se disponibile)
+# -------------------------
+CODEC_EXTENSIONS = {".gz": "gz", ".xz": "xz", ".zst": "zst"}
+# Livelli di default orientati alla velocità: i CNF sono grandi e molto ripetitivi
+DEFAULT_LEVELS = {"gz": 6, "xz": 1, "zst": 3}
+
+
+def available_codecs():
+    codecs = ["gz", "xz"]
+    if zstandard is not None:
+        codecs.append("zst")
+    return codecs
+
+
+def codec_from_path(path):
+    """Codec dedotto dall'estensione del file (None se non compresso)."""
+    return CODEC_EXTENSIONS.get(os.path.splitext(os.fspath(path))[1].lower())
+
+
+def with_codec(path, codec):
+    """Aggiunge l'estensione del codec ("gz", "xz", "zst"; None/"none" lascia invariato)."""
+    if not codec or codec == "none" or codec_from_path(path) == codec:
+        return path
+    return f"{path}.{codec}"
+
+
+def open_compressed(path, mode="rb", codec=None, level=None):
+    """
+    Apre un file eventualmente compresso; il codec si sceglie esplicitamente o dall'estensione.
+    mode come open(): 'rb', 'wb', 'rt', 'wt'.
+    """
+    codec = codec or codec_from_path(path)
+    if codec in (None, "none"):
+        return open(path, mode)
+    level = level if level is not None else DEFAULT_LEVELS[codec]
+    if codec == "gz":
+        return gzip.open(path, mode, compresslevel=level)
+    if codec == "xz":
+        return lzma.open(path, mode, preset=level if "w" in mode else None)
+    if codec == "zst":
+        if zstandard is None:
+            raise RuntimeError("Compressione zstd richiesta ma il modulo 'zstandard' non è installato")
+        if "w" in mode:
+            raw = zstandard.ZstdCompressor(level=level).stream_writer(open(path, "wb"), closefd=True)
+        else:
+            raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return raw if "b" in mode else io.TextIOWrapper(raw, encoding="ascii")
+    raise ValueError(f"Codec non supportato: {codec} (ammessi: none, {', '.join(available_codecs())})")
+
+
+# -------------------------
+# Formattazione a blocchi
+# -------------------------
+def format_clause_block(lits, offsets):
+    """
+    Formatta un blocco di clausole (lits int32 piatti, offsets relativi con offsets[0] == 0)
+    in bytes DIMACS, identici a ' '.join(str(l) for l in c) + ' 0\n' per ogni clausola.
+    La conversione intero -> ASCII è vettorizzata con numpy (una passata per cifra).
+    """
+    if len(offsets) < 2:
+        return b""
+    # Inserisce lo 0 terminatore alla fine di ogni clausola
+    tokens = np.insert(np.asarray(lits, dtype=np.int64), offsets[1:], 0)
+    neg = tokens < 0
+    mag = np.abs(tokens)
+
+    ndig = np.ones(len(tokens), dtype=np.int64)
+    rest = mag // 10
+    while rest.any():
+        ndig += rest > 0
+        rest //= 10
+    max_dig = int(ndig.max())
+
+    # Ogni token è scritto allineato a destra in una riga di larghezza fissa
+    # (segno + cifre + separatore); poi si tengono solo i byte significativi.
+    cols = max_dig + 2
+    grid = np.empty((len(tokens), cols), dtype=np.uint8)
+    grid[:, -1] = np.where(tokens == 0, ord("\n"), ord(" "))
+    for d in range(max_dig):
+        grid[:, cols - 2 - d] = ord("0") + mag % 10
+        mag = mag // 10
+    first = cols - 1 - ndig - neg
+    rows = np.nonzero(neg)[0]
+    grid[rows, first[rows]] = ord("-")
+    keep = np.arange(cols) >= first[:, None]
+    return grid[keep].tobytes()
+
+
+def _format_job(args):
+    return format_clause_block(*args)
+
+
+def _iter_blocks(store, chunk):
+    lits, offsets, _ = store.views()
+    n = len(offsets) - 1
+    for k0 in range(0, n, chunk):
+        k1 = min(k0 + chunk, n)
+        lo, hi = offsets[k0], offsets[k1]
+        yield lits[lo:hi].copy(), offsets[k0:k1 + 1] - lo
+
+
+# -------------------------
+# Scrittura DIMACS
+# -------------------------
+def write_dimacs_store(path, num_vars, store, workers=1, chunk=DEFAULT_CHUNK, comments=None,
+                       codec=None):
+    """
+    Scrive lo ClauseStore in DIMACS formattando blocchi interi di clausole in grandi buffer.
+    Il file è compresso se codec (o l'estensione di path) lo richiede.
+    workers > 1 formatta i blocchi in processi separati (la formattazione è CPU-bound e
+    sotto GIL i thread non danno guadagno); l'ordine delle clausole è preservato.
+    Ritorna statistiche di scrittura (byte non compressi, secondi, MB/s, byte su disco).
+    """
+    t0 = time.time()
+    written = 0
+    with open_compressed(path, "wb", codec=codec) as f:
+        for line in comments or []:
+            buf = f"c {line}\n".encode("utf-8")
+            f.write(buf)
+            written += len(buf)
+        header = f"p cnf {num_vars} {len(store)}\n".encode("ascii")
+        f.write(header)
+        written += len(header)
+
+        blocks = _iter_blocks(store, chunk)
+        if workers and workers > 1:
+            # Finestra limitata di blocchi in volo: la memoria non cresce con il numero di clausole
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for block in blocks:
+                    pending.append(pool.submit(_format_job, block))
+                    if len(pending) >= 2 * workers:
+                        buf = pending.popleft().result()
+                        f.write(buf)
+                        written += len(buf)
+                while pending:
+                    buf = pending.popleft().result()
+                    f.write(buf)
+                    written += len(buf)
+        else:
+            for lits, offsets in blocks:
+                buf = format_clause_block(lits, offsets)
+                f.write(buf)
+                written += len(buf)
+
+    elapsed = time.time() - t0
+    return {
+        "bytes": written,
+        "bytes_on_disk": os.path.getsize(path),
+        "codec": codec or codec_from_path(path),
+        "seconds": elapsed,
+        "mb_per_s": (written / 1e6) / elapsed if elapsed > 0 else None,
+    }
+
+
+def dump_dimacs_store(f, num_vars, store, chunk=DEFAULT_CHUNK):
+    """
+    Scrive lo ClauseStore in DIMACS su un file binario già aperto (es. lo stdin di un
+    solver esterno), a blocchi: nessuna copia testuale completa in memoria.
+    Ritorna i byte scritti.
+    """
+    header = f"p cnf {num_vars} {len(store)}\n".encode("ascii")
+    f.write(header)
+    written = len(header)
+    for lits, offsets in _iter_blocks(store, chunk):
+        buf = format_clause_block(lits, offsets)
+        f.write(buf)
+        written += len(buf)
+    return written
+
+
+# -------------------------
+# Scrittura in streaming
+# -------------------------
+class DimacsStreamWriter:
+    """
+    Scrive le clausole su disco man mano che vengono generate, senza tenerle in memoria.
+      - file non compresso: header a larghezza fissa riservato in testa e riscritto
+        sul posto a fine generazione (stessa lunghezza, nessuna copia del corpo)
+      - file compresso: corpo su file di appoggio, poi header + corpo compressi
+    I tipi di clausola (un byte ciascuno) vanno su un file grezzo convertito nel
+    sidecar .types.npz alla chiusura. La memoria non dipende dal numero di clausole.
+    """
+
+    # Cifre riservate per numero di variabili e di clausole nell'header
+    HEADER_DIGITS = 15
+
+    def __init__(self, path, codec=None):
+        self.path = os.fspath(path)
+        self.codec = codec or codec_from_path(self.path)
+        if self.codec == "none":
+            self.codec = None
+        self.num_clauses = 0
+        self.bytes = 0
+        self.type_names = []
+        self._type_index = {}
+        self._t0 = time.time()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._types_tmp = self.path + ".types.tmp"
+        self._ftypes = open(self._types_tmp, "wb")
+        if self.codec:
+            self._body_path = self.path + ".body"
+            self._f = open(self._body_path, "wb")
+        else:
+            self._body_path = None
+            self._f = open(self.path, "wb")
+            self._f.write(self._header(0, 0))
+
+    def _header(self, num_vars, num_clauses):
+        line = f"p cnf {num_vars} {num_clauses}"
+        if self.codec:
+            return f"{line}\n".encode("ascii")
+        width = len("p cnf ") + 2 * self.HEADER_DIGITS + 1
+        if len(line) > width:
+            raise ValueError(f"Header DIMACS troppo lungo per lo spazio riservato: {line}")
+        # Spazi finali: i parser DIMACS li ignorano
+        return f"{line:<{width}}\n".encode("ascii")
+
+    def _type_id(self, ctype):
+        tid = self._type_index.get(ctype)
+        if tid is None:
+            if len(self.type_names) >= 256:
+                raise ValueError("Troppi tipi di clausola (max 256)")
+            tid = len(self.type_names)
+            self.type_names.append(ctype)
+            self._type_index[ctype] = tid
+        return tid
+
+    # -------------------------
+    def add(self, lits, ctype="generic"):
+        buf = (' '.join(str(l) for l in lits) + " 0\n").encode("ascii")
+        self._f.write(buf)
+        self._ftypes.write(bytes((self._type_id(ctype),)))
+        self.bytes += len(buf)
+        self.num_clauses += 1
+
+    def add_block(self, block, ctype="generic", chunk=DEFAULT_CHUNK):
+        """
+        Blocco int32 (k x L) di clausole della stessa lunghezza, formattato a fette di
+        chunk clausole (i buffer di formattazione non crescono con il blocco).
+        """
+        block = np.ascontiguousarray(block, dtype=np.int32)
+        k, width = block.shape
+        if not k:
+            return
+        tid = bytes((self._type_id(ctype),))
+        for k0 in range(0, k, chunk):
+            part = block[k0:k0 + chunk]
+            buf = format_clause_block(part.ravel(),
+                                      np.arange(0, len(part) * width + 1, width, dtype=np.int64))
+            self._f.write(buf)
+            self._ftypes.write(tid * len(part))
+            self.bytes += len(buf)
+        self.num_clauses += k
+
+    # -------------------------
+    def close(self, num_vars):
+        """Completa header e sidecar; ritorna le stesse statistiche di write_dimacs_store."""
+        header = self._header(num_vars, self.num_clauses)
+        if self.codec:
+            self._f.close()
+            with open_compressed(self.path, "wb", codec=self.codec) as out, \
+                    open(self._body_path, "rb") as body:
+                out.write(header)
+                shutil.copyfileobj(body, out, 1 << 20)
+            os.remove(self._body_path)
+        else:
+            self._f.seek(0)
+            self._f.write(header)
+            self._f.close()
+
+        self._ftypes.close()
+        if self.num_clauses:
+            type_ids = np.memmap(self._types_tmp, dtype=np.uint8, mode="r")
+        else:
+            type_ids = np.zeros(0, dtype=np.uint8)
+        _save_clause_types(clause_types_path(self.path), type_ids, self.type_names)
+        del type_ids
+        os.remove(self._types_tmp)
+
+        elapsed = time.time() - self._t0
+        written = self.bytes + len(header)
+        return {
+            "bytes": written,
+            "bytes_on_disk": os.path.getsize(self.path),
+            "codec": self.codec,
+            "seconds": elapsed,
+            "mb_per_s": (written / 1e6) / elapsed if elapsed > 0 else None,
+            "streamed": True,
+        }
+
+
+def read_dimacs(path, codec=None):
+    """Legge un DIMACS (anche compresso) come pysat CNF."""
+    with open_compressed(path, "rt", codec=codec) as f:
+        return CNF(from_fp=f)
+
+
+def write_clause_types(path, store):
+    """
+    Sidecar compatto con i tipi di clausola: nomi dei tipi + un uint8 per clausola
+    (al posto dei commenti 'c id N type T' inline).
+    """
+    _, _, type_ids = store.views()
+    _save_clause_types(path, type_ids, store.type_names)
+    return path
+
+
+def _save_clause_types(path, type_ids, type_names):
+    # savez scrive l'array a blocchi: con un memmap la memoria resta limitata
+    np.savez_compressed(path, type_ids=type_ids, type_names=np.array(json.dumps(type_names)))
+
+
+def read_clause_types(path):
+    """Ritorna la lista dei tipi (stringhe) per clausola dal sidecar."""
+    data = np.load(path)
+    names = json.loads(str(data["type_names"]))
+    return [names[t] for t in data["type_ids"]]
+
+
+def clause_types_path(dimacs_path):
+    return os.fspath(dimacs_path) + ".types.npz"
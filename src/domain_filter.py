@@ -0,0 +1,173 @@
+def _neighbour_degree_sequence(G, v):
+    return sorted((G.degree(u) for u in G.neighbors(v) if u != v), reverse=True)
+
+
+def _dominates(seq_phys, seq_log):
+    """
+    True se la sequenza (decrescente) dei gradi dei vicini fisici domina quella logica:
+    ogni vicino logico può essere ospitato da un vicino fisico distinto di grado >=.
+    """
+    if len(seq_phys) < len(seq_log):
+        return False
+    return all(p >= l for p, l in zip(seq_phys, seq_log))
+
+
+def compute_domains(G_log, G_phys, logical_nodes, physical_nodes, use_filter=True):
+    """
+    Per ogni nodo logico i restituisce la lista (ordinata come physical_nodes) dei nodi
+    fisici a che possono ospitarlo:
+      - deg(a) >= deg(i)
+      - la sequenza dei gradi dei vicini di a domina quella dei vicini di i
+    Entrambi i filtri sono validi per un embedding come sottografo (non indotto).
+    """
+    if not use_filter:
+        return {i: list(physical_nodes) for i in logical_nodes}
+
+    phys_seq = {a: _neighbour_degree_sequence(G_phys, a) for a in physical_nodes}
+    cache = {}
+    domains = {}
+    for i in logical_nodes:
+        log_seq = tuple(_neighbour_degree_sequence(G_log, i))
+        if log_seq not in cache:
+            cache[log_seq] = [a for a in physical_nodes if _dominates(phys_seq[a], log_seq)]
+        domains[i] = cache[log_seq]
+    return domains
+
+
+def build_sparse_var_map(logical_nodes, domains):
+    """
+    Numera (da 1) solo le coppie (i,a) ammissibili.
+    Ritorna (var_map, inv_var_map, num_vars).
+    """
+    var_map = {}
+    vid = 1
+    for i in logical_nodes:
+        for a in domains[i]:
+            var_map[(i, a)] = vid
+            vid += 1
+    inv_var_map = {v: k for k, v in var_map.items()}
+    return var_map, inv_var_map, vid - 1
+
+
+def physical_domains(logical_nodes, physical_nodes, var_map):
+    """Per ogni nodo fisico a, i nodi logici che possono esservi mappati (ordine logical_nodes)."""
+    return {a: [i for i in logical_nodes if (i, a) in var_map] for a in physical_nodes}
+
+
+# -------------------------
+# Propagazione arc-consistency (AC-3 su bitset)
+# -------------------------
+def propagate_domains(G_log, G_phys, logical_nodes, physical_nodes, domains):
+    """
+    Elimina a da D(i) se per qualche vicino logico j nessun vicino fisico di a sta in D(j);
+    i domini ridotti a un solo nodo fisico lo tolgono agli altri nodi (iniettività).
+    Ripete fino al punto fisso. I domini sono bitset (int) sugli indici di physical_nodes.
+
+    Ritorna (nuovi domini come liste ordinate, motivo del rigetto oppure None).
+    """
+    phys_idx = {a: k for k, a in enumerate(physical_nodes)}
+    nb = [0] * len(physical_nodes)
+    for a in physical_nodes:
+        for b in G_phys.neighbors(a):
+            if b != a:
+                nb[phys_idx[a]] |= 1 << phys_idx[b]
+
+    D = {}
+    for i in logical_nodes:
+        mask = 0
+        for a in domains[i]:
+            mask |= 1 << phys_idx[a]
+        D[i] = mask
+
+    def to_lists():
+        return {i: [a for a in physical_nodes if D[i] >> phys_idx[a] & 1] for i in logical_nodes}
+
+    # support[j]: nodi fisici adiacenti ad almeno un elemento di D(j), ricalcolato solo se D(j) cambia
+    support = {}
+
+    def get_support(j):
+        if j not in support:
+            mask, rest = 0, D[j]
+            while rest:
+                low = rest & -rest
+                mask |= nb[low.bit_length() - 1]
+                rest ^= low
+            support[j] = mask
+        return support[j]
+
+    for i in logical_nodes:
+        if not D[i]:
+            return to_lists(), f"Dominio vuoto per il nodo logico {i}"
+
+    queue = [(i, j) for i in logical_nodes for j in G_log.neighbors(i) if j != i]
+    queued = set(queue)
+
+    def enqueue_neighbours(i, skip=None):
+        for h in G_log.neighbors(i):
+            if h != i and h != skip and (h, i) not in queued:
+                queue.append((h, i))
+                queued.add((h, i))
+
+    fixed = set()
+    while True:
+        while queue:
+            i, j = queue.pop()
+            queued.discard((i, j))
+            keep = D[i] & get_support(j)
+            if keep == D[i]:
+                continue
+            D[i] = keep
+            support.pop(i, None)
+            if not keep:
+                return to_lists(), f"AC-3: dominio vuoto per il nodo logico {i} (arco {i}-{j})"
+            enqueue_neighbours(i, skip=j)
+
+        # Iniettività: il nodo fisico di un dominio singoletto non è disponibile per gli altri
+        changed = False
+        for i in logical_nodes:
+            if i in fixed or D[i] & (D[i] - 1):
+                continue
+            fixed.add(i)
+            for h in logical_nodes:
+                if h != i and D[h] & D[i]:
+                    D[h] &= ~D[i]
+                    support.pop(h, None)
+                    if not D[h]:
+                        return to_lists(), f"AC-3: dominio vuoto per il nodo logico {h} (iniettività)"
+                    enqueue_neighbours(h)
+                    changed = True
+        if not changed:
+            break
+
+    # Pigeonhole: servono almeno n nodi fisici distinti nell'unione dei domini
+    union = 0
+    for i in logical_nodes:
+        union |= D[i]
+    if bin(union).count("1") < len(logical_nodes):
+        return to_lists(), f"AC-3: unione dei domini ({bin(union).count('1')}) < |V_log|={len(logical_nodes)}"
+
+    return to_lists(), None
+
+
+# -------------------------
+# Restrizione ad anelli di distanza (variante ridotta)
+# -------------------------
+def restrict_to_rings(domains, dist_log, dist_phys):
+    """
+    Con il centro logico mappato sul centro fisico, un nodo logico a distanza d dal centro
+    logico può stare solo su nodi fisici a distanza <= d dal centro fisico (i cammini non
+    si allungano in un embedding come sottografo). I nodi non raggiungibili dal centro
+    logico restano invariati.
+    """
+    restricted = {}
+    for i, dom in domains.items():
+        d = dist_log.get(i)
+        if d is None:
+            restricted[i] = dom
+        else:
+            restricted[i] = [a for a in dom if dist_phys.get(a, d + 1) <= d]
+    return restricted
+
+
+def count_domain_vars(domains):
+    return sum(len(dom) for dom in domains.values())
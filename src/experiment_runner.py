@@ -2,17 +2,23 @@ import argparse
 import time
 import yaml
 import os
-import networkx as nx
 
 from parser import read_graph, read_graph_json
+from graph_cache import attach, invariants, DEFAULT_CACHE_DIR
 from cnf_generator import CNFGenerator
 from solver_interface_cripto import solve_dimacs_file
+from solver_interface import solve_cnf_gen
+from solver_registry import resolve_solver
+from solver_pool import get_pool
+from center_scheduler import (resolve_parallel, solve_centers, resolve_round_robin, solve_centers_round_robin,
+                              resolve_shared, solve_centers_shared)
 from metrics import write_experiment_output
 from utils import ensure_dir
+from dimacs_io import with_codec
 from plot_utils import plot_embedding, plot_noembedding
 
 
-def run_experiment(cfg):
+def run_experiment(cfg, solvers=None):
     exp_id = cfg.get("id", 0)
     print(f"\n[INFO] Running experiment ID: {exp_id}")
 
@@ -20,8 +26,9 @@ def run_experiment(cfg):
     ensure_dir(exp_dir_base)
 
     # --- Load graphs ---
-    G_log_txt = read_graph(cfg["logical_graph"])
-    G_phys_txt = read_graph(cfg["physical_graph"])
+    graph_cache = cfg.get("graph_cache", DEFAULT_CACHE_DIR)  # invarianti su disco per contenuto del file; false: solo memoria
+    G_log_txt = attach(read_graph(cfg["logical_graph"]), cfg["logical_graph"], graph_cache)
+    G_phys_txt = attach(read_graph(cfg["physical_graph"]), cfg["physical_graph"], graph_cache)
 
     G_log_json, logical_metadata = read_graph_json(cfg.get("logical_graph_json"))
     G_phys_json, physical_metadata = read_graph_json(cfg.get("physical_graph_json"))
@@ -30,6 +37,30 @@ def run_experiment(cfg):
     physical_dwave = physical_metadata and physical_metadata.get("type", "").lower() in ("chimera", "pegasus", "zephyr")
 
     timeout = cfg.get("timeout_seconds", None)
+    encoding = cfg.get("encoding", "pairwise")
+    num_threads = max(os.cpu_count() - 1, 1)
+    card_encoding = cfg.get("card_encoding")
+    domain_filter = cfg.get("domain_filter", True)
+    ac_propagation = cfg.get("ac_propagation", True)
+    ring_restriction = cfg.get("ring_restriction", True)
+    dimacs_workers = cfg.get("dimacs_workers", 1)
+    cnf_compression = cfg.get("cnf_compression")  # gz | xz | zst | none
+    stream_cnf = cfg.get("stream_cnf", False)  # clausole scritte su disco durante la generazione
+    solver_limits = cfg.get("solver_limits")  # {memory_mb, cpu_seconds} per il solver esterno
+    unsat_core = cfg.get("unsat_core")  # granularità del core: clause_type | logical_node | logical_edge | physical_node
+    write_cnf = cfg.get("write_dimacs", True)
+    solve_in_memory = cfg.get("solve_in_memory", False)  # pysat direttamente sulle clausole del generatore
+    solver = cfg.get("solver")  # solver esterno del registro (default plingeling)
+    solver_proof = cfg.get("solver_proof", False)  # prova DRAT accanto al CNF
+    portfolio = cfg.get("portfolio")  # solo solve_in_memory: solver pysat in gara sulla stessa formula
+    parallel_centers = cfg.get("parallel_centers", 1)  # centri fisici in gara in parallelo: N | auto
+    experiment_timeout = cfg.get("experiment_timeout")  # budget wall complessivo dei centri (variante ridotta)
+    round_robin_centers = cfg.get("round_robin_centers", False)  # centri a interleaving con budget crescente (pysat)
+    shared_centers = cfg.get("shared_centers", False)  # formula unica sull'unione delle palle: sequential | disjunction
+    if solve_in_memory:
+        solver_name = "portfolio" if portfolio else "glucose"
+    else:
+        solver_name = resolve_solver(solver, solvers)["name"]
     
     # ============================================================
     # VARIANTE 2: REDUCED GRAPH
@@ -39,10 +70,10 @@ def run_experiment(cfg):
     exp_dir_reduced = os.path.join(exp_dir_base, variant_reduced)
     ensure_dir(exp_dir_reduced)
 
-    logical_center = nx.center(G_log_txt)[0]
+    logical_center = invariants(G_log_txt).center[0]
     min_deg_required = G_log_txt.degree(logical_center)
 
-    centers_phys_all = nx.center(G_phys_txt)
+    centers_phys_all = invariants(G_phys_txt).center
     candidate_centers = [c for c in centers_phys_all if G_phys_txt.degree(c) >= min_deg_required]
 
     if not candidate_centers:
@@ -61,15 +92,90 @@ def run_experiment(cfg):
     num_vars_reduced = num_clauses_reduced = 0
     t0_reduced = time.time()
     sat_time_reduced = 0.0
+    reject_reasons_reduced = []
+    unsat_core_reduced = []
+    solver_resources_reduced = []
+    portfolio_winners_reduced = []
+    center_effort_reduced = []
+    encoding_stats_reduced = None
+
+    parallel = resolve_parallel(parallel_centers, len(candidate_centers), get_pool().max_workers)
+    round_robin = resolve_round_robin(round_robin_centers)
+    shared = resolve_shared(shared_centers)
+    if sum(bool(x) for x in (parallel > 1, round_robin, shared)) > 1:
+        raise ValueError("parallel_centers, round_robin_centers e shared_centers sono alternativi")
+    solver_name_reduced = "round_robin" if round_robin else "shared_centers" if shared else solver_name
+    if parallel > 1 or round_robin or shared:
+        if portfolio and (solve_in_memory or round_robin or shared):
+            print("[WARN] Centri in gara: niente portfolio, ogni centro usa il primo solver della lista")
+        gen_kwargs = dict(G_log=G_log_txt, G_phys=G_phys_txt, G_log_json=G_log_json, G_phys_json=G_phys_json,
+                          encoding=encoding, card_encoding=card_encoding, domain_filter=domain_filter,
+                          ac_propagation=ac_propagation, ring_restriction=ring_restriction)
+        options = dict(cnf_compression=cnf_compression, stream_cnf=stream_cnf, write_cnf=write_cnf,
+                       solve_in_memory=solve_in_memory, unsat_core=unsat_core, portfolio=portfolio,
+                       solver_spec=resolve_solver(solver, solvers), solver_limits=solver_limits,
+                       solver_proof=solver_proof)
+        if shared:
+            options["dimacs_workers"] = dimacs_workers
+            winner, center_results, sat_time_reduced = solve_centers_shared(
+                candidate_centers, gen_kwargs, exp_dir_reduced, exp_id, options, shared,
+                budget=experiment_timeout or timeout)
+        elif round_robin:
+            options["dimacs_workers"] = dimacs_workers
+            winner, center_results, sat_time_reduced = solve_centers_round_robin(
+                candidate_centers, gen_kwargs, exp_dir_reduced, exp_id, options, round_robin,
+                budget=experiment_timeout or timeout)
+        else:
+            winner, center_results, sat_time_reduced = solve_centers(
+                candidate_centers, gen_kwargs, exp_dir_reduced, exp_id, options, parallel,
+                timeout=timeout, budget=experiment_timeout or timeout)
 
-    for center_node in candidate_centers:
-        print(f"\n[INFO] Tentativo con centro fisico: {center_node}")
+        reduced_file = os.path.join(exp_dir_reduced, f"reduced_physical_{exp_id}.json")
+        for r in center_results:
+            center_node = r["center"]
+            reject_reasons_reduced.extend(f"centro {center_node}: {x}" for x in r["reject_reasons"])
+            unsat_core_reduced.extend(dict(e, type=f"centro {center_node}: {e['type']}")
+                                      for e in r.get("unsat_core") or [])
+            if r.get("resources"):
+                solver_resources_reduced.append(dict(r["resources"], center=center_node))
+            if portfolio and r.get("solver"):
+                portfolio_winners_reduced.append({"center": center_node, "solver": r["solver"]})
+            if r.get("effort"):
+                center_effort_reduced.append(r["effort"])
+            if r["status"] != "REJECTED":
+                num_vars_reduced, num_clauses_reduced = r["num_vars"], r["num_clauses"]
+                encoding_stats_reduced = r["encoding_stats"]
+                reduced_file = r["reduced_file"]
+        if winner:
+            num_vars_reduced, num_clauses_reduced = winner["num_vars"], winner["num_clauses"]
+            encoding_stats_reduced = winner["encoding_stats"]
+            reduced_file = winner["reduced_file"]
+            solution_map_reduced = winner["solution"]
+            found_solution = True
+            print(f"[SUCCESS] SAT con centro fisico {winner['center']}")
 
+    for center_node in candidate_centers if parallel == 1 and not round_robin and not shared else []:
+        print(f"\n[INFO] Tentativo con centro fisico: {center_node}")
+        center_timeout = timeout
+        if experiment_timeout:
+            remaining = experiment_timeout - (time.time() - t0_reduced)
+            if remaining <= 0:
+                print(f"[WARN] Budget dell'esperimento esaurito ({experiment_timeout}s)")
+                break
+            center_timeout = min(timeout, remaining) if timeout else remaining
+
+        dimacs_path_reduced = with_codec(os.path.join(exp_dir_reduced, f"exp_{exp_id}_{variant_reduced}.cnf"), cnf_compression)
         gen = CNFGenerator(
             G_log=G_log_txt,
             G_phys=G_phys_txt,
             G_log_json=G_log_json,
             G_phys_json=G_phys_json,
+            encoding=encoding,
+            card_encoding=card_encoding,
+            domain_filter=domain_filter,
+            ac_propagation=ac_propagation,
+            ring_restriction=ring_restriction,
+            stream_path=dimacs_path_reduced if stream_cnf else None,
             exp_dir=exp_dir_reduced,
             exp_id=exp_id,
             skip_reduction=False,
@@ -79,18 +185,32 @@ def run_experiment(cfg):
 
 
         if not gen.embeddable:
+            reject_reasons_reduced.extend(f"centro {center_node}: {r}" for r in gen.reject_reasons)
             continue
 
         num_vars_reduced, num_clauses_reduced = gen.generate()
-        dimacs_path_reduced = os.path.join(exp_dir_reduced, f"exp_{exp_id}_{variant_reduced}.cnf")
-        gen.write_dimacs(dimacs_path_reduced)
+        encoding_stats_reduced = {"domain_stats": gen.domain_stats}
+        in_memory = solve_in_memory and gen.clauses is not None
+        if write_cnf or stream_cnf:
+            encoding_stats_reduced["dimacs_write"] = gen.write_dimacs(dimacs_path_reduced, workers=dimacs_workers)
 
         t_sat_start = time.time()
-        num_threads = max(os.cpu_count() - 1, 1)
-        res_reduced = solve_dimacs_file(dimacs_path_reduced, timeout_seconds=timeout, num_threads=num_threads)
-        #res_reduced = solve_dimacs_file(dimacs_path_reduced, timeout_seconds=timeout, cnf_gen=gen)
+        if in_memory:
+            res_reduced = solve_cnf_gen(gen, timeout_seconds=center_timeout, core_groups=unsat_core, portfolio=portfolio)
+        else:
+            # Senza DIMACS su disco il CNF va sullo stdin del solver direttamente dal generatore
+            written = write_cnf or stream_cnf
+            res_reduced = solve_dimacs_file(dimacs_path_reduced if written else None, timeout_seconds=center_timeout,
+                                            num_threads=num_threads, limits=solver_limits, solver=solver, solvers=solvers,
+                                            cnf_gen=gen, proof_path=dimacs_path_reduced + ".drat" if solver_proof else None)
         t_sat_end = time.time()
         sat_time_reduced += (t_sat_end - t_sat_start)
+        if in_memory and portfolio and res_reduced.get("solver"):
+            portfolio_winners_reduced.append({"center": center_node, "solver": res_reduced["solver"]})
+        if res_reduced.get("resources"):
+            solver_resources_reduced.append(dict(res_reduced["resources"], center=center_node))
+        unsat_core_reduced.extend(dict(e, type=f"centro {center_node}: {e['type']}")
+                                  for e in res_reduced.get("unsat_core") or [])
 
         if res_reduced.get("status") == "SAT" and res_reduced.get("model"):
             rev = {vid: (i, a) for (i, a), vid in gen.var_map.items()}
@@ -108,10 +228,16 @@ def run_experiment(cfg):
 
     write_experiment_output(
         exp_id, cfg, G_log_txt, G_phys_txt,
-        num_vars_reduced, num_clauses_reduced, "pairwise",
-        "glucose", total_time_reduced, sat_time_reduced,
+        num_vars_reduced, num_clauses_reduced, encoding,
+        solver_name_reduced, total_time_reduced, sat_time_reduced,
         "SAT" if solution_map_reduced else "UNSAT",
         solution=[{"assignment": solution_map_reduced}] if solution_map_reduced else None,
+        unsat_clauses=unsat_core_reduced or None,
+        reject_reasons=reject_reasons_reduced,
+        encoding_stats=encoding_stats_reduced,
+        solver_resources=solver_resources_reduced or None,
+        portfolio_winners=portfolio_winners_reduced or None,
+        center_effort=center_effort_reduced or None,
         output_dir=exp_dir_reduced
     )
     if found_solution and solution_map_reduced:
@@ -154,11 +280,18 @@ def run_experiment(cfg):
     t0_full = time.time()
     sat_time_full = 0.0
 
+    dimacs_path_full = with_codec(os.path.join(exp_dir_full, f"exp_{exp_id}_{variant_full}.cnf"), cnf_compression)
     gen_full = CNFGenerator(
         G_log=G_log_txt,
         G_phys=G_phys_txt,
         G_log_json=G_log_json,
         G_phys_json=G_phys_json,
+        encoding=encoding,
+        card_encoding=card_encoding,
+        domain_filter=domain_filter,
+        ac_propagation=ac_propagation,
+        ring_restriction=ring_restriction,
+        stream_path=dimacs_path_full if stream_cnf else None,
         exp_dir=exp_dir_full,
         exp_id=exp_id,
         skip_reduction=True
@@ -166,15 +299,23 @@ def run_experiment(cfg):
 
     solution_map_full = None
     num_vars_full = num_clauses_full = 0
+    res_full = {}
 
     if gen_full.embeddable:
         num_vars_full, num_clauses_full = gen_full.generate()
-        dimacs_path_full = os.path.join(exp_dir_full, f"exp_{exp_id}_{variant_full}.cnf")
-        gen_full.write_dimacs(dimacs_path_full)
+        in_memory = solve_in_memory and gen_full.clauses is not None
+        if write_cnf or stream_cnf:
+            gen_full.write_dimacs(dimacs_path_full, workers=dimacs_workers)
 
         t_sat_start = time.time()
-        res_full = solve_dimacs_file(dimacs_path_full, timeout_seconds=timeout, num_threads=num_threads)
-        #res_full = solve_dimacs_file(dimacs_path_full, timeout_seconds=timeout, cnf_gen=gen_full)
+        if in_memory:
+            res_full = solve_cnf_gen(gen_full, timeout_seconds=timeout, core_groups=unsat_core, portfolio=portfolio)
+        else:
+            # Senza DIMACS su disco il CNF va sullo stdin del solver direttamente dal generatore
+            written = write_cnf or stream_cnf
+            res_full = solve_dimacs_file(dimacs_path_full if written else None, timeout_seconds=timeout,
+                                         num_threads=num_threads, limits=solver_limits, solver=solver, solvers=solvers,
+                                         cnf_gen=gen_full, proof_path=dimacs_path_full + ".drat" if solver_proof else None)
         t_sat_end = time.time()
         sat_time_full = t_sat_end - t_sat_start
 
@@ -196,10 +337,15 @@ def run_experiment(cfg):
 
     write_experiment_output(
         exp_id, cfg, G_log_txt, G_phys_txt,
-        num_vars_full, num_clauses_full, "pairwise",
-        "glucose", total_time_full, sat_time_full,
+        num_vars_full, num_clauses_full, encoding,
+        solver_name, total_time_full, sat_time_full,
         "SAT" if solution_map_full else "UNSAT",
         solution=[{"assignment": solution_map_full}] if solution_map_full else None,
+        unsat_clauses=res_full.get("unsat_core") or None,
+        reject_reasons=gen_full.reject_reasons,
+        encoding_stats={"domain_stats": gen_full.domain_stats, "dimacs_write": gen_full.write_stats},
+        solver_resources=res_full.get("resources"),
+        portfolio_winners=[{"solver": res_full["solver"]}] if solve_in_memory and portfolio and res_full.get("solver") else None,
         output_dir=exp_dir_full
     )
 
@@ -237,4 +383,4 @@ if __name__ == "__main__":
     ensure_dir("outputs")
 
     for cfg in cfg_all.get("experiments", []):
-        run_experiment(cfg)
+        run_experiment(cfg, solvers=cfg_all.get("solvers"))
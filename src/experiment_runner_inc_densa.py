@@ -5,10 +5,12 @@ import os
 import networkx as nx
 
 from parser import read_graph, read_graph_json
+from graph_cache import attach, invariants, DEFAULT_CACHE_DIR
 from cnf_generator_incremental import CNFGenerator
 from solver_interface import solve_dimacs_file
 from metrics import write_experiment_output
 from utils import ensure_dir
+from dimacs_io import with_codec
 from plot_utils import plot_embedding, plot_noembedding
 
 # ============================================================
@@ -16,30 +18,26 @@ from plot_utils import plot_embedding, plot_noembedding
 # ============================================================
 
 def compute_incremental_subgraphs(G_log):
+    """
+    Step per layer di distanza dal k-core massimo, con una sola BFS multi-sorgente
+    (O(V+E)). Generatore di viste in sola lettura di G_log (niente copie): lo step d
+    contiene i nodi a distanza <= d dal core.
+    """
     # 1) k-core massimo
-    core_number = nx.core_number(G_log)
+    core_number = invariants(G_log).core_number
     k_max = max(core_number.values())
     dense_core_nodes = [n for n, k in core_number.items() if k == k_max]
 
-    # 2) distanza minima da QUALSIASI nodo del core
-    distances = {
-        n: min(
-            nx.shortest_path_length(G_log, source=c, target=n)
-            for c in dense_core_nodes
-        )
-        for n in G_log.nodes()
-    }
-
-    max_distance = max(distances.values())
-    incremental_subgraphs = []
+    # 2) distanza minima da QUALSIASI nodo del core: layer della BFS multi-sorgente
+    layers = list(nx.bfs_layers(G_log, dense_core_nodes))
+    if sum(len(layer) for layer in layers) < len(G_log):
+        raise nx.NetworkXNoPath("Nodi logici non raggiungibili dal core denso")
 
     # 3) crescita per layer di distanza
-    for d in range(max_distance + 1):
-        nodes_in_subgraph = [n for n, dist in distances.items() if dist <= d]
-        subgraph = G_log.subgraph(nodes_in_subgraph).copy()
-        incremental_subgraphs.append(subgraph)
-
-    return incremental_subgraphs
+    nodes_in_subgraph = []
+    for layer in layers:
+        nodes_in_subgraph.extend(layer)
+        yield G_log.subgraph(nodes_in_subgraph)
 
 
 # ============================================================
@@ -54,8 +52,9 @@ def run_experiment(cfg):
     ensure_dir(exp_dir_base)
 
     # --- Load graphs ---
-    G_log_txt = read_graph(cfg["logical_graph"])
-    G_phys_txt = read_graph(cfg["physical_graph"])
+    graph_cache = cfg.get("graph_cache", DEFAULT_CACHE_DIR)  # invarianti su disco per contenuto del file; false: solo memoria
+    G_log_txt = attach(read_graph(cfg["logical_graph"]), cfg["logical_graph"], graph_cache)
+    G_phys_txt = attach(read_graph(cfg["physical_graph"]), cfg["physical_graph"], graph_cache)
     G_log_json, logical_metadata = read_graph_json(cfg.get("logical_graph_json"))
     G_phys_json, physical_metadata = read_graph_json(cfg.get("physical_graph_json"))
 
@@ -63,6 +62,18 @@ def run_experiment(cfg):
     physical_dwave = physical_metadata and physical_metadata.get("type", "").lower() in ("chimera", "pegasus", "zephyr")
 
     timeout = cfg.get("timeout_seconds", None)
+    encoding = cfg.get("encoding", "pairwise")
+    card_encoding = cfg.get("card_encoding")
+    domain_filter = cfg.get("domain_filter", True)
+    ac_propagation = cfg.get("ac_propagation", True)
+    ring_restriction = cfg.get("ring_restriction", True)
+    dimacs_workers = cfg.get("dimacs_workers", 1)
+    cnf_compression = cfg.get("cnf_compression")  # gz | xz | zst | none
+    stream_cnf = cfg.get("stream_cnf", False)  # clausole scritte su disco durante la generazione
+    unsat_core = cfg.get("unsat_core")  # granularità del core: clause_type | logical_node | logical_edge | physical_node
+    portfolio = cfg.get("portfolio")  # solver pysat in gara sulla stessa formula
+    solver_name = "portfolio" if portfolio else "glucose"
+    write_cnf = cfg.get("write_dimacs", True)  # DIMACS solo come artefatto: il solver legge dal generatore
 
     # ============================================================
     # VARIANTE 2: REDUCED GRAPH INCREMENTALE CON EREDITA'
@@ -79,10 +90,10 @@ def run_experiment(cfg):
 
     for step, G_sub in enumerate(incremental_subgraphs):
         print(f"\n[INFO] Step {step}: sotto-grafo con {len(G_sub.nodes())} nodi")
-        logical_center = nx.center(G_sub)[0]
+        logical_center = invariants(G_sub).center[0]
         min_deg_required = G_sub.degree(logical_center)
 
-        centers_phys_all = nx.center(G_phys_txt)
+        centers_phys_all = invariants(G_phys_txt).center
         candidate_centers = [c for c in centers_phys_all if G_phys_txt.degree(c) >= min_deg_required]
         if not candidate_centers:
             print("[ERROR] Nessun centro fisico valido.")
@@ -93,14 +104,25 @@ def run_experiment(cfg):
         sat_time_step = 0.0
         num_vars_step = 0
         num_clauses_step = 0
+        step_rejects = []
+        step_core = []
+        step_winners = []
+        step_encoding_stats = None
 
         for center_node in candidate_centers:
             print(f"[INFO] Tentativo con centro fisico: {center_node}")
+            dimacs_path = with_codec(os.path.join(exp_dir_reduced, f"exp_{exp_id}_step{step}.cnf"), cnf_compression)
             gen = CNFGenerator(
                 G_log=G_sub,
                 G_phys=G_phys_txt,
                 G_log_json=G_log_json,
                 G_phys_json=G_phys_json,
+                encoding=encoding,
+                card_encoding=card_encoding,
+                domain_filter=domain_filter,
+                ac_propagation=ac_propagation,
+                ring_restriction=ring_restriction,
+                stream_path=dimacs_path if stream_cnf else None,
                 exp_dir=exp_dir_reduced,
                 exp_id=f"{exp_id}_step{step}",
                 skip_reduction=False,
@@ -110,20 +132,26 @@ def run_experiment(cfg):
             reduced_file = os.path.join(exp_dir_reduced, f"reduced_physical_{exp_id}_step{step}.json")
 
             if not gen.embeddable:
+                step_rejects.extend(f"centro {center_node}: {r}" for r in gen.reject_reasons)
                 continue
 
             t_cnf_start = time.time()
             num_vars_step, num_clauses_step = gen.generate()
+            step_encoding_stats = {"domain_stats": gen.domain_stats}
             t_cnf_end = time.time()
             time_cnf_step = t_cnf_end - t_cnf_start
 
-            dimacs_path = os.path.join(exp_dir_reduced, f"exp_{exp_id}_step{step}.cnf")
-            gen.write_dimacs(dimacs_path)
+            if write_cnf or stream_cnf:
+                step_encoding_stats["dimacs_write"] = gen.write_dimacs(dimacs_path, workers=dimacs_workers)
 
             t_sat_start = time.time()
-            res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen)
+            res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen, core_groups=unsat_core,
+                                    portfolio=portfolio)
             t_sat_end = time.time()
             sat_time_step = t_sat_end - t_sat_start
+            step_core.extend(dict(e, type=f"centro {center_node}: {e['type']}") for e in res.get("unsat_core") or [])
+            if portfolio and res.get("solver"):
+                step_winners.append({"center": center_node, "solver": res["solver"]})
 
             if res.get("status") == "SAT" and res.get("model"):
                 rev = {vid: (i, a) for (i, a), vid in gen.var_map.items()}
@@ -144,7 +172,11 @@ def run_experiment(cfg):
             "time_cnf": time_cnf_step,
             "time_sat": sat_time_step,
             "solution": step_solution,
-            "reduced_file": reduced_file
+            "reduced_file": reduced_file,
+            "reject_reasons": step_rejects,
+            "encoding_stats": step_encoding_stats,
+            "unsat_core": step_core,
+            "portfolio_winners": step_winners
         })
 
     # --- Salvataggio risultati e plot ---
@@ -154,10 +186,14 @@ def run_experiment(cfg):
 
         write_experiment_output(
             exp_id, cfg, G_log_txt, G_phys_txt,
-            res["num_vars"], res["num_clauses"], "pairwise",
-            "glucose", res["time_cnf"], res["time_sat"],
+            res["num_vars"], res["num_clauses"], encoding,
+            solver_name, res["time_cnf"], res["time_sat"],
             "SAT" if res["solution"] else "UNSAT",
             solution=[{"assignment": res["solution"]}] if res["solution"] else None,
+            unsat_clauses=res.get("unsat_core") or None,
+            reject_reasons=res["reject_reasons"],
+            encoding_stats=res["encoding_stats"],
+            portfolio_winners=res.get("portfolio_winners") or None,
             output_dir=step_dir
         )
 
@@ -210,11 +246,18 @@ def run_experiment(cfg):
         num_clauses_step = 0
 
         # Creiamo il CNFGenerator senza specificare centro fisico
+        dimacs_path = with_codec(os.path.join(exp_dir_full, f"exp_{exp_id}_full_step{step}.cnf"), cnf_compression)
         gen = CNFGenerator(
             G_log=G_sub,
             G_phys=G_phys_txt,
             G_log_json=G_log_json,
             G_phys_json=G_phys_json,
+            encoding=encoding,
+            card_encoding=card_encoding,
+            domain_filter=domain_filter,
+            ac_propagation=ac_propagation,
+            ring_restriction=ring_restriction,
+            stream_path=dimacs_path if stream_cnf else None,
             exp_dir=exp_dir_full,
             exp_id=f"{exp_id}_full_step{step}",
             skip_reduction=True,
@@ -223,6 +266,17 @@ def run_experiment(cfg):
 
         if not gen.embeddable:
             print("[WARN] Step non embeddibile, salto questo sotto-grafo")
+            all_step_results_full.append({
+                "step": step,
+                "num_nodes": len(G_sub.nodes()),
+                "num_vars": 0,
+                "num_clauses": 0,
+                "time_cnf": 0.0,
+                "time_sat": 0.0,
+                "solution": None,
+                "reject_reasons": gen.reject_reasons,
+                "encoding_stats": {"domain_stats": gen.domain_stats}
+            })
             continue
 
         # --- CNF generation ---
@@ -232,12 +286,13 @@ def run_experiment(cfg):
         time_cnf_step = t_cnf_end - t_cnf_start
 
         # --- Scrittura DIMACS ---
-        dimacs_path = os.path.join(exp_dir_full, f"exp_{exp_id}_full_step{step}.cnf")
-        gen.write_dimacs(dimacs_path)
+        if write_cnf or stream_cnf:
+            gen.write_dimacs(dimacs_path, workers=dimacs_workers)
 
         # --- SAT solving ---
         t_sat_start = time.time()
-        res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen)
+        res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen, core_groups=unsat_core,
+                                portfolio=portfolio)
         t_sat_end = time.time()
         sat_time_step = t_sat_end - t_sat_start
 
@@ -258,7 +313,11 @@ def run_experiment(cfg):
             "num_clauses": num_clauses_step,
             "time_cnf": time_cnf_step,
             "time_sat": sat_time_step,
-            "solution": step_solution
+            "solution": step_solution,
+            "reject_reasons": [],
+            "encoding_stats": {"domain_stats": gen.domain_stats, "dimacs_write": gen.write_stats},
+            "unsat_core": res.get("unsat_core"),
+            "portfolio_winners": [{"solver": res["solver"]}] if portfolio and res.get("solver") else []
         })
 
     # --- Salvataggio risultati e plot ---
@@ -268,10 +327,14 @@ def run_experiment(cfg):
 
         write_experiment_output(
             exp_id, cfg, G_log_txt, G_phys_txt,
-            res["num_vars"], res["num_clauses"], "pairwise",
-            "glucose", res["time_cnf"], res["time_sat"],
+            res["num_vars"], res["num_clauses"], encoding,
+            solver_name, res["time_cnf"], res["time_sat"],
             "SAT" if res["solution"] else "UNSAT",
             solution=[{"assignment": res["solution"]}] if res["solution"] else None,
+            unsat_clauses=res.get("unsat_core") or None,
+            reject_reasons=res["reject_reasons"],
+            encoding_stats=res["encoding_stats"],
+            portfolio_winners=res.get("portfolio_winners") or None,
             output_dir=step_dir
         )
 
@@ -2,13 +2,15 @@ import argparse
 import time
 import yaml
 import os
-import networkx as nx
 
 from parser import read_graph, read_graph_json
+from graph_cache import attach, invariants, DEFAULT_CACHE_DIR
 from cnf_generator_incremental import CNFGenerator
 from solver_interface import solve_dimacs_file
+from incremental_session import solve_steps_persistent
 from metrics import write_experiment_output
 from utils import ensure_dir
+from dimacs_io import with_codec
 from plot_utils import plot_embedding, plot_noembedding
 
 # ============================================================
@@ -16,8 +18,8 @@ from plot_utils import plot_embedding, plot_noembedding
 # ============================================================
 
 def compute_incremental_subgraphs(G_log):
-    logical_center = nx.center(G_log)[0]
-    distances = nx.single_source_shortest_path_length(G_log, logical_center)
+    inv = invariants(G_log)
+    distances = inv.distances_from(inv.center[0])
     max_distance = max(distances.values())
     incremental_subgraphs = []
 
@@ -28,6 +30,24 @@ def compute_incremental_subgraphs(G_log):
 
     return incremental_subgraphs
 
+
+def record_warm_start(res, gen, forced_assignments, totals):
+    """
+    Statistiche del warm start di un tentativo con le coppie (i,a) ritirate, che escono
+    anche dagli assegnamenti ereditati (non vanno riproposte agli step successivi);
+    backtrack e chiamate al solver si sommano nei totali dello step.
+    """
+    warm = res.get("warm_start")
+    if not warm:
+        return None
+    relaxed = [gen.inv_var_map[l] for l in warm["relaxed"]]
+    for i, a in relaxed:
+        if forced_assignments.get(i) == a:
+            del forced_assignments[i]
+    totals["backtracks"] += warm["backtracks"]
+    totals["solver_calls"] += warm["solver_calls"]
+    return dict(warm, relaxed=relaxed)
+
 # ============================================================
 # Funzione principale per un esperimento
 # ============================================================
@@ -40,8 +60,9 @@ def run_experiment(cfg):
     ensure_dir(exp_dir_base)
 
     # --- Load graphs ---
-    G_log_txt = read_graph(cfg["logical_graph"])
-    G_phys_txt = read_graph(cfg["physical_graph"])
+    graph_cache = cfg.get("graph_cache", DEFAULT_CACHE_DIR)  # invarianti su disco per contenuto del file; false: solo memoria
+    G_log_txt = attach(read_graph(cfg["logical_graph"]), cfg["logical_graph"], graph_cache)
+    G_phys_txt = attach(read_graph(cfg["physical_graph"]), cfg["physical_graph"], graph_cache)
     G_log_json, logical_metadata = read_graph_json(cfg.get("logical_graph_json"))
     G_phys_json, physical_metadata = read_graph_json(cfg.get("physical_graph_json"))
 
@@ -49,6 +70,28 @@ def run_experiment(cfg):
     physical_dwave = physical_metadata and physical_metadata.get("type", "").lower() in ("chimera", "pegasus", "zephyr")
 
     timeout = cfg.get("timeout_seconds", None)
+    encoding = cfg.get("encoding", "pairwise")
+    card_encoding = cfg.get("card_encoding")
+    domain_filter = cfg.get("domain_filter", True)
+    ac_propagation = cfg.get("ac_propagation", True)
+    ring_restriction = cfg.get("ring_restriction", True)
+    dimacs_workers = cfg.get("dimacs_workers", 1)
+    cnf_compression = cfg.get("cnf_compression")  # gz | xz | zst | none
+    stream_cnf = cfg.get("stream_cnf", False)  # clausole scritte su disco durante la generazione
+    unsat_core = cfg.get("unsat_core")  # granularità del core: clause_type | logical_node | logical_edge | physical_node
+    portfolio = cfg.get("portfolio")  # solver pysat in gara sulla stessa formula
+    solver_name = "portfolio" if portfolio else "glucose"
+    write_cnf = cfg.get("write_dimacs", True)  # DIMACS solo come artefatto: il solver legge dal generatore
+    persistent_solver = cfg.get("persistent_solver", False)  # un solver incrementale per tutti gli step
+    warm_start = cfg.get("warm_start")  # soluzioni precedenti: hard | phases | assumptions
+    backtracking = cfg.get("backtracking", False)  # assegnamenti ritirati minimali, richiede assumptions
+    if backtracking:
+        warm_start = warm_start or "assumptions"
+    if persistent_solver:
+        gen_kwargs = dict(G_phys=G_phys_txt, G_log_json=G_log_json, G_phys_json=G_phys_json, encoding=encoding,
+                          card_encoding=card_encoding, domain_filter=domain_filter, ac_propagation=ac_propagation,
+                          ring_restriction=ring_restriction)
+        options = dict(portfolio=portfolio, unsat_core=unsat_core, write_cnf=write_cnf, stream_cnf=stream_cnf)
 
     # ============================================================
     # VARIANTE 2: REDUCED GRAPH INCREMENTALE CON EREDITA'
@@ -63,12 +106,21 @@ def run_experiment(cfg):
 
     forced_assignments = {}  # dizionario cumulativo tra step
 
-    for step, G_sub in enumerate(incremental_subgraphs):
+    if persistent_solver:
+        # Centri del grafo logico completo: la sessione di ogni centro vale per tutti gli step
+        min_deg_required = G_log_txt.degree(invariants(G_log_txt).center[0])
+        candidate_centers = [c for c in invariants(G_phys_txt).center if G_phys_txt.degree(c) >= min_deg_required]
+        all_step_results = solve_steps_persistent(G_log_txt, [G.nodes() for G in incremental_subgraphs],
+                                                  candidate_centers, gen_kwargs, exp_dir_reduced, exp_id,
+                                                  options, timeout=timeout, warm_start=warm_start,
+                                                  backtracking=backtracking)
+
+    for step, G_sub in enumerate(incremental_subgraphs if not persistent_solver else []):
         print(f"\n[INFO] Step {step}: sotto-grafo con {len(G_sub.nodes())} nodi")
-        logical_center = nx.center(G_sub)[0]
+        logical_center = invariants(G_sub).center[0]
         min_deg_required = G_sub.degree(logical_center)
 
-        centers_phys_all = nx.center(G_phys_txt)
+        centers_phys_all = invariants(G_phys_txt).center
         candidate_centers = [c for c in centers_phys_all if G_phys_txt.degree(c) >= min_deg_required]
         if not candidate_centers:
             print("[ERROR] Nessun centro fisico valido.")
@@ -79,37 +131,61 @@ def run_experiment(cfg):
         sat_time_step = 0.0
         num_vars_step = 0
         num_clauses_step = 0
+        step_rejects = []
+        step_core = []
+        step_winners = []
+        step_encoding_stats = None
+        step_backtracking = {"backtracks": 0, "solver_calls": 0}
 
         for center_node in candidate_centers:
             print(f"[INFO] Tentativo con centro fisico: {center_node}")
+            dimacs_path = with_codec(os.path.join(exp_dir_reduced, f"exp_{exp_id}_step{step}.cnf"), cnf_compression)
             gen = CNFGenerator(
                 G_log=G_sub,
                 G_phys=G_phys_txt,
                 G_log_json=G_log_json,
                 G_phys_json=G_phys_json,
+                encoding=encoding,
+                card_encoding=card_encoding,
+                domain_filter=domain_filter,
+                ac_propagation=ac_propagation,
+                ring_restriction=ring_restriction,
+                stream_path=dimacs_path if stream_cnf else None,
                 exp_dir=exp_dir_reduced,
                 exp_id=f"{exp_id}_step{step}",
                 skip_reduction=False,
                 physical_center=center_node,
-                forced_assignments=forced_assignments  # <-- eredita qui
+                forced_assignments=forced_assignments,  # <-- eredita qui
+                warm_start=warm_start or "hard",
+                backtracking=backtracking
             )
             reduced_file = os.path.join(exp_dir_reduced, f"reduced_physical_{exp_id}_step{step}.json")
 
             if not gen.embeddable:
+                step_rejects.extend(f"centro {center_node}: {r}" for r in gen.reject_reasons)
                 continue
 
             t_cnf_start = time.time()
             num_vars_step, num_clauses_step = gen.generate()
+            step_encoding_stats = {"domain_stats": gen.domain_stats}
             t_cnf_end = time.time()
             time_cnf_step = t_cnf_end - t_cnf_start
 
-            dimacs_path = os.path.join(exp_dir_reduced, f"exp_{exp_id}_step{step}.cnf")
-            gen.write_dimacs(dimacs_path)
+            if write_cnf or stream_cnf:
+                step_encoding_stats["dimacs_write"] = gen.write_dimacs(dimacs_path, workers=dimacs_workers)
 
             t_sat_start = time.time()
-            res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen)
+            res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen, core_groups=unsat_core,
+                                    portfolio=portfolio)
             t_sat_end = time.time()
             sat_time_step = t_sat_end - t_sat_start
+            step_core.extend(dict(e, type=f"centro {center_node}: {e['type']}") for e in res.get("unsat_core") or [])
+            warm = record_warm_start(res, gen, forced_assignments, step_backtracking)
+            if warm:
+                step_encoding_stats["warm_start"] = dict(warm, center=center_node)
+                step_encoding_stats["backtracking"] = step_backtracking
+            if portfolio and res.get("solver"):
+                step_winners.append({"center": center_node, "solver": res["solver"]})
 
             if res.get("status") == "SAT" and res.get("model"):
                 rev = {vid: (i, a) for (i, a), vid in gen.var_map.items()}
@@ -130,7 +206,11 @@ def run_experiment(cfg):
             "time_cnf": time_cnf_step,
             "time_sat": sat_time_step,
             "solution": step_solution,
-            "reduced_file": reduced_file
+            "reduced_file": reduced_file,
+            "reject_reasons": step_rejects,
+            "encoding_stats": step_encoding_stats,
+            "unsat_core": step_core,
+            "portfolio_winners": step_winners
         })
 
     # --- Salvataggio risultati e plot ---
@@ -140,10 +220,14 @@ def run_experiment(cfg):
 
         write_experiment_output(
             exp_id, cfg, G_log_txt, G_phys_txt,
-            res["num_vars"], res["num_clauses"], "pairwise",
-            "glucose", res["time_cnf"], res["time_sat"],
+            res["num_vars"], res["num_clauses"], encoding,
+            solver_name, res["time_cnf"], res["time_sat"],
             "SAT" if res["solution"] else "UNSAT",
             solution=[{"assignment": res["solution"]}] if res["solution"] else None,
+            unsat_clauses=res.get("unsat_core") or None,
+            reject_reasons=res["reject_reasons"],
+            encoding_stats=res["encoding_stats"],
+            portfolio_winners=res.get("portfolio_winners") or None,
             output_dir=step_dir
         )
 
@@ -186,7 +270,13 @@ def run_experiment(cfg):
     # forced_assignments parte vuoto 
     forced_assignments_full = {}
 
-    for step, G_sub in enumerate(incremental_subgraphs_full):
+    if persistent_solver:
+        all_step_results_full = solve_steps_persistent(G_log_txt, [G.nodes() for G in incremental_subgraphs_full],
+                                                       [None], gen_kwargs, exp_dir_full, f"{exp_id}_full",
+                                                       options, timeout=timeout, warm_start=warm_start,
+                                                       backtracking=backtracking)
+
+    for step, G_sub in enumerate(incremental_subgraphs_full if not persistent_solver else []):
         print(f"\n[INFO] Step {step} FULL GRAPH: sotto-grafo con {len(G_sub.nodes())} nodi")
 
         step_solution = None
@@ -196,19 +286,39 @@ def run_experiment(cfg):
         num_clauses_step = 0
 
         # Creiamo il CNFGenerator senza specificare centro fisico
+        dimacs_path = with_codec(os.path.join(exp_dir_full, f"exp_{exp_id}_full_step{step}.cnf"), cnf_compression)
         gen = CNFGenerator(
             G_log=G_sub,
             G_phys=G_phys_txt,
             G_log_json=G_log_json,
             G_phys_json=G_phys_json,
+            encoding=encoding,
+            card_encoding=card_encoding,
+            domain_filter=domain_filter,
+            ac_propagation=ac_propagation,
+            ring_restriction=ring_restriction,
+            stream_path=dimacs_path if stream_cnf else None,
             exp_dir=exp_dir_full,
             exp_id=f"{exp_id}_full_step{step}",
             skip_reduction=True,
-            forced_assignments=forced_assignments_full  # eredita dai passi precedenti
+            forced_assignments=forced_assignments_full,  # eredita dai passi precedenti
+            warm_start=warm_start or "hard",
+            backtracking=backtracking
         )
 
         if not gen.embeddable:
             print("[WARN] Step non embeddibile, salto questo sotto-grafo")
+            all_step_results_full.append({
+                "step": step,
+                "num_nodes": len(G_sub.nodes()),
+                "num_vars": 0,
+                "num_clauses": 0,
+                "time_cnf": 0.0,
+                "time_sat": 0.0,
+                "solution": None,
+                "reject_reasons": gen.reject_reasons,
+                "encoding_stats": {"domain_stats": gen.domain_stats}
+            })
             continue
 
         # --- CNF generation ---
@@ -218,12 +328,13 @@ def run_experiment(cfg):
         time_cnf_step = t_cnf_end - t_cnf_start
 
         # --- Scrittura DIMACS ---
-        dimacs_path = os.path.join(exp_dir_full, f"exp_{exp_id}_full_step{step}.cnf")
-        gen.write_dimacs(dimacs_path)
+        if write_cnf or stream_cnf:
+            gen.write_dimacs(dimacs_path, workers=dimacs_workers)
 
         # --- SAT solving ---
         t_sat_start = time.time()
-        res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen)
+        res = solve_dimacs_file(dimacs_path, timeout_seconds=timeout, cnf_gen=gen, core_groups=unsat_core,
+                                portfolio=portfolio)
         t_sat_end = time.time()
         sat_time_step = t_sat_end - t_sat_start
 
@@ -237,6 +348,13 @@ def run_experiment(cfg):
             forced_assignments_full.update(step_solution)
             print(f"[SUCCESS] SAT trovato allo step {step} FULL")
 
+        step_encoding_stats = {"domain_stats": gen.domain_stats, "dimacs_write": gen.write_stats}
+        step_backtracking = {"backtracks": 0, "solver_calls": 0}
+        warm = record_warm_start(res, gen, forced_assignments_full, step_backtracking)
+        if warm:
+            step_encoding_stats["warm_start"] = warm
+            step_encoding_stats["backtracking"] = step_backtracking
+
         all_step_results_full.append({
             "step": step,
             "num_nodes": len(G_sub.nodes()),
@@ -244,7 +362,11 @@ def run_experiment(cfg):
             "num_clauses": num_clauses_step,
             "time_cnf": time_cnf_step,
             "time_sat": sat_time_step,
-            "solution": step_solution
+            "solution": step_solution,
+            "reject_reasons": [],
+            "encoding_stats": step_encoding_stats,
+            "unsat_core": res.get("unsat_core"),
+            "portfolio_winners": [{"solver": res["solver"]}] if portfolio and res.get("solver") else []
         })
 
     # --- Salvataggio risultati e plot ---
@@ -254,10 +376,14 @@ def run_experiment(cfg):
 
         write_experiment_output(
             exp_id, cfg, G_log_txt, G_phys_txt,
-            res["num_vars"], res["num_clauses"], "pairwise",
-            "glucose", res["time_cnf"], res["time_sat"],
+            res["num_vars"], res["num_clauses"], encoding,
+            solver_name, res["time_cnf"], res["time_sat"],
             "SAT" if res["solution"] else "UNSAT",
             solution=[{"assignment": res["solution"]}] if res["solution"] else None,
+            unsat_clauses=res.get("unsat_core") or None,
+            reject_reasons=res["reject_reasons"],
+            encoding_stats=res["encoding_stats"],
+            portfolio_winners=res.get("portfolio_winners") or None,
             output_dir=step_dir
         )
 
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+
+DEFAULT_CACHE_DIR = ".graph_cache"
+MEMORY_ENTRIES = 32     # grafi derivati (sottografi degli step) tenuti solo in memoria
+
+_file_digests = {}      # (path, mtime, size) -> sha256 del contenuto
+_memory = OrderedDict()  # digest -> GraphInvariants
+
+
+# -------------------------
+# Chiavi
+# -------------------------
+def file_digest(path):
+    """sha256 del contenuto del file (ricalcolato solo se cambiano mtime o dimensione)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    if key not in _file_digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _file_digests[key] = h.hexdigest()
+    return _file_digests[key]
+
+
+def graph_digest(G):
+    """sha256 di nodi e archi nell'ordine di iterazione (l'ordine decide center()[0])."""
+    h = hashlib.sha256()
+    h.update(repr(list(G.nodes())).encode())
+    h.update(repr(list(G.edges())).encode())
+    return h.hexdigest()
+
+
+def _atomic_write(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def attach(G, path, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Lega G (letto da path) alla voce della cache su disco indicizzata dal contenuto del
+    file. Se il file è cambiato dall'ultima volta la voce vecchia viene cancellata.
+    cache_dir None / false: invarianti solo in memoria.
+    """
+    digest = file_digest(path)
+    cache_dir = os.path.abspath(cache_dir) if cache_dir else None   # i worker del pool ricevono G in pickle
+    G.graph["invariants"] = {"digest": digest, "cache_dir": cache_dir,
+                             "size": (G.number_of_nodes(), G.number_of_edges())}
+    if not cache_dir:
+        return G
+    os.makedirs(cache_dir, exist_ok=True)
+    index_path = os.path.join(cache_dir, "index.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    key = os.path.abspath(path)
+    old = index.get(key)
+    index[key] = digest
+    if old and old != digest and old not in index.values():
+        shutil.rmtree(os.path.join(cache_dir, old), ignore_errors=True)
+        print(f"[INFO] Cache invarianti: {path} modificato, voce {old[:12]} invalidata")
+    _atomic_write(index_path, lambda f: f.write(json.dumps(index, indent=1).encode()))
+    return G
+
+
+def invariants(G):
+    """
+    Invarianti di G: dalla cache su disco se G è stato letto con attach, altrimenti
+    (sottografi, grafi JSON) da una cache in memoria indicizzata dal contenuto.
+    Copie e viste di sottografo condividono G.graph con il padre: la chiave di attach vale
+    solo se le dimensioni coincidono, e G.graph non viene mai modificato qui.
+    """
+    meta = G.graph.get("invariants")
+    if not meta or tuple(meta["size"]) != (G.number_of_nodes(), G.number_of_edges()):
+        meta = {"digest": graph_digest(G), "cache_dir": None}
+    inv = _memory.get(meta["digest"])
+    if inv is None:
+        inv = GraphInvariants(G, meta["digest"], meta["cache_dir"])
+        _memory[meta["digest"]] = inv
+        if len(_memory) > MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+    else:
+        _memory.move_to_end(meta["digest"])
+    return inv
+
+
+# -------------------------
+# Distanze
+# -------------------------
+def all_pairs_bfs(indptr, indices, dtype=np.uint8):
+    """
+    Distanze tra tutte le coppie con BFS bit-parallele sul CSR: 64 sorgenti per volta,
+    la frontiera è un bitset uint64 per nodo e un livello è un OR segmentato sugli archi
+    (reduceat). Il massimo di dtype è riservato ai non raggiungibili; ritorna None se
+    una distanza non ci sta.
+    """
+    n = len(indptr) - 1
+    unreachable = np.iinfo(dtype).max
+    dist = np.full((n, n), unreachable, dtype=dtype)
+    has_edges = np.diff(indptr) > 0
+    starts = indptr[:-1][has_edges]
+    for lo in range(0, n, 64):
+        width = min(64, n - lo)
+        block = dist[lo:lo + width]
+        block[np.arange(width), np.arange(lo, lo + width)] = 0
+        frontier = np.zeros(n, dtype="<u8")
+        frontier[lo:lo + width] = np.left_shift(np.uint64(1), np.arange(width, dtype=np.uint64))
+        visited = frontier.copy()
+        level = 0
+        while True:
+            reached = np.zeros(n, dtype="<u8")
+            if len(starts):
+                reached[has_edges] = np.bitwise_or.reduceat(frontier[indices], starts)
+            frontier = reached & ~visited
+            if not frontier.any():
+                break
+            level += 1
+            if level >= unreachable:
+                return None
+            visited |= frontier
+            # bit k di frontier[v]: v è a distanza level dalla sorgente lo + k
+            hit = np.unpackbits(frontier.view(np.uint8).reshape(n, 8), axis=1, bitorder="little")
+            block[hit[:, :width].T.view(bool)] = level
+    return dist
+
+
+# -------------------------
+# Invarianti
+# -------------------------
+class GraphInvariants:
+    """
+    Invarianti di un grafo calcolati al primo uso e salvati in cache_dir/<digest>/:
+    eccentricità, centro, gradi, core number, componenti connesse, adiacenza CSR e
+    matrice delle distanze (righe e colonne nell'ordine di nodes, unreachable se non
+    raggiungibile; dalla cache su disco viene letta in memory-map).
+    """
+
+    def __init__(self, G, digest, cache_dir=None):
+        self.G = G
+        self.digest = digest
+        self.dir = os.path.join(cache_dir, digest) if cache_dir else None
+        self.nodes = list(G.nodes())
+        self.index = {v: k for k, v in enumerate(self.nodes)}
+        self._values = {}
+        if self.dir and self._load("nodes") != self.nodes:
+            # Voce assente o di un grafo letto diversamente: si riparte da zero
+            shutil.rmtree(self.dir, ignore_errors=True)
+            os.makedirs(self.dir, exist_ok=True)
+            self._store("nodes", self.nodes)
+
+    def _path(self, name):
+        return os.path.join(self.dir, f"{name}.npy" if name == "distances" else f"{name}.pkl")
+
+    def _load(self, name):
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            if name == "distances":
+                return np.load(path, mmap_mode="r")
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _store(self, name, value):
+        if not self.dir:
+            return
+        if name == "distances":
+            _atomic_write(self._path(name), lambda f: np.save(f, value))
+        else:
+            _atomic_write(self._path(name), lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _get(self, name, compute):
+        if name not in self._values:
+            value = self._load(name) if self.dir else None
+            if value is None:
+                value = compute()
+                self._store(name, value)
+                if name == "distances" and self.dir:
+                    mapped = self._load(name)   # memory-mapped come nelle esecuzioni successive
+                    value = value if mapped is None else mapped
+            self._values[name] = value
+        return self._values[name]
+
+    # -------------------------
+    @property
+    def csr(self):
+        """Adiacenza CSR (indptr, indices) con i nodi numerati nell'ordine di nodes."""
+        def compute():
+            adj = self.G.adj
+            indptr = np.zeros(len(self.nodes) + 1, dtype=np.int64)
+            np.cumsum([len(adj[v]) for v in self.nodes], out=indptr[1:])
+            indices = np.fromiter((self.index[u] for v in self.nodes for u in adj[v]),
+                                  dtype=np.int64, count=int(indptr[-1]))
+            return indptr, indices
+        return self._get("csr", compute)
+
+    @property
+    def distances(self):
+        """Matrice n x n delle distanze (uint8 se il diametro lo consente), memory-mapped dalla cache."""
+        def compute():
+            indptr, indices = self.csr
+            for dtype in (np.uint8, np.uint16, np.uint32):
+                dist = all_pairs_bfs(indptr, indices, dtype)
+                if dist is not None:
+                    return dist
+        return self._get("distances", compute)
+
+    @property
+    def unreachable(self):
+        return np.iinfo(self.distances.dtype).max
+
+    def ball(self, v, radius=None):
+        """Indici (nell'ordine di nodes) dei nodi raggiungibili da v entro radius: una maschera sulla riga."""
+        row = self.distances[self.index[v]]
+        return np.flatnonzero(row <= (self.unreachable - 1 if radius is None else radius))
+
+    def distances_from(self, v, cutoff=None):
+        """{nodo: distanza da v} per i nodi raggiungibili (entro cutoff), come single_source_shortest_path_length."""
+        idx = self.ball(v, cutoff)
+        return dict(zip(map(self.nodes.__getitem__, idx.tolist()), self.distances[self.index[v], idx].tolist()))
+
+    @property
+    def eccentricity(self):
+        def compute():
+            dist = self.distances
+            if len(self.nodes) and (dist == self.unreachable).any():
+                raise nx.NetworkXError("Found infinite path length because the graph is not connected")
+            return dict(zip(self.nodes, (int(e) for e in dist.max(axis=1, initial=0))))
+        return self._get("eccentricity", compute)
+
+    @property
+    def center(self):
+        """Come nx.center: nodi di eccentricità minima nell'ordine di G."""
+        def compute():
+            ecc = self.eccentricity
+            radius = min(ecc.values())
+            return [v for v in self.nodes if ecc[v] == radius]
+        return self._get("center", compute)
+
+    @property
+    def degrees(self):
+        return self._get("degrees", lambda: dict(self.G.degree()))
+
+    @property
+    def degree_sequence(self):
+        """Gradi in ordine non crescente."""
+        return self._get("degree_sequence", lambda: sorted(self.degrees.values(), reverse=True))
+
+    @property
+    def core_number(self):
+        return self._get("core_number", lambda: nx.core_number(self.G))
+
+    @property
+    def components(self):
+        """Componenti connesse (insiemi) nell'ordine di nx.connected_components."""
+        return self._get("components", lambda: list(nx.connected_components(self.G)))
+
+    @property
+    def largest_component(self):
+        return max(self.components, key=len)
+
+    @property
+    def is_connected(self):
+        return len(self.components) == 1
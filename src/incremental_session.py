@@ -0,0 +1,258 @@
+import os
+import threading
+import time
+
+import networkx as nx
+from pysat.solvers import Solver
+
+from clause_blocks import iter_edge_consistency_blocks, iter_edge_support_clauses
+from clause_store import ClauseStore
+from cnf_generator_incremental import CNFGenerator
+from solver_interface import (interrupter, resolve_portfolio, relax_hints, set_hint_phases, solve_assuming,
+                              DEFAULT_SOLVER)
+from solver_pool import get_pool
+
+
+class IncrementalSession:
+    """
+    Formula persistente tra gli step BFS, con un solo solver pysat incrementale.
+    Domini, palla e centro sono quelli del grafo logico completo, calcolati una volta
+    dal generatore: ogni step è un sottoinsieme delle clausole del problema finale (un
+    suo rilassamento) e l'ultimo step è la formula risolta da zero. A ogni step si
+    aggiungono solo le variabili e le clausole dei nodi e degli archi logici nuovi.
+    """
+
+    def __init__(self, gen, member, warm_start="assumptions", backtracking=False):
+        self.gen = gen
+        self.member = member
+        self.warm_start = warm_start    # phases | assumptions (hard non ha senso: unitarie permanenti)
+        self.backtracking = backtracking
+        self.solver = Solver(name=member["solver"], use_timer=True)
+        self.nodes = set()
+        # Mutual exclusion a gruppi: per nodo fisico un letterale per step ("a occupato
+        # da un nodo aggiunto allo step s"), in AMO pairwise con quelli degli step precedenti
+        self.groups = {a: [] for a in gen.physical_nodes}
+        self.num_clauses = 0
+        self.dead = False   # UNSAT senza assumption: resta UNSAT a ogni step successivo
+
+    # -------------------------
+    def extend(self, step_nodes):
+        """Aggiunge nodi e archi nuovi dello step; ritorna (nodi aggiunti, clausole aggiunte)."""
+        gen = self.gen
+        new = [i for i in gen.logical_nodes if i in step_nodes and i not in self.nodes]
+        new_set = set(new)
+        self.nodes.update(new)
+        gen.clauses = ClauseStore()     # solo l'incremento: la memoria non cresce con gli step
+
+        for i in new:
+            lits = [gen.x(i, a) for a in gen.domains[i]]
+            if lits:
+                gen.add_clause(lits, "at_least_one")
+            gen.add_at_most_one(lits, gen.card_encoding["exactly_one"], "at_most_one")
+
+        enc = gen.card_encoding["mutual_exclusion"]
+        for a in gen.physical_nodes:
+            lits = [gen.x(i, a) for i in gen.phys_domains[a] if i in new_set]
+            if not lits:
+                continue
+            gen.add_at_most_one(lits, enc, "mutual_exclusion")
+            if len(lits) == 1:
+                group = lits[0]
+            else:
+                gen.num_vars += 1
+                group = gen.num_vars
+                for lit in lits:
+                    gen.add_clause([-lit, group], "mutual_exclusion")
+            for prev in self.groups[a]:
+                gen.add_clause([-group, -prev], "mutual_exclusion")
+            self.groups[a].append(group)
+
+        G_new = nx.Graph()
+        G_new.add_edges_from((u, v) for u, v in gen.G_log.edges()
+                             if (u in new_set or v in new_set) and u in self.nodes and v in self.nodes)
+        if gen.encoding == "support":
+            for lits in iter_edge_support_clauses(G_new, gen.G_phys, gen.logical_nodes,
+                                                  gen.physical_nodes, gen.var_matrix):
+                gen.add_clause(lits, "edge_support")
+        else:
+            # Mutual exclusion a gruppi: le coppie a == b non sono coperte, vanno generate
+            for block in iter_edge_consistency_blocks(G_new, gen.G_phys, gen.logical_nodes,
+                                                      gen.physical_nodes, gen.var_matrix):
+                gen.add_clause_block(block, "edge_consistency")
+
+        if gen.logical_center in new_set and gen.center_node is not None:
+            gen.add_clause([gen.x(gen.logical_center, gen.center_node)], "center_mapping")
+
+        for clause in gen.clauses:
+            self.solver.add_clause(clause)
+        added = len(gen.clauses)
+        self.num_clauses += added
+        return len(new), added
+
+    def solve(self, assumptions, timeout, ctl):
+        """True / False / None (timeout dello step o cancellazione del job)."""
+        interrupt = interrupter(self.solver)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, interrupt)
+            timer.daemon = True
+            timer.start()
+        ctl.on_cancel(interrupt)
+        try:
+            sat = solve_assuming(self.solver, assumptions)
+        finally:
+            ctl.on_cancel(None)
+            if timer is not None:
+                timer.cancel()
+        if sat is None:
+            try:
+                self.solver.clear_interrupt()
+            except NotImplementedError:
+                pass
+        return sat
+
+    def solution(self, model):
+        inv = self.gen.inv_var_map
+        return {
+            i: a for lit in model if lit > 0
+            for entry in [inv.get(lit)] if entry
+            for i, a in [entry] if i in self.nodes
+        }
+
+    def step(self, step_nodes, previous, timeout, ctl):
+        """
+        Estende la formula e risolve con gli assegnamenti dello step precedente come
+        polarità preferite e, con warm_start assumptions, come assumption: se UNSAT si
+        ritirano solo quelle nel core (la risposta dello step è quindi esatta).
+        """
+        gen = self.gen
+        t0 = time.time()
+        added_nodes, added_clauses = self.extend(step_nodes)
+        out = {"time_cnf": time.time() - t0, "added_nodes": added_nodes, "added_clauses": added_clauses,
+               "solution": None}
+
+        hints = [gen.var_map[(i, a)] for i, a in previous.items()
+                 if i in self.nodes and (i, a) in gen.var_map]
+        set_hint_phases(self.solver, hints, self.member["solver"])
+        t0 = time.time()
+        sat, model, relaxed, stats = relax_hints(lambda a: self.solve(a, timeout, ctl), self.solver, [],
+                                                 hints if self.warm_start == "assumptions" else [],
+                                                 minimize=self.backtracking)
+        out["time_sat"] = time.time() - t0
+        out.update(stats, hints=len(hints), relaxed=[gen.inv_var_map[l] for l in relaxed])
+        out["status"] = {True: "SAT", False: "UNSAT", None: "UNKNOWN"}[sat]
+        if sat:
+            out["solution"] = self.solution(model)
+        elif sat is False:
+            self.dead = True
+        return out
+
+    def delete(self):
+        self.solver.delete()
+
+
+# -------------------------
+# Job del pool: tutti gli step nello stesso worker
+# -------------------------
+def _steps_job(payload, ctl):
+    """
+    Eseguito in un worker del pool: una sessione per centro fisico (creata al primo
+    tentativo e poi riusata), gli step BFS in ordine; a ogni step i centri sono provati
+    in ordine fino al primo SAT, come nel runner non persistente.
+    """
+    sessions = {}
+    steps = []
+    previous = {}
+    try:
+        for step, step_nodes in enumerate(payload["steps"]):
+            step_nodes = set(step_nodes)
+            out = {"step": step, "num_nodes": len(step_nodes), "num_vars": 0, "num_clauses": 0,
+                   "time_cnf": 0.0, "time_sat": 0.0, "solution": None, "reduced_file": None,
+                   "reject_reasons": [], "encoding_stats": None, "unsat_core": [], "portfolio_winners": []}
+            attempts = []
+            for center in payload["centers"]:
+                if ctl.cancelled:
+                    return {"steps": steps}
+                session = sessions.get(center)
+                if session is None:
+                    t0 = time.time()
+                    suffix = "" if center is None else f"_center{center}"
+                    gen = CNFGenerator(**payload["gen_kwargs"], exp_dir=payload["exp_dir"],
+                                       exp_id=f"{payload['exp_id']}{suffix}",
+                                       skip_reduction=center is None, physical_center=center)
+                    out["time_cnf"] += time.time() - t0
+                    session = IncrementalSession(gen, payload["member"], payload["warm_start"],
+                                                 payload["backtracking"]) if gen.embeddable else gen.reject_reasons
+                    sessions[center] = session
+                label = "grafo completo" if center is None else f"centro {center}"
+                if not isinstance(session, IncrementalSession):
+                    out["reject_reasons"].extend(f"{label}: {r}" for r in session)
+                    continue
+                if session.dead:
+                    out["reject_reasons"].append(f"{label}: UNSAT a uno step precedente")
+                    continue
+
+                res = session.step(step_nodes, previous, payload["timeout"], ctl)
+                out["time_cnf"] += res.pop("time_cnf")
+                out["time_sat"] += res["time_sat"]
+                out["num_vars"] = session.gen.num_vars
+                out["num_clauses"] = session.num_clauses
+                out["encoding_stats"] = {"domain_stats": session.gen.domain_stats}
+                solution = res.pop("solution")
+                attempts.append(dict(res, center=center))
+                if solution is not None:
+                    out["solution"] = solution
+                    if center is not None:
+                        out["reduced_file"] = os.path.join(payload["exp_dir"],
+                                                          f"reduced_physical_{session.gen.exp_id}.json")
+                    previous = solution
+                    print(f"[SUCCESS] SAT trovato allo step {step} ({label}, solver persistente)")
+                    break
+            if out["encoding_stats"] is not None:
+                out["encoding_stats"]["incremental"] = attempts
+                out["encoding_stats"]["backtracking"] = {
+                    "backtracks": sum(a["backtracks"] for a in attempts),
+                    "solver_calls": sum(a["solver_calls"] for a in attempts),
+                }
+            steps.append(out)
+        return {"steps": steps}
+    finally:
+        for session in sessions.values():
+            if isinstance(session, IncrementalSession):
+                session.delete()
+
+
+def solve_steps_persistent(G_log, steps, centers, gen_kwargs, exp_dir, exp_id, options, timeout=None,
+                           warm_start=None, backtracking=False):
+    """
+    Variante persistente del runner incrementale: tutti gli step BFS (liste di nodi
+    logici) su un solver pysat incrementale per centro fisico, in un solo job del pool.
+    centers: centri fisici candidati (variante ridotta) oppure [None] (grafo completo).
+    timeout è il limite di ogni singola risoluzione (richiede un solver con interrupt).
+    warm_start: phases | assumptions (default) per la soluzione dello step precedente;
+    backtracking: assegnamenti ritirati ridotti a un insieme minimale (vedi relax_hints).
+
+    Ritorna la lista dei risultati per step, nel formato di all_step_results.
+    """
+    members = resolve_portfolio(options.get("portfolio"))
+    if len(members) > 1:
+        print("[WARN] Solver persistente: niente portfolio, si usa il primo solver della lista")
+    member = members[0] if members else {"solver": DEFAULT_SOLVER, "phase": None, "seed": 0}
+    warm_start = warm_start or "assumptions"
+    if warm_start not in ("phases", "assumptions"):
+        raise ValueError(f"Solver persistente: warm_start {warm_start} non ammesso (phases | assumptions)")
+    if backtracking and warm_start != "assumptions":
+        raise ValueError("backtracking richiede warm_start assumptions")
+    if options.get("unsat_core"):
+        print("[WARN] Solver persistente: unsat_core non supportato, ignorato")
+    if options.get("write_cnf") or options.get("stream_cnf"):
+        print("[INFO] Solver persistente: nessun DIMACS scritto, le clausole vanno direttamente al solver")
+
+    payload = {"steps": [sorted(s) for s in steps], "centers": list(centers),
+               "gen_kwargs": dict(gen_kwargs, G_log=G_log), "exp_dir": exp_dir, "exp_id": exp_id,
+               "member": member, "timeout": timeout, "warm_start": warm_start,
+               "backtracking": backtracking}
+    res = get_pool().run(_steps_job, payload)
+    if res["status"] != "ok":
+        print(f"[WARN] Solver persistente: {res['error']}")
+    return (res["result"] or {}).get("steps") or []
@@ -7,7 +7,9 @@ def write_experiment_output(exp_id, config, logical_graph, physical_graph,
                             num_vars, num_clauses, encoding_type,
                             solver_name, time_cnf, time_sat, status,
                             solution=None, solver_error=None,
-                            unsat_clauses=None, output_dir="outputs"):
+                            unsat_clauses=None, reject_reasons=None,
+                            encoding_stats=None, solver_resources=None, portfolio_winners=None,
+                            center_effort=None, output_dir="outputs"):
     ensure_dir(output_dir)
 
     # ----------------------------
@@ -42,6 +44,26 @@ def write_experiment_output(exp_id, config, logical_graph, physical_graph,
     if solver_error is not None:
         out["solver"]["error"] = solver_error
 
+    # Statistiche aggiuntive dell'encoding (es. variabili eliminate dai filtri di dominio)
+    if encoding_stats:
+        out["sat_encoding"].update(encoding_stats)
+
+    # Risorse del solver esterno (tempo CPU/wall, RSS di picco, exit code, limiti)
+    if solver_resources:
+        out["solver"]["resources"] = solver_resources
+
+    # Portfolio pysat: solver vincente per ogni istanza risolta
+    if portfolio_winners:
+        out["solver"]["portfolio_winners"] = portfolio_winners
+
+    # Round robin tra centri: giri, conflitti, propagazioni e tempo spesi per centro
+    if center_effort:
+        out["solver"]["center_effort"] = center_effort
+
+    # Motivi di rigetto del precheck (istanza decisa senza chiamare il solver)
+    if reject_reasons:
+        out["solver"]["reject_reasons"] = list(reject_reasons)
+
     # Prepare unsat list (expected as list[dict])
     unsat_list = unsat_clauses if unsat_clauses is not None else None
 
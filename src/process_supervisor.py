@@ -0,0 +1,157 @@
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from dimacs_io import open_compressed
+
+try:
+    import resource
+except ImportError:  # Windows: niente rlimit / rusage
+    resource = None
+
+# Limiti per esperimento (solver_limits in config.yaml)
+LIMIT_KEYS = ("memory_mb", "cpu_seconds")
+
+
+def validate_limits(limits):
+    limits = dict(limits or {})
+    unknown = set(limits) - set(LIMIT_KEYS)
+    if unknown:
+        raise ValueError(f"Limiti solver sconosciuti: {sorted(unknown)} (ammessi: {', '.join(LIMIT_KEYS)})")
+    return {k: v for k, v in limits.items() if v}
+
+
+def _apply_limits(pid, limits):
+    # prlimit sul figlio appena creato: evita preexec_fn, non sicuro con i thread del worker
+    if not limits or resource is None or not hasattr(resource, "prlimit"):
+        return
+    if "memory_mb" in limits:
+        nbytes = int(limits["memory_mb"]) * 1024 * 1024
+        resource.prlimit(pid, resource.RLIMIT_AS, (nbytes, nbytes))
+    if "cpu_seconds" in limits:
+        # soft -> SIGXCPU, hard poco dopo -> SIGKILL
+        cpu = int(limits["cpu_seconds"])
+        resource.prlimit(pid, resource.RLIMIT_CPU, (cpu, cpu + 5))
+
+
+def _kill_group(proc):
+    """Uccide il solver e tutti i processi del suo gruppo (thread e figli compresi)."""
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+    else:
+        proc.kill()
+
+
+def _wait(proc):
+    """Attende il solver; con wait4 raccoglie anche il suo rusage (tutti i thread)."""
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+def _feed_stdin(feed, stdin):
+    try:
+        feed(stdin)
+    except BrokenPipeError:
+        pass    # il solver ha chiuso lo stdin (es. terminato)
+    finally:
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def file_feeder(dimacs_path):
+    """Feeder che decomprime al volo un DIMACS (anche .gz/.xz/.zst) sullo stdin."""
+    def feed(stdin):
+        with open_compressed(dimacs_path, "rb") as f:
+            shutil.copyfileobj(f, stdin, 1 << 20)
+    return feed
+
+
+def run_supervised(cmd, ctl, stdin_path=None, limits=None, stdin_feed=None, on_line=None):
+    """
+    Lancia un solver esterno nel suo process group (Windows: nuovo gruppo di console).
+    Alla cancellazione (ctl, vedi solver_pool.JobControl) viene ucciso l'intero gruppo;
+    a fine esecuzione si eliminano anche eventuali figli rimasti.
+    stdin_path: DIMACS (anche compresso) da decomprimere al volo sullo stdin del solver.
+    stdin_feed: in alternativa, funzione feed(stdin) che scrive il CNF (da un thread a parte).
+    on_line:    se dato, lo stdout è passato riga per riga a on_line(str) senza essere
+                accumulato, e stdout ritornato è None.
+
+    Ritorna (stdout, stderr, resources) con resources = tempi wall/CPU, RSS di picco,
+    exit code e limiti applicati.
+    """
+    limits = validate_limits(limits)
+    if stdin_path is not None:
+        stdin_feed = file_feeder(stdin_path)
+    group_kw = {"start_new_session": True} if os.name == "posix" else \
+        {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+    with tempfile.TemporaryFile() as err_file:
+        start = time.time()
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if stdin_feed else subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=err_file, **group_kw)
+        try:
+            _apply_limits(proc.pid, limits)
+        except OSError:
+            _kill_group(proc)
+            raise
+        ctl.on_cancel(lambda: _kill_group(proc))
+        feeder = None
+        if stdin_feed:
+            feeder = threading.Thread(target=_feed_stdin, args=(stdin_feed, proc.stdin), daemon=True)
+            feeder.start()
+        try:
+            if on_line is None:
+                out = proc.stdout.read().decode(errors="replace")
+            else:
+                out = None
+                for raw in proc.stdout:
+                    on_line(raw.decode(errors="replace"))
+            usage = _wait(proc)
+        finally:
+            ctl.on_cancel(None)
+            _kill_group(proc)
+        wall = time.time() - start
+        if feeder is not None:
+            feeder.join()
+        err_file.seek(0)
+        err = err_file.read().decode(errors="replace")
+
+    resources = {"wall_time": wall, "exit_code": proc.returncode, "limits": limits or None}
+    if usage is not None:
+        # ru_maxrss: KB su Linux, byte su macOS
+        rss_kb = usage.ru_maxrss / 1024 if os.uname().sysname == "Darwin" else usage.ru_maxrss
+        resources.update({
+            "cpu_user": usage.ru_utime,
+            "cpu_sys": usage.ru_stime,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "max_rss_mb": rss_kb / 1024,
+        })
+    return out, err, resources
+
+
+def limit_exceeded(resources):
+    """Motivo leggibile se il solver è stato fermato da un rlimit, altrimenti None."""
+    limits = resources.get("limits") or {}
+    if resource is None or not limits:
+        return None
+    code = resources.get("exit_code")
+    if "cpu_seconds" in limits and code in (-signal.SIGXCPU, -signal.SIGKILL) \
+            and resources.get("cpu_time", 0) >= limits["cpu_seconds"]:
+        return f"Limite CPU superato ({limits['cpu_seconds']}s)"
+    # 10 / 20: codici di uscita standard SAT / UNSAT
+    if "memory_mb" in limits and code not in (None, 0, 10, 20):
+        return f"Solver terminato con codice {code} (limite memoria {limits['memory_mb']} MB)"
+    return None
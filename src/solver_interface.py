@@ -1,117 +1,318 @@
-import multiprocessing as mp
-import time
-import traceback
-from pysat.solvers import Glucose4
-from pysat.formula import CNF
+import random
 
-def _solve_process(dimacs_path, cnf_gen, assumptions, return_dict):
+from pysat.solvers import Solver, SolverNames
+from dimacs_io import read_dimacs, read_clause_types, clause_types_path
+from core_groups import CoreGroups, resolve_core_grouping
+from solver_pool import get_pool
+
+# Ogni quante clausole aggiunte si controlla una cancellazione
+_CANCEL_CHECK = 1 << 16
+
+DEFAULT_SOLVER = "glucose4"
+PHASES = ("pos", "neg", "random")
+
+
+def resolve_portfolio(portfolio):
+    """
+    Normalizza la lista portfolio di config.yaml: ogni membro è un nome pysat
+    (es. "cadical153") oppure {solver, phase: pos | neg | random, seed}.
+    None / lista vuota: solo Glucose4, nessuna gara.
+    """
+    members = []
+    for entry in portfolio or []:
+        entry = {"solver": entry} if isinstance(entry, str) else dict(entry)
+        name = entry.get("solver", DEFAULT_SOLVER)
+        if not hasattr(SolverNames, name):
+            known = sorted(k for k in vars(SolverNames) if not k.startswith("_"))
+            raise ValueError(f"Solver pysat sconosciuto: {name} (ammessi: {', '.join(known)})")
+        phase = entry.get("phase")
+        if phase is not None and phase not in PHASES:
+            raise ValueError(f"Fase non supportata: {phase} (ammesse: {', '.join(PHASES)})")
+        members.append({"solver": name, "phase": phase, "seed": entry.get("seed", 0)})
+    return members
+
+
+def _member_label(member):
+    label = member["solver"]
+    if member["phase"]:
+        label += f"/{member['phase']}"
+        if member["phase"] == "random":
+            label += f"/{member['seed']}"
+    return label
+
+
+def _set_phases(solver, member, num_vars):
+    # Polarità iniziale: diversifica membri dello stesso solver
+    phase = member["phase"]
+    if phase is None:
+        return
+    if phase == "random":
+        rnd = random.Random(member["seed"])
+        lits = [v if rnd.random() < 0.5 else -v for v in range(1, num_vars + 1)]
+    else:
+        lits = list(range(1, num_vars + 1)) if phase == "pos" else list(range(-1, -num_vars - 1, -1))
     try:
-        cnf = CNF(from_file=dimacs_path)
-        solver = Glucose4(use_timer=True)
-
-        # Aggiungo le clausole AND condizionali sugli assumption
-        for idx, clause in enumerate(cnf_gen.clauses):
-            aux_lit = cnf_gen.num_vars + idx + 1
-            # (¬a_i ∨ C_i)
-            solver.add_clause([-aux_lit] + clause)
-       
-        # Ritorna true se SAT, False se UNSAT
-        sat = solver.solve(assumptions=assumptions)
-
-        model = solver.get_model() if sat else None
-        core = None
-        if not sat:
-            print("Sei nella parte UNSAT")
-            core = solver.get_core()
-            print(model, len(core))
+        solver.set_phases(lits)
+    except NotImplementedError:
+        print(f"[WARN] {member['solver']}: set_phases non supportato, fase ignorata")
 
-        solver.delete()
 
-        return_dict["status"] = sat
-        return_dict["model"] = model
-        return_dict["core"] = core
-        return_dict["error"] = None
+def set_hint_phases(solver, lits, label):
+    """Polarità preferite (warm start): il solver le segue ma può cambiarle."""
+    if not lits:
+        return
+    try:
+        solver.set_phases(lits)
+    except NotImplementedError:
+        print(f"[WARN] {label}: set_phases non supportato, warm start ignorato")
+
+
+def solve_assuming(solver, assumptions):
+    # True se SAT, False se UNSAT, None se interrotto
+    try:
+        return solver.solve_limited(assumptions=assumptions, expect_interrupt=True)
+    except NotImplementedError:
+        # Solver senza interrupt (es. Lingeling): alla cancellazione il pool uccide il worker
+        return solver.solve(assumptions=assumptions)
+
 
-    except Exception as e:
-        return_dict["status"] = False
-        return_dict["model"] = None
-        return_dict["core"] = None
-        return_dict["error"] = traceback.format_exc()
+def relax_hints(solve, solver, assumptions, hints, minimize=False):
+    """
+    Controller di backtracking sugli assegnamenti ereditati. Risolve con assumptions +
+    hints (assegnamenti preferiti); se UNSAT e il core delle assumption contiene hint,
+    ritira solo quelli (un backtrack) e risolve di nuovo, finché il risultato è SAT o il
+    core non tocca più gli hint: la risposta è quindi quella della formula senza hint,
+    cioè di una risoluzione da zero. solve(assumptions) esegue la chiamata al solver.
+
+    minimize: a SAT ottenuto riprova a imporre uno alla volta gli hint ritirati e tiene
+    quelli compatibili, così gli assegnamenti ritirati sono un insieme minimale (MCS).
+
+    Ritorna (sat, modello se SAT, hint ritirati, {"backtracks": N, "solver_calls": N}).
+    """
+    hints = list(hints)
+    relaxed = []
+    stats = {"backtracks": 0, "solver_calls": 0}
+
+    def call(lits):
+        stats["solver_calls"] += 1
+        return solve(assumptions + lits)
+
+    while True:
+        sat = call(hints)
+        if sat is not False or not hints:
+            break
+        core = set(solver.get_core() or [])
+        blamed = [h for h in hints if h in core]
+        if not blamed:
+            break
+        stats["backtracks"] += 1
+        print(f"[INFO] Backtrack: {len(blamed)}/{len(hints)} assegnamenti ereditati nel core, ritirati")
+        relaxed.extend(blamed)
+        hints = [h for h in hints if h not in core]
+    model = solver.get_model() if sat else None
+
+    if sat and minimize and relaxed:
+        for h in list(relaxed):
+            again = call(hints + [h])
+            if again is None:
+                break       # interrotto: si tiene l'ultimo modello trovato
+            if again:
+                hints.append(h)
+                relaxed.remove(h)
+                model = solver.get_model()
+        print(f"[INFO] Backtrack minimale: {len(relaxed)} assegnamenti ritirati")
+    return sat, model, relaxed, stats
+
+
+def _in_memory(cnf_gen):
+    return cnf_gen is not None and cnf_gen.clauses is not None
+
+
+def interrupter(solver):
+    def interrupt():
+        try:
+            solver.interrupt()
+        except NotImplementedError:
+            pass    # es. CaDiCaL: alla cancellazione il pool uccide il worker dopo la grace
+    return interrupt
+
+
+def _warm_start(cnf_gen):
+    # Solo il generatore incrementale ha un warm start morbido (phases / assumptions)
+    mode = getattr(cnf_gen, "warm_start", "hard")
+    if mode == "hard":
+        return None
+    return {"mode": mode, "lits": cnf_gen.warm_start_lits(), "minimize": cnf_gen.backtracking}
+
+
+def job_payload(dimacs_path, cnf_gen, core_grouping, member=None):
+    """
+    Solo ciò che serve al worker: lo ClauseStore (array piatti, serializzazione veloce)
+    oppure il percorso del DIMACS, mai l'intero generatore.
+    """
+    return {
+        "dimacs_path": dimacs_path,
+        "clauses": cnf_gen.clauses if _in_memory(cnf_gen) else None,
+        "num_vars": cnf_gen.num_vars if cnf_gen is not None else None,
+        "var_map": cnf_gen.var_map if core_grouping is not None else None,
+        "core_grouping": core_grouping,
+        "member": member or {"solver": DEFAULT_SOLVER, "phase": None, "seed": 0},
+        "warm_start": _warm_start(cnf_gen),
+    }
 
 
-def solve_dimacs_file(dimacs_path, timeout_seconds=None, cnf_gen=None):
+def load_solver(payload, ctl):
     """
-    Risolve un file DIMACS con timeout funzionante su Windows.
-    Usa assumptions per UNSAT core.
+    Crea il solver pysat del payload e vi carica la formula, con i selettori di gruppo
+    se è richiesto l'UNSAT core. Ritorna (solver, groups, assumptions), oppure None se il
+    job è stato cancellato durante il caricamento (solver già eliminato).
     """
-    manager = mp.Manager()
-    return_dict = manager.dict()
+    clauses = payload["clauses"]
+    num_vars = payload["num_vars"]
+    if clauses is None:
+        # Generatore in streaming o nessun generatore: il file ha le clausole nello stesso ordine
+        cnf = read_dimacs(payload["dimacs_path"])  # anche .gz/.xz/.zst
+        clauses, num_vars = cnf.clauses, num_vars or cnf.nv
+    core_grouping = payload["core_grouping"]
+    member = payload["member"]
 
-    # Crea assumptions artificiali per ottenere UNSAT core
+    solver = Solver(name=member["solver"], use_timer=True)
+    groups = None
     assumptions = []
-    if cnf_gen:
-        for idx, clause in enumerate(cnf_gen.clauses):
-            aux_lit = cnf_gen.num_vars + idx + 1
-            assumptions.append(aux_lit)
-
-    # Lancia solver in un processo separato
-    p = mp.Process(target=_solve_process, args=(dimacs_path, cnf_gen, assumptions, return_dict))
-    start = time.time()
-    p.start()
-    p.join(timeout_seconds)
-
-    time_elapsed = time.time() - start
-
-    if p.is_alive():
-        # Timeout → kill!
-        p.terminate()
-        p.join()
-        return {
-            "status": "ERROR",
-            "time": time_elapsed,
-            "model": None,
-            "unsat_core": None,
-            "error": "Timeout expired"
-        }
+    if core_grouping is not None:
+        # Un selettore per gruppo: (¬s_g1 ∨ ... ∨ C) per ogni clausola
+        groups = CoreGroups(payload["var_map"], payload["num_vars"], core_grouping)
+        if payload["clauses"] is not None:
+            types = payload["clauses"].types
+        else:
+            types = read_clause_types(clause_types_path(payload["dimacs_path"]))
+    # Nessun core richiesto: formula così com'è, zero overhead
+    for k, clause in enumerate(clauses):
+        if not k % _CANCEL_CHECK and ctl.cancelled:
+            solver.delete()
+            return None
+        solver.add_clause(groups.guard(clause, types[k]) if groups else clause)
+    if groups is not None:
+        assumptions = groups.assumptions()
+    _set_phases(solver, member, num_vars)
+    if payload.get("warm_start"):
+        set_hint_phases(solver, payload["warm_start"]["lits"], member["solver"])
+    return solver, groups, assumptions
+
+
+def solver_result(solver, sat, groups, num_vars, model=None):
+    """
+    Risultato del job: modello senza selettori se SAT, core tradotto in gruppi se UNSAT.
+    model: modello già letto (altrimenti quello dell'ultima chiamata al solver).
+    """
+    if sat and model is None:
+        model = solver.get_model()
+    if model is not None and groups is not None:
+        model = [l for l in model if abs(l) <= num_vars]
+    core = None
+    if sat is False and groups is not None:
+        core = groups.explain(solver.get_core())
+        print(f"[INFO] UNSAT core: {len(core)}/{len(groups.selectors)} gruppi ({groups.grouping})")
+    return {"status": sat, "model": model, "core": core}
+
+
+def pysat_job(payload, ctl):
+    """Eseguito nel worker del pool."""
+    loaded = load_solver(payload, ctl)
+    if loaded is None:
+        return {"status": None}
+    solver, groups, assumptions = loaded
+    warm = payload.get("warm_start")
+    hints = warm["lits"] if warm and warm["mode"] == "assumptions" else []
+    ctl.on_cancel(interrupter(solver))
+    try:
+        sat, model, relaxed, stats = relax_hints(lambda a: solve_assuming(solver, a), solver, assumptions,
+                                                 hints, minimize=bool(warm and warm["minimize"]))
+        out = solver_result(solver, sat, groups, payload["num_vars"], model)
+        if warm:
+            out["warm_start"] = dict(stats, mode=warm["mode"], hints=len(warm["lits"]), relaxed=relaxed)
+        return out
+    finally:
+        ctl.on_cancel(None)
+        solver.delete()
+
+
+def solve_cnf_gen(cnf_gen, timeout_seconds=None, core_groups=None, portfolio=None):
+    """
+    Risolve direttamente le clausole in memoria del generatore, senza passare dal DIMACS
+    (nessuna scrittura, nessun parsing). Stesso formato di ritorno di solve_dimacs_file.
+    """
+    if not _in_memory(cnf_gen):
+        raise ValueError("Il generatore non ha clausole in memoria (modalità streaming): usa solve_dimacs_file")
+    return solve_dimacs_file(None, timeout_seconds=timeout_seconds, cnf_gen=cnf_gen, core_groups=core_groups,
+                             portfolio=portfolio)
+
+
+def solve_dimacs_file(dimacs_path, timeout_seconds=None, cnf_gen=None, core_groups=None, portfolio=None):
+    """
+    Risolve un file DIMACS con timeout funzionante su Windows, su un worker persistente
+    del pool (nessun processo nuovo per chiamata; al timeout si interrompe solo il job).
+    Se cnf_gen ha le clausole in memoria il file non viene riletto.
 
-    # Solver terminato
-    sat_flag = return_dict.get("status")
-    model = return_dict.get("model")
-    error = return_dict.get("error")
-    core = return_dict.get("core")
+    core_groups: None (nessun core, nessun overhead) oppure la granularità dell'UNSAT core
+    ("clause_type", "logical_node", "logical_edge", "physical_node"), con un selettore
+    per gruppo; richiede cnf_gen. In caso di UNSAT unsat_core elenca i gruppi coinvolti.
+
+    portfolio: lista di solver pysat (vedi resolve_portfolio) lanciati in parallelo sulla
+    stessa formula, ognuno nel suo worker: vince la prima risposta SAT/UNSAT, gli altri
+    vengono interrotti. "solver" nel risultato indica il vincitore.
+    """
+    core_grouping = resolve_core_grouping(core_groups)
+    if core_grouping is not None and cnf_gen is None:
+        raise ValueError("L'UNSAT core a gruppi richiede il generatore (cnf_gen)")
+    members = resolve_portfolio(portfolio)
+    if core_grouping is not None and any(m["solver"].startswith("kissat") for m in members):
+        raise ValueError("Kissat (pysat) ignora le assumption: incompatibile con unsat_core")
+    if getattr(cnf_gen, "warm_start", "hard") == "assumptions" and any(m["solver"].startswith("kissat")
+                                                                       for m in members):
+        raise ValueError("Kissat (pysat) ignora le assumption: incompatibile con warm_start assumptions")
+
+    if len(members) > 1:
+        out = get_pool().race(pysat_job, [job_payload(dimacs_path, cnf_gen, core_grouping, m) for m in members],
+                              timeout=timeout_seconds,
+                              accept=lambda o: o["status"] == "ok" and o["result"].get("status") is not None)
+        winner = members[out["index"]] if out["index"] is not None else None
+        if winner is not None:
+            print(f"[INFO] Portfolio: vince {_member_label(winner)} in {out['time']:.2f}s")
+    else:
+        winner = members[0] if members else None
+        out = get_pool().run(pysat_job, job_payload(dimacs_path, cnf_gen, core_grouping, winner),
+                             timeout=timeout_seconds)
+    solver_label = _member_label(winner) if winner else DEFAULT_SOLVER
+    time_elapsed = out["time"]
+    result = out["result"] or {}
 
-    if error:
+    if out["status"] != "ok" or result.get("status") is None:
         return {
             "status": "ERROR",
             "time": time_elapsed,
             "model": None,
             "unsat_core": None,
-            "error": error
+            "solver": None,
+            "error": out["error"] or "Timeout expired"
         }
 
-    if sat_flag:
+    if result["status"]:
         return {
             "status": "SAT",
             "time": time_elapsed,
-            "model": model,
-            "unsat_core": None
+            "model": out["model"].tolist(),
+            "unsat_core": None,
+            "solver": solver_label,
+            "warm_start": result.get("warm_start"),
         }
 
-    else:
-        # UNSAT
-        if core and cnf_gen:
-            # traduci literal aux → indice clausola
-            core_clause_ids = [
-                lit - cnf_gen.num_vars - 1
-                for lit in core
-                if lit > 0
-            ]
-        else:
-            core_clause_ids = None
-
-        return {
-            "status": "UNSAT",
-            "time": time_elapsed,
-            "model": None,
-            "unsat_core": core_clause_ids,
-        }
+    # UNSAT (core già tradotto in gruppi nel worker)
+    return {
+        "status": "UNSAT",
+        "time": time_elapsed,
+        "model": None,
+        "unsat_core": result.get("core"),
+        "solver": solver_label,
+        "warm_start": result.get("warm_start"),
+    }
@@ -1,110 +1,106 @@
-import multiprocessing as mp
-import subprocess
-import time
-import traceback
 import os
 
+from dimacs_io import codec_from_path, dump_dimacs_store
+from process_supervisor import run_supervised, limit_exceeded, validate_limits
+from solver_pool import get_pool
+from solver_registry import resolve_solver, build_command, SolverOutput
 
-def _solve_process(dimacs_path, return_dict, num_threads):
-    try:
-        cmd = [
-            "../../lingeling/plingeling",
-            "-t", str(max(num_threads, 1)),
-            dimacs_path
-        ]
 
-        proc = subprocess.run(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        out = proc.stdout
-        err = proc.stderr
-
-        # stampa prime linee per confermare thread
-        # --- STAMPA TUTTO L'OUTPUT PER DEBUG ---
-        print("Plingeling output (full):")
-        print(out)  # ora vedrai anche la linea c - W ... USING 4 WORKER THREADS
-
-        # --- SAT ---
-        if "s SATISFIABLE" in out:
-            model = []
-            for line in out.splitlines():
-                if line.startswith("v "):
-                    model.extend(
-                        int(x) for x in line.split()[1:]
-                        if x != "0"
-                    )
-
-            return_dict["status"] = True
-            return_dict["model"] = model
-            return_dict["error"] = None
-            return
-
-        # --- UNSAT ---
-        if "s UNSATISFIABLE" in out:
-            return_dict["status"] = False
-            return_dict["model"] = None
-            return_dict["error"] = None
-            return
-
-        # --- UNKNOWN / ERROR ---
-        return_dict["status"] = False
-        return_dict["model"] = None
-        return_dict["error"] = out + "\n" + err
-
-    except Exception:
-        return_dict["status"] = False
-        return_dict["model"] = None
-        return_dict["error"] = traceback.format_exc()
-
-
-def solve_dimacs_file(dimacs_path, timeout_seconds=None, num_threads=None):
-    """
-    Risolve un file DIMACS usando Plingeling (vero multithread).
-    Funziona su Linux e Windows.
-    """
+def job_payload(dimacs_path, cnf_gen, spec, num_threads=None, limits=None, proof_path=None):
     if num_threads is None:
         num_threads = max(os.cpu_count() - 1, 1)
+    if dimacs_path is None and (cnf_gen is None or cnf_gen.clauses is None):
+        raise ValueError("Senza file DIMACS serve un generatore con le clausole in memoria (cnf_gen)")
+    return {
+        "spec": spec,
+        "dimacs_path": dimacs_path,
+        "clauses": cnf_gen.clauses if dimacs_path is None else None,
+        "num_vars": cnf_gen.num_vars if cnf_gen is not None else None,
+        "num_threads": num_threads,
+        "limits": validate_limits(limits),
+        "proof_path": proof_path,
+    }
 
-    manager = mp.Manager()
-    return_dict = manager.dict()
-
-    p = mp.Process(
-        target=_solve_process,
-        args=(dimacs_path, return_dict, num_threads)
-    )
-
-    start = time.time()
-    p.start()
-    p.join(timeout_seconds)
-    elapsed = time.time() - start
-
-    # --- TIMEOUT ---
-    if p.is_alive():
-        p.terminate()
-        p.join()
-        return {
-            "status": "ERROR",
-            "time": elapsed,
-            "model": None,
-            "error": "Timeout expired"
-        }
 
-    # --- ERRORE ---
-    if return_dict.get("error"):
+def external_job(payload, ctl):
+    """
+    Eseguito nel worker del pool: al timeout viene ucciso il process group del solver.
+    L'output è letto riga per riga (modello compreso), mai bufferizzato per intero.
+    """
+    spec = payload["spec"]
+    dimacs_path = payload["dimacs_path"]
+    stdin_path = stdin_feed = None
+    if dimacs_path is None:
+        # CNF dal generatore direttamente sullo stdin, senza passare dal disco
+        clauses, num_vars = payload["clauses"], payload["num_vars"]
+        stdin_feed = lambda stdin: dump_dimacs_store(stdin, num_vars, clauses)
+        input_path = None
+    elif codec_from_path(dimacs_path) is not None:
+        # CNF compresso: lo decomprimiamo al volo sullo stdin del solver
+        stdin_path, input_path = dimacs_path, None
+    else:
+        input_path = dimacs_path
+    cmd = build_command(spec, input_path, payload["num_threads"], payload["proof_path"])
+    print(f"[INFO] Solver {spec['name']}: {' '.join(cmd)}")
+
+    parsed = SolverOutput()
+    _, err, resources = run_supervised(cmd, ctl, stdin_path=stdin_path, stdin_feed=stdin_feed,
+                                       limits=payload["limits"], on_line=parsed.feed)
+
+    if ctl.cancelled:
+        return {"status": None, "resources": resources}
+
+    # --- SAT ---
+    if parsed.status:
+        return {"status": True, "model": parsed.model, "resources": resources}
+
+    # --- UNSAT ---
+    if parsed.status is False:
+        return {"status": False, "resources": resources}
+
+    # --- UNKNOWN / ERROR ---
+    reason = limit_exceeded(resources)
+    return {"status": None, "resources": resources,
+            "error": (reason + "\n" if reason else "") + parsed.text() + "\n" + err}
+
+
+def solve_dimacs_file(dimacs_path, timeout_seconds=None, num_threads=None, limits=None,
+                      solver=None, solvers=None, cnf_gen=None, proof_path=None):
+    """
+    Risolve un file DIMACS con un solver esterno del registro (default Plingeling, vero
+    multithread; vedi solver_registry e la sezione "solvers" di config.yaml).
+    Funziona su Linux e Windows. Il processo viene lanciato da un worker persistente
+    del pool nel suo process group: al timeout si uccide l'intero gruppo, il worker
+    resta disponibile.
+    dimacs_path None: il CNF è generato da cnf_gen (clausole in memoria) direttamente
+            sullo stdin del solver, senza scriverlo su disco.
+    limits: {"memory_mb": ..., "cpu_seconds": ...} applicati come rlimit al solver
+            (cpu_seconds è la CPU totale di tutti i thread).
+    proof_path: file in cui il solver scrive la prova DRAT (se supportata).
+    Il risultato contiene "solver" e "resources": tempo wall/CPU, RSS di picco ed exit code.
+    """
+    spec = resolve_solver(solver, solvers)
+    payload = job_payload(dimacs_path, cnf_gen, spec, num_threads, limits, proof_path)
+    out = get_pool().run(external_job, payload, timeout=timeout_seconds)
+    elapsed = out["time"]
+    result = out["result"] or {}
+
+    # --- TIMEOUT / ERRORE ---
+    if out["status"] != "ok" or result.get("status") is None:
         return {
             "status": "ERROR",
             "time": elapsed,
             "model": None,
-            "error": return_dict["error"]
+            "solver": spec["name"],
+            "resources": result.get("resources"),
+            "error": out["error"] or result.get("error") or "Timeout expired"
         }
 
     # --- RISULTATO ---
     return {
-        "status": "SAT" if return_dict.get("status") else "UNSAT",
+        "status": "SAT" if result["status"] else "UNSAT",
         "time": elapsed,
-        "model": return_dict.get("model")
-    }
\ No newline at end of file
+        "model": out["model"].tolist() if out["model"] is not None else None,
+        "solver": spec["name"],
+        "resources": result.get("resources")
+    }
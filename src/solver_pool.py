@@ -0,0 +1,311 @@
+import atexit
+import multiprocessing as mp
+import multiprocessing.connection as mp_connection
+import os
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+import numpy as np
+
+# Messaggi di controllo sul canale parent -> worker
+_CANCEL = "cancel"
+_STOP = None
+
+# Attesa dopo la richiesta di cancellazione prima di uccidere il worker
+DEFAULT_GRACE = 2.0
+
+
+def _context():
+    # forkserver: i worker partono da un processo pulito (niente stato del runner ereditato);
+    # dove non esiste (Windows) si usa spawn. In entrambi i casi i worker sono persistenti.
+    methods = mp.get_all_start_methods()
+    return mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+# -------------------------
+# Lato worker
+# -------------------------
+class JobControl:
+    """
+    Passato al job: permette di registrare una callback di interruzione
+    (es. solver.interrupt o proc.kill) e di controllare se il job è stato cancellato.
+    La callback è chiamata sotto lock: dopo on_cancel(None) non viene più invocata.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callback = None
+        self.cancelled = False
+
+    def on_cancel(self, callback):
+        with self._lock:
+            self._callback = callback
+            if self.cancelled and callback is not None:
+                callback()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._callback is not None:
+                self._callback()
+
+
+def _send_result(conn, status, result=None, error=None):
+    # Il modello viaggia come int32 grezzo, il resto del risultato con pickle
+    result = dict(result or {})
+    model = result.pop("model", None)
+    header = {"status": status, "result": result, "error": error,
+              "model_len": None if model is None else len(model)}
+    conn.send(header)
+    if model is not None:
+        conn.send_bytes(np.asarray(model, dtype=np.int32).tobytes())
+
+
+def _worker_main(conn):
+    pending = None
+    while True:
+        if pending is not None:
+            msg, pending = pending, None
+        else:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                return
+        if msg is _STOP:
+            return
+        if msg == _CANCEL:
+            continue    # cancellazione arrivata dopo la fine del job
+
+        func, payload = msg
+        ctl = JobControl()
+        done = threading.Event()
+
+        def run_job():
+            try:
+                result = func(payload, ctl)
+                _send_result(conn, "cancelled" if ctl.cancelled else "ok", result)
+            except Exception:
+                _send_result(conn, "error", error=traceback.format_exc())
+            done.set()
+
+        job = threading.Thread(target=run_job, daemon=True)
+        job.start()
+        # Il thread principale resta in ascolto per cancellazioni mentre il job gira
+        while not done.wait(0.01):
+            if not conn.poll(0):
+                continue
+            try:
+                msg = conn.recv()
+            except EOFError:
+                return
+            if msg == _CANCEL:
+                ctl.cancel()
+            elif msg is _STOP:
+                ctl.cancel()
+                job.join()
+                return
+            else:
+                pending = msg   # job successivo inviato appena dopo il risultato
+        job.join()
+
+
+# -------------------------
+# Lato parent
+# -------------------------
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe(duplex=True)
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.proc.start()
+        child_conn.close()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+        except Exception:
+            pass
+        self.proc.join()
+        self.conn.close()
+
+    def stop(self, timeout=1.0):
+        try:
+            self.conn.send(_STOP)
+        except (OSError, BrokenPipeError):
+            pass
+        self.proc.join(timeout)
+        if self.proc.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class SolverPool:
+    """
+    Pool di worker solver persistenti. Ogni run() occupa un worker libero (ne avvia uno
+    nuovo fino a max_workers), invia funzione e payload, attende il risultato entro il
+    timeout. Allo scadere chiede la cancellazione del solo job corrente; il worker viene
+    ucciso e rimpiazzato solo se non risponde entro grace secondi.
+
+    func deve essere una funzione a livello di modulo func(payload, ctl) -> dict;
+    un'eventuale chiave "model" torna come array int32.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._ctx = _context()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._workers) < self.max_workers:
+                worker = _Worker(self._ctx)
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def _release(self, worker):
+        self._idle.put(worker)
+
+    def _discard(self, worker):
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def _start(self, func, payload):
+        worker = self._acquire()
+        try:
+            worker.conn.send((func, payload))
+        except (OSError, BrokenPipeError):
+            # Worker morto mentre era libero: se ne usa uno nuovo
+            self._discard(worker)
+            worker = self._acquire()
+            worker.conn.send((func, payload))
+        return worker
+
+    def run(self, func, payload, timeout=None, grace=DEFAULT_GRACE):
+        """
+        Ritorna {"status": ok|timeout|error, "result": dict|None, "model": int32|None,
+                 "error": str|None, "time": secondi}.
+        """
+        worker = self._start(func, payload)
+        start = time.time()
+
+        if not worker.conn.poll(timeout):
+            worker.conn.send(_CANCEL)
+            if not worker.conn.poll(grace):
+                self._discard(worker)
+                return {"status": "timeout", "result": None, "model": None,
+                        "error": "Timeout expired", "time": time.time() - start}
+
+        return self._receive(worker, start)
+
+    def _receive(self, worker, start):
+        """Legge il risultato pronto sul worker e lo rimette tra i liberi (o lo scarta se è morto)."""
+        try:
+            header = worker.conn.recv()
+            model = None
+            if header["model_len"] is not None:
+                model = np.frombuffer(worker.conn.recv_bytes(), dtype=np.int32)
+        except (EOFError, OSError):
+            self._discard(worker)
+            return {"status": "error", "result": None, "model": None,
+                    "error": "Solver worker terminato inaspettatamente", "time": time.time() - start}
+        elapsed = time.time() - start
+        self._release(worker)
+
+        # Un job finito proprio mentre arrivava la cancellazione tiene il suo risultato
+        status = "timeout" if header["status"] == "cancelled" else header["status"]
+        return {"status": status, "result": header["result"], "model": model,
+                "error": "Timeout expired" if status == "timeout" else header["error"],
+                "time": elapsed}
+
+    def _cancel_all(self, running, grace):
+        # Cancellazione a tutti insieme, poi una sola finestra di grace condivisa
+        for worker in running:
+            try:
+                worker.conn.send(_CANCEL)
+            except (OSError, BrokenPipeError):
+                pass
+        deadline = time.time() + grace
+        for worker in running:
+            if worker.conn.poll(max(deadline - time.time(), 0)):
+                self._receive(worker, deadline)     # risultato scartato, il worker torna libero
+            else:
+                self._discard(worker)
+
+    def race(self, func, payloads, timeout=None, grace=DEFAULT_GRACE, accept=None, parallel=None,
+             on_result=None):
+        """
+        Esegue func sui payload in parallelo, al più parallel alla volta (default e massimo
+        max_workers), ciascuno su un worker diverso; i payload in coda partono man mano che
+        i worker si liberano. Vince il primo risultato accettato da accept(out) (default:
+        status ok): i job in corso vengono cancellati (worker uccisi se non rispondono entro
+        grace) e quelli in coda non partono più. timeout è il budget complessivo.
+        on_result(index, out) è chiamato per ogni job concluso, vincitore compreso.
+        Ritorna il dict di run() del vincitore con "index" (posizione del payload), oppure,
+        se nessuno è accettato, l'ultimo risultato ricevuto (o il timeout) con index None.
+        """
+        accept = accept or (lambda out: out["status"] == "ok")
+        parallel = max(min(parallel or self.max_workers, self.max_workers), 1)
+        start = time.time()
+        deadline = None if timeout is None else start + timeout
+        waiting = deque(enumerate(payloads))
+        running = {}    # worker -> (indice, istante di avvio)
+
+        last = {"status": "timeout", "result": None, "model": None,
+                "error": "Timeout expired", "time": None}
+        while waiting or running:
+            while waiting and len(running) < parallel:
+                k, payload = waiting.popleft()
+                running[self._start(func, payload)] = (k, time.time())
+            remaining = None if deadline is None else max(deadline - time.time(), 0)
+            ready = mp_connection.wait([w.conn for w in running], remaining)
+            if not ready:
+                break
+            for worker in [w for w in running if w.conn in ready]:
+                k, job_start = running.pop(worker)
+                out = self._receive(worker, job_start)
+                if on_result is not None:
+                    on_result(k, out)
+                if accept(out):
+                    self._cancel_all(list(running), grace)
+                    out["index"] = k
+                    return out
+                last = out
+        if running:
+            self._cancel_all(list(running), grace)
+            last = {"status": "timeout", "result": None, "model": None, "error": "Timeout expired"}
+        last["time"] = time.time() - start
+        last["index"] = None
+        return last
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+        self._idle = queue.LifoQueue()
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """Pool condiviso del processo, creato al primo uso e chiuso all'uscita."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = SolverPool()
+            atexit.register(_POOL.shutdown)
+        return _POOL
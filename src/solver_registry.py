@@ -0,0 +1,107 @@
+from array import array
+from collections import deque
+
+# Solver esterni noti. Ogni voce (anche in config.yaml, sezione "solvers", che le
+# estende o sovrascrive campo per campo):
+#   binary        eseguibile (percorso o nome nel PATH)
+#   args          argomenti fissi
+#   threads_args  argomenti per il numero di thread, con {threads} (assente: single thread)
+#   proof_args    argomenti per la prova DRAT, con {proof} (assente: prova non supportata)
+#   stdin_input   argomento che indica "leggi da stdin" (assente: nessun file = stdin)
+# Il comando è: binary args threads_args <input> proof_args
+DEFAULT_SOLVERS = {
+    "plingeling": {
+        "binary": "../../lingeling/plingeling",
+        "threads_args": ["-t", "{threads}"],
+    },
+    "lingeling": {
+        "binary": "lingeling",
+    },
+    "kissat": {
+        "binary": "kissat",
+        "stdin_input": "-",
+        "proof_args": ["{proof}", "--no-binary"],
+    },
+    "cadical": {
+        "binary": "cadical",
+        "stdin_input": "-",
+        "proof_args": ["{proof}", "--no-binary"],
+    },
+    "glucose-syrup": {
+        "binary": "glucose-syrup",
+        "args": ["-model"],
+        "threads_args": ["-nthreads={threads}"],
+        "proof_args": ["-certified", "-certified-output={proof}"],
+    },
+}
+
+DEFAULT_SOLVER = "plingeling"
+SOLVER_KEYS = ("binary", "args", "threads_args", "proof_args", "stdin_input")
+
+# Righe non "v" conservate per i messaggi di errore
+_TAIL_LINES = 50
+
+
+def resolve_solver(name=None, registry=None):
+    """
+    Voce del solver `name` (default plingeling): le impostazioni di config.yaml
+    (registry) completano o sostituiscono quelle predefinite.
+    """
+    name = name or DEFAULT_SOLVER
+    spec = dict(DEFAULT_SOLVERS.get(name, {}))
+    spec.update((registry or {}).get(name) or {})
+    unknown = set(spec) - set(SOLVER_KEYS)
+    if unknown:
+        raise ValueError(f"Solver {name}: campi sconosciuti {sorted(unknown)} (ammessi: {', '.join(SOLVER_KEYS)})")
+    if not spec.get("binary"):
+        known = sorted(set(DEFAULT_SOLVERS) | set(registry or {}))
+        raise ValueError(f"Solver esterno sconosciuto: {name} (definiti: {', '.join(known)})")
+    spec["name"] = name
+    return spec
+
+
+def build_command(spec, input_path=None, num_threads=None, proof_path=None):
+    """Riga di comando del solver; input_path None significa CNF su stdin."""
+    cmd = [spec["binary"]] + [str(a) for a in spec.get("args") or []]
+    if spec.get("threads_args") and num_threads:
+        cmd += [a.format(threads=num_threads) for a in spec["threads_args"]]
+    if input_path is not None:
+        cmd.append(input_path)
+    elif spec.get("stdin_input"):
+        cmd.append(spec["stdin_input"])
+    if proof_path is not None:
+        if not spec.get("proof_args"):
+            raise ValueError(f"Il solver {spec['name']} non supporta la prova (proof_args non definito)")
+        if input_path is None and not spec.get("stdin_input") and "{proof}" in spec["proof_args"][0]:
+            raise ValueError(f"Solver {spec['name']}: prova posizionale con CNF su stdin richiede stdin_input")
+        cmd += [a.format(proof=proof_path) for a in spec["proof_args"]]
+    return cmd
+
+
+class SolverOutput:
+    """
+    Parser incrementale dell'output in formato SAT competition, una riga alla volta:
+    niente buffer dell'intero stdout. Il modello (righe "v", anche molte migliaia)
+    è accumulato in un array di int32.
+    """
+
+    def __init__(self):
+        self.status = None      # True SAT, False UNSAT, None sconosciuto
+        self.model = array("i")
+        self.tail = deque(maxlen=_TAIL_LINES)
+
+    def feed(self, line):
+        if line.startswith("v "):
+            self.model.extend(int(x) for x in line[2:].split() if x != "0")
+            return
+        line = line.rstrip()
+        if line.startswith("s "):
+            answer = line[2:].strip()
+            if answer == "SATISFIABLE":
+                self.status = True
+            elif answer == "UNSATISFIABLE":
+                self.status = False
+        self.tail.append(line)
+
+    def text(self):
+        return "\n".join(self.tail)